@@ -0,0 +1,371 @@
+# End-to-end load test for the prediction servers.
+#
+# Starts one of the server variants on a local port (or targets a running
+# one with --url), drives it with synthetic patients at a fixed concurrency
+# and, optionally, a fixed request rate, and prints a JSON report with
+# latency percentiles, throughput and error rate.
+#
+#   python benchmarks/loadtest.py parkinson --concurrency 8 --duration 20
+#   python benchmarks/loadtest.py alzheimer --rate 200 --env SERVER_MODE=prefork
+#   python benchmarks/loadtest.py production --requests 2000 --output prod.json
+#   python benchmarks/loadtest.py alzheimer --url http://127.0.0.1:5000
+#
+# With --rate the load is open loop: request i is due at start + i/rate and
+# its latency is measured from that moment, so a stalled server shows up as
+# tail latency instead of silently lowering the offered load. Without --rate
+# every client sends its next request as soon as the previous one returns.
+#
+# Payloads are drawn from the ranges the fallback/manual risk functions cover.
+# Use --distinct N to cycle through N fixed patients (to measure the
+# prediction cache) instead of a fresh patient per request. Each client keeps
+# one connection open; --no-keepalive opens a new one per request.
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARKINSON_ROUTE = '/api/parkinson-prediction'
+ALZHEIMER_ROUTE = '/api/alzheimer-prediction'
+
+# name -> (script relative to backend/, how to start it, prediction route)
+#   'port_env'  the script reads PORT itself
+#   'run_server' call run_server(port) (the port is hard-coded otherwise)
+#   'flask'     call app.run() without the debug reloader
+SERVERS = {
+    'parkinson': ('parkinson_service/fixed_pure_parkinson_server.py', 'port_env', PARKINSON_ROUTE),
+    'alzheimer': ('alzheimer_service/enhanced_alzheimer_server.py', 'port_env', ALZHEIMER_ROUTE),
+    # Both models in one process (inference_server.py), loaded on one route
+    'unified-parkinson': ('inference_server.py', 'port_env', PARKINSON_ROUTE),
+    'unified-alzheimer': ('inference_server.py', 'port_env', ALZHEIMER_ROUTE),
+    'parkinson-legacy': ('fixed_pure_parkinson_server.py', 'port_env', PARKINSON_ROUTE),
+    'alzheimer-legacy': ('enhanced_alzheimer_server.py', 'port_env', ALZHEIMER_ROUTE),
+    'production': ('production_server.py', 'run_server', ALZHEIMER_ROUTE),
+    'pkl': ('pkl_model_server.py', 'run_server', ALZHEIMER_ROUTE),
+    'app': ('app.py', 'flask', ALZHEIMER_ROUTE),
+}
+
+HEALTH_ROUTE = '/api/health'
+
+# Runs a server script in this process without its __main__ block, then
+# starts it on the requested port
+LAUNCHER = '''
+import os, runpy, sys
+script, how, port = sys.argv[1], sys.argv[2], int(sys.argv[3])
+sys.path.insert(0, os.path.dirname(script))
+if how == 'port_env':
+    runpy.run_path(script, run_name='__main__')
+else:
+    module = runpy.run_path(script)
+    if how == 'run_server':
+        module['run_server'](port)
+    else:
+        module['app'].run(host='127.0.0.1', port=port, debug=False, threaded=True)
+'''
+
+
+def parkinson_payload(rng):
+    # Ranges of the manual risk (serving/heuristics.py): DaTscan binding ratios,
+    # UPDRS total (max 40), smell test (max 40) and cognitive score (max 30)
+    return {
+        'datScan': {
+            'caudateR': round(rng.uniform(0.5, 4.0), 3),
+            'caudateL': round(rng.uniform(0.5, 4.0), 3),
+            'putamenR': round(rng.uniform(0.2, 3.5), 3),
+            'putamenL': round(rng.uniform(0.2, 3.5), 3),
+        },
+        'updrs': {'npdtot': rng.randint(0, 40)},
+        'smellTest': {'upsitPercentage': rng.randint(0, 40)},
+        'cognitive': {'cogchq': rng.randint(0, 30)},
+    }
+
+
+def alzheimer_payload(rng):
+    # Ranges over which each EnhancedAlzheimerFallback factor moves
+    # between 0 and 100
+    return {
+        'hippocampus_volume': round(rng.uniform(1.6, 4.8), 3),
+        'cortical_thickness': round(rng.uniform(1.3, 3.8), 3),
+        'ventricle_volume': round(rng.uniform(12.0, 40.0), 2),
+        'white_matter_hyperintensities': round(rng.uniform(0.0, 6.7), 3),
+        'brain_glucose_metabolism': round(rng.uniform(3.7, 7.5), 3),
+        'amyloid_deposition': round(rng.uniform(0.0, 1.7), 3),
+        'tau_protein_level': round(rng.uniform(0.0, 2.0), 3),
+    }
+
+
+def payload_factory(route, distinct, seed):
+    generate = parkinson_payload if route.startswith(PARKINSON_ROUTE) else alzheimer_payload
+    rng = random.Random(seed)
+    if distinct:
+        pool = [json.dumps(generate(rng)).encode() for _ in range(distinct)]
+        return lambda i: pool[i % len(pool)]
+    lock = threading.Lock()
+
+    def fresh(i):
+        with lock:
+            return json.dumps(generate(rng)).encode()
+    return fresh
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(name, port, env_overrides, log_path):
+    script, how, _ = SERVERS[name]
+    env = dict(os.environ)
+    env.update(env_overrides)
+    env['PORT'] = str(port)
+    log = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-c', LAUNCHER, os.path.join(BACKEND_DIR, script), how, str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, log
+
+
+def wait_ready(host, port, process, timeout):
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', HEALTH_ROUTE)
+            if conn.getresponse().status == 200:
+                conn.close()
+                return time.monotonic() - started
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f'server not ready after {timeout}s')
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class LoadRun:
+    def __init__(self, host, port, route, payload, concurrency, rate, duration, requests, timeout, keepalive=True):
+        self.host = host
+        self.port = port
+        self.route = route
+        self.payload = payload
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.max_requests = requests
+        self.timeout = timeout
+        self.keepalive = keepalive
+
+        self._next = 0
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.errors = {}
+
+    def _claim(self):
+        # Next request number, or None once the run is over
+        with self._lock:
+            i = self._next
+            if self.max_requests and i >= self.max_requests:
+                return None
+            self._next += 1
+            return i
+
+    def _client(self, results, errors):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {'Content-Type': 'application/json'}
+        if not self.keepalive:
+            # A new connection (and handshake) for every request
+            headers['Connection'] = 'close'
+        while True:
+            i = self._claim()
+            if i is None:
+                break
+            if self.rate:
+                due = self.started + i / self.rate
+                if due >= self.deadline:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            elif time.perf_counter() >= self.deadline:
+                break
+            else:
+                due = time.perf_counter()
+
+            body = self.payload(i)
+            kind = None
+            try:
+                conn.request('POST', self.route, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                if response.status != 200:
+                    kind = f'http_{response.status}'
+                elif not json.loads(data).get('success', False):
+                    kind = 'unsuccessful'
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                kind = type(e).__name__
+                conn.close()
+            results.append(time.perf_counter() - due)
+            if kind is not None:
+                errors[kind] = errors.get(kind, 0) + 1
+        conn.close()
+
+    def run(self):
+        self.started = time.perf_counter()
+        self.deadline = self.started + self.duration if self.duration else float('inf')
+        per_client = [([], {}) for _ in range(self.concurrency)]
+        threads = [threading.Thread(target=self._client, args=state, daemon=True) for state in per_client]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+        for results, errors in per_client:
+            self.latencies.extend(results)
+            for kind, count in errors.items():
+                self.errors[kind] = self.errors.get(kind, 0) + count
+
+    def report(self):
+        latencies = sorted(ms * 1000 for ms in self.latencies)
+        total = len(latencies)
+        failed = sum(self.errors.values())
+        return {
+            'requests': total,
+            'errors': failed,
+            'error_rate': failed / total if total else 0.0,
+            'error_kinds': self.errors,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'throughput_rps': round(total / self.elapsed, 2) if self.elapsed else 0.0,
+            'latency_ms': {
+                'mean': round(sum(latencies) / total, 3) if total else None,
+                'p50': round(percentile(latencies, 50), 3) if total else None,
+                'p95': round(percentile(latencies, 95), 3) if total else None,
+                'p99': round(percentile(latencies, 99), 3) if total else None,
+                'max': round(latencies[-1], 3) if total else None,
+            },
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_env(items):
+    env = {}
+    for item in items:
+        key, _, value = item.partition('=')
+        env[key] = value
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a prediction server')
+    parser.add_argument('server', choices=sorted(SERVERS), help='server variant to start (or to target with --url)')
+    parser.add_argument('--url', help='use an already running server instead of starting one')
+    parser.add_argument('--route', help='override the prediction route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=0, help='target requests per second (0 = closed loop)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of measured load')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of unmeasured load first')
+    parser.add_argument('--distinct', type=int, default=0, help='cycle through N fixed payloads')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=10, help='per-request timeout in seconds')
+    parser.add_argument('--no-keepalive', dest='keepalive', action='store_false',
+                        help='open a new connection for every request')
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the started server, e.g. SERVER_MODE=prefork')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    _, _, route = SERVERS[args.server]
+    route = args.route or route
+    process = log = None
+    log_path = None
+
+    try:
+        if args.url:
+            parts = urlsplit(args.url)
+            host, port = parts.hostname, parts.port or 80
+            startup = wait_ready(host, port, None, args.startup_timeout)
+        else:
+            host, port = '127.0.0.1', free_port()
+            log_path = os.path.join(tempfile.gettempdir(), f'loadtest-{args.server}-{port}.log')
+            process, log = start_server(args.server, port, parse_env(args.env), log_path)
+            try:
+                startup = wait_ready(host, port, process, args.startup_timeout)
+            except RuntimeError as e:
+                log.flush()
+                with open(log_path) as f:
+                    tail = f.readlines()[-20:]
+                sys.exit(f'{args.server}: {e}\n' + ''.join(tail))
+
+        if args.warmup:
+            LoadRun(host, port, route, payload_factory(route, args.distinct, args.seed + 1),
+                    args.concurrency, args.rate, args.warmup, 0, args.timeout, args.keepalive).run()
+
+        load = LoadRun(host, port, route, payload_factory(route, args.distinct, args.seed),
+                       args.concurrency, args.rate, args.duration if not args.requests else 0,
+                       args.requests, args.timeout, args.keepalive)
+        load.run()
+
+        report = {
+            'server': args.server,
+            'route': route,
+            'commit': git_commit(),
+            'timestamp': round(time.time(), 3),
+            'config': {
+                'concurrency': args.concurrency,
+                'rate': args.rate,
+                'duration': args.duration,
+                'requests': args.requests,
+                'warmup': args.warmup,
+                'distinct': args.distinct,
+                'keepalive': args.keepalive,
+                'env': parse_env(args.env),
+            },
+            'startup_seconds': round(startup, 3),
+            'server_log': log_path,
+        }
+        report.update(load.report())
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if log is not None:
+            log.close()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
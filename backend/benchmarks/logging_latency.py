@@ -0,0 +1,131 @@
+# Compare handler latency with synchronous print() logging against the async
+# EventLogger, with stdout replaced by a sink that is slow to write (like a
+# container log driver under pressure).
+#
+#   python benchmarks/logging_latency.py [--requests 2000] [--write-delay-ms 0.2]
+#
+# Prints a JSON summary with per-request handler latency for each mode.
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serving.eventlog import EventLogger, Timings
+from serving.parkinson import blend_risk, extract_features, manual_risk
+
+PAYLOAD = {
+    'datScan': {'caudateR': 2.1, 'caudateL': 2.3, 'putamenR': 1.4, 'putamenL': 1.2},
+    'updrs': {'npdtot': 18},
+    'smellTest': {'upsitPercentage': 24},
+    'cognitive': {'cogchq': 9},
+}
+
+
+class SlowStream:
+    # Every write() costs a fixed delay, regardless of size
+    def __init__(self, delay):
+        self.delay = delay
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            time.sleep(self.delay)
+            self.writes += 1
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def handle_with_print(stream):
+    # What the handlers used to do: several print()s per request
+    data = json.loads(json.dumps(PAYLOAD))
+    print("Received data:", data, file=stream)
+    features = np.array([extract_features(data)])
+    print("Extracted features:", features.tolist(), file=stream)
+    manual = manual_risk(features)
+    print(f"Manual risk: {manual[0]}", file=stream)
+    risk = blend_risk(manual, None, False)
+    print(f"Prediction: {risk[0]}%", file=stream)
+    return json.dumps({'riskPercentage': float(risk[0])})
+
+
+def handle_with_eventlog(log):
+    timings = Timings()
+    data = json.loads(json.dumps(PAYLOAD))
+    timings.mark('parse')
+    log.debug('received', payload=data)
+    features = np.array([extract_features(data)])
+    timings.mark('extract')
+    manual = manual_risk(features)
+    risk = blend_risk(manual, None, False)
+    timings.mark('score')
+    body = json.dumps({'riskPercentage': float(risk[0])})
+    log.request('/api/parkinson-prediction', 'ok', timings, risk=float(risk[0]))
+    return body
+
+
+def summarize(latencies):
+    ms = np.array(latencies) * 1000
+    return {
+        'requests': len(ms),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+    }
+
+
+def run(handle, requests):
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        handle()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--write-delay-ms', type=float, default=0.2)
+    parser.add_argument('--sample-rate', type=float, default=1.0,
+                        help='share of successful requests the async logger keeps')
+    args = parser.parse_args()
+    delay = args.write_delay_ms / 1000
+
+    print_stream = SlowStream(delay)
+    print_latencies = run(lambda: handle_with_print(print_stream), args.requests)
+
+    async_stream = SlowStream(delay)
+    log = EventLogger('benchmark', level='info', stream=async_stream,
+                      sample_rates={'/api/parkinson-prediction': args.sample_rate})
+    started = time.perf_counter()
+    async_latencies = run(lambda: handle_with_eventlog(log), args.requests)
+    log.flush(timeout=60)
+    drained = time.perf_counter() - started
+
+    sync = summarize(print_latencies)
+    asynchronous = summarize(async_latencies)
+    asynchronous['sink_writes'] = async_stream.writes
+    asynchronous['dropped'] = log.dropped
+    asynchronous['seconds_until_drained'] = round(drained, 3)
+    sync['sink_writes'] = print_stream.writes
+
+    print(json.dumps({
+        'write_delay_ms': args.write_delay_ms,
+        'sync_print': sync,
+        'async_eventlog': asynchronous,
+        'mean_speedup': round(sync['mean_ms'] / asynchronous['mean_ms'], 1) if asynchronous['mean_ms'] else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,60 +1,15 @@
 import http.server
 import socketserver
 import json
-import numpy as np
-import os
-from urllib.parse import parse_qs
 
-# Simple prediction function that guarantees varying results
+from serving.heuristics import DatScanParkinsonHeuristic
+
+# Simple prediction function that guarantees varying results (vectorized in
+# serving/heuristics.py)
+risk_model = DatScanParkinsonHeuristic()
+
 def predict_risk(features):
-    print("Using simplified model for prediction")
-    # Extract individual features
-    caudate_r = float(features[0])
-    caudate_l = float(features[1])
-    putamen_r = float(features[2])
-    putamen_l = float(features[3])
-    updrs_score = float(features[4])
-    smell_score = float(features[5])
-    cognitive_score = float(features[6])
-    
-    print(f"Input features: caudate_r={caudate_r}, caudate_l={caudate_l}, putamen_r={putamen_r}, putamen_l={putamen_l}")
-    print(f"updrs_score={updrs_score}, smell_score={smell_score}, cognitive_score={cognitive_score}")
-    
-    # DAT scan values - lower values indicate higher risk
-    # Normal ranges: caudate ~3.5-4.0, putamen ~2.5-3.0
-    caudate_r_score = max(0, min(100, (4.0 - caudate_r) * 25))  # 0-100 scale
-    caudate_l_score = max(0, min(100, (4.0 - caudate_l) * 25))  # 0-100 scale
-    putamen_r_score = max(0, min(100, (3.0 - putamen_r) * 33))  # 0-100 scale
-    putamen_l_score = max(0, min(100, (3.0 - putamen_l) * 33))  # 0-100 scale
-    
-    # Clinical scores
-    # UPDRS: higher is worse (0-40 typical range)
-    updrs_score = max(0, min(100, updrs_score * 2.5))  # 0-100 scale
-    
-    # Smell test: lower is worse (0-40 typical range)
-    smell_score = max(0, min(100, (40 - smell_score) * 2.5))  # 0-100 scale
-    
-    # Cognitive: higher is worse (0-30 typical range)
-    cognitive_score = max(0, min(100, cognitive_score * 3.33))  # 0-100 scale
-    
-    # Calculate weighted average (weights should sum to 1)
-    weighted_score = (
-        caudate_r_score * 0.15 +
-        caudate_l_score * 0.15 +
-        putamen_r_score * 0.15 +
-        putamen_l_score * 0.15 +
-        updrs_score * 0.15 +
-        smell_score * 0.15 +
-        cognitive_score * 0.10
-    )
-    
-    print(f"Component scores: caudate_r={caudate_r_score}, caudate_l={caudate_l_score}")
-    print(f"putamen_r={putamen_r_score}, putamen_l={putamen_l_score}")
-    print(f"updrs={updrs_score}, smell={smell_score}, cognitive={cognitive_score}")
-    print(f"Final weighted score: {weighted_score}")
-    
-    # Return the weighted score directly (already 0-100)
-    return weighted_score
+    return risk_model.predict_one(features)
 
 class ParkinsonHandler(http.server.BaseHTTPRequestHandler):
     def _set_headers(self, content_type="application/json"):
@@ -0,0 +1,79 @@
+# One server process hosting every prediction model.
+#
+# Each service module (parkinson_service/, alzheimer_service/) registers its
+# model in the shared model registry when it is imported (see
+# serving/registry.py), so this script only imports the ones wanted and
+# serves them all with the shared handler (serving/server.py):
+#   POST /api/parkinson-prediction[/batch|/stream]
+#   POST /api/alzheimer-prediction[/stream]
+#   GET  /api/health, /api/live, /api/ready[?model=<name>], /metrics
+#   POST /api/admin/reload
+# The routes are the same as the standalone services', so clients only need
+# the new host. One copy of numpy/scikit-learn/xgboost is loaded, the models
+# share the handler threads (or prefork workers), prediction cache,
+# single-flight, admission control and /metrics, and each keeps its own
+# micro-batcher, hot reload, canary and circuit breaker.
+#
+# MODELS picks the models, comma separated (default: all of them);
+# PORT the port (default 5001); SERVER_MODE / SERVER_WORKERS /
+# SERVER_THREADS the concurrency mode as for the standalone services.
+import importlib
+import os
+import sys
+import traceback
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from serving.registry import REGISTRY
+from serving.server import PredictionHandler
+from serving.workers import serve
+
+# Model name -> the service module that registers it
+MODEL_MODULES = {
+    'parkinson': 'parkinson_service.fixed_pure_parkinson_server',
+    'alzheimer': 'alzheimer_service.enhanced_alzheimer_server',
+}
+
+
+def selected_models():
+    names = [name.strip().lower() for name in os.environ.get('MODELS', '').split(',') if name.strip()]
+    if not names:
+        return list(MODEL_MODULES)
+    unknown = [name for name in names if name not in MODEL_MODULES]
+    if unknown:
+        raise ValueError(f"Unknown MODELS {', '.join(unknown)}; choose from {', '.join(MODEL_MODULES)}")
+    return names
+
+
+def load_models(names):
+    # Importing a service loads its model (or, with FAST_START=1, schedules
+    # the load) and registers it
+    for name in names:
+        print(f"Loading the {name} model...")
+        importlib.import_module(MODEL_MODULES[name])
+    return REGISTRY
+
+
+def run_server(port=None):
+    if port is None:
+        port = int(os.environ.get('PORT', 5001))
+
+    registry = load_models(selected_models())
+
+    # For deployment, bind to all interfaces (0.0.0.0) instead of just localhost
+    host = '0.0.0.0'
+
+    try:
+        print(f"Serving {', '.join(model.name for model in registry)} at http://{host}:{port}/")
+        for model in registry:
+            print(f"  {model.name}: {', '.join(model.routes)}")
+        serve(PredictionHandler, host, port)
+    except Exception as e:
+        print(f"Error starting server: {str(e)}")
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    run_server()
@@ -1,45 +1,81 @@
-import http.server
-import socketserver
-import json
 import pickle
 import numpy as np
 import os
 import sys
-from urllib.parse import parse_qs
+import time
 import traceback
 
-# Paths to the model and scalers
-# First, try to find the model in the same directory as the script
+# Shared serving helpers live in backend/serving, one level up from this service
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from serving.adapters import adapt_model
+from serving.batching import MicroBatcher, batching_enabled
+from serving.binary import MatrixFormat
+from serving.breaker import CircuitBreaker
+from serving.bundle import find_bundle, load_bundle, load_current_bundle
+from serving.eventlog import get_logger
+from serving.limits import check_deadline
+from serving.health import Canary, readiness
+from serving.metrics import PredictionMetrics
+from serving.cache import artifact_version, score_with_cache
+from serving.parkinson import NESTED_FEATURES, NUM_FEATURES, SCHEMA, blend_risk, extract_batch, manual_risk
+from serving.registry import REGISTRY, HostedModel, metrics_registry, shared_cache, shared_flights
+from serving.reload import LoadedModel, ModelReloader, install_reload_signal
+from serving.risk import risk_levels
+from serving.schema import invalid_record
+from serving.server import PredictionHandler
+from serving.startup import StartupReport, fast_start_enabled, model_wait_seconds
+from serving.treecompile import compiled_path_for, load_compiled_model
+from serving.workers import on_serve, serve
+
+# Request logging is structured, asynchronous and sampled (LOG_LEVEL,
+# LOG_SAMPLE_RATES, LOG_FILE); startup messages still go straight to stdout
+log = get_logger('parkinson')
+
+# FAST_START=1 binds the port first and loads the model in the background
+# (see serving/startup.py); either way the startup stages are timed and logged
+FAST_START = fast_start_enabled()
+MODEL_WAIT_SECONDS = model_wait_seconds()
+startup = StartupReport('parkinson', FAST_START, log)
+startup.imported()
+
+# Prometheus metrics served at /metrics: per-stage latency histograms,
+# request/result/fallback/error counters and in-flight gauges, labelled
+# service="parkinson" in the process-wide registry (serving/registry.py)
+PREDICTION_ROUTE = '/api/parkinson-prediction'
+BATCH_ROUTE = '/api/parkinson-prediction/batch'
+STREAM_ROUTE = '/api/parkinson-prediction/stream'
+metrics = PredictionMetrics('parkinson', routes=(PREDICTION_ROUTE, BATCH_ROUTE, STREAM_ROUTE),
+                            fallback_labels=('fixed_pure_pkl_fallback', 'fixed_pure_pkl_failed',
+                                             'fixed_pure_pkl_degraded', 'fixed_pure_pkl_circuit_open'),
+                            registry=metrics_registry())
+
+# Clients holding feature matrices can send them as raw float32/float64
+# (Content-Type: application/x-feature-matrix, see serving/binary.py); the
+# columns are the nested format's fields in model feature order
+matrix_format = MatrixFormat(f'{section}.{field}' for section, field in NESTED_FEATURES)
+
+# The model lives in model/ next to this script, locally, in Docker and on
+# Render alike
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(CURRENT_DIR, 'model')
 
-# Check for models in various possible locations
-possible_model_paths = [
-    # Same directory as the script
-    os.path.join(CURRENT_DIR, 'model', 'Parkinson_Model.pkl'),
-    # Docker path
-    '/app/model/Parkinson_Model.pkl',
-    # Render path
-    os.path.join(CURRENT_DIR, 'model', 'Parkinson_Model.pkl'),
-    # Original path
-    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'model', 'Parkinson_Model.pkl')
+# A model bundle (serving/bundle.py) holds the model, both scalers and the
+# feature schema in one checksummed file, and is what gets served when it
+# exists; MODEL_BUNDLE points at another one. The separate pickles are only
+# read without a bundle, or on a reload after one of them changed and made
+# the bundle stale.
+BUNDLE_CANDIDATES = [
+    os.environ.get('MODEL_BUNDLE'),
+    os.path.join(MODEL_DIR, 'parkinson.bundle'),
 ]
+BUNDLE_PATH = find_bundle(BUNDLE_CANDIDATES)
 
-# Find the first path that exists
-for path in possible_model_paths:
-    if os.path.exists(path):
-        MODEL_PATH = path
-        # Use the same directory for the scalers
-        model_dir = os.path.dirname(path)
-        SCALER_PATH = os.path.join(model_dir, 'scaler.pkl')
-        SCALER_Y_PATH = os.path.join(model_dir, 'scaler_y.pkl')
-        print(f"Found model at: {MODEL_PATH}")
-        break
-else:
-    # If no path exists, use a default path
-    print("No model found in any of the expected locations")
-    MODEL_PATH = os.path.join(CURRENT_DIR, 'model', 'Parkinson_Model.pkl')
-    SCALER_PATH = os.path.join(CURRENT_DIR, 'model', 'scaler.pkl')
-    SCALER_Y_PATH = os.path.join(CURRENT_DIR, 'model', 'scaler_y.pkl')
+MODEL_PATH = os.path.join(MODEL_DIR, 'Parkinson_Model.pkl')
+SCALER_PATH = os.path.join(MODEL_DIR, 'scaler.pkl')
+SCALER_Y_PATH = os.path.join(MODEL_DIR, 'scaler_y.pkl')
 
 # Enable more verbose output
 print(f"Python version: {sys.version}")
@@ -47,247 +83,333 @@ print(f"Current working directory: {os.getcwd()}")
 print(f"Model path: {MODEL_PATH}")
 print(f"Scaler path: {SCALER_PATH}")
 print(f"Scaler Y path: {SCALER_Y_PATH}")
+print(f"Model bundle: {BUNDLE_PATH}")
 
-# Define global variables for model and scalers
-model = None
-scaler = None
-scaler_y = None
-MODEL_LOADED = False
-
-# Load the model and scalers
-print(f"Loading model from {MODEL_PATH}...")
-try:
-    with open(MODEL_PATH, 'rb') as f:
-        model = pickle.load(f)
-    print("Model loaded successfully!")
-    print(f"Model type: {type(model)}")
-    
-    with open(SCALER_PATH, 'rb') as f:
-        scaler = pickle.load(f)
-    print("Feature scaler loaded successfully!")
-    print(f"Scaler type: {type(scaler)}")
+# Every file that feeds a prediction; a change to any of them changes the
+# model version, invalidates cached predictions and triggers a hot reload
+PICKLE_ARTIFACTS = [MODEL_PATH, compiled_path_for(MODEL_PATH), SCALER_PATH, SCALER_Y_PATH]
+MODEL_ARTIFACTS = [path for path in BUNDLE_CANDIDATES if path] + PICKLE_ARTIFACTS
+
+# Sample patient scored by every model version before it serves
+test_features = np.array([[3.0, 3.0, 2.5, 2.5, 10, 20, 15]]) # Sample values
+
+def load_model(check_sources=False):
+    # Load one complete model version (bundle, or model and scalers from
+    # their pickles); raises if anything is missing or broken. Reloads pass
+    # check_sources so a bundle older than the pickles is passed over
+    started = time.perf_counter()
+    bundle_path = find_bundle(BUNDLE_CANDIDATES)
+    bundle = None
+    if bundle_path is not None:
+        print(f"Loading model bundle from {bundle_path}...")
+        if check_sources:
+            # None when the pickles have been replaced since the bundle was built
+            bundle = load_current_bundle(bundle_path, [MODEL_PATH, SCALER_PATH, SCALER_Y_PATH],
+                                         num_features=NUM_FEATURES)
+        else:
+            bundle = load_bundle(bundle_path, num_features=NUM_FEATURES)
+    if bundle is not None:
+        model, scaler, scaler_y = bundle.model, bundle.scaler, bundle.scaler_y
+        version = bundle.version
+        print(f"Model bundle {bundle.version} loaded and verified in {bundle.load_ms:.1f} ms")
+        print(f"Model type: {type(model)}")
+    else:
+        print(f"Loading model from {MODEL_PATH}...")
+        # Prefer the compiled tree arrays (see serving/treecompile.py) so the
+        # server never has to import xgboost; set USE_COMPILED_MODEL=0 to serve
+        # the pickle directly
+        model = None
+        if os.environ.get('USE_COMPILED_MODEL', '1') != '0':
+            model = load_compiled_model(MODEL_PATH)
+        if model is not None:
+            print("Compiled model loaded successfully!")
+        else:
+            with open(MODEL_PATH, 'rb') as f:
+                model = pickle.load(f)
+            print("Model loaded successfully!")
+        print(f"Model type: {type(model)}")
+        
+        with open(SCALER_PATH, 'rb') as f:
+            scaler = pickle.load(f)
+        print("Feature scaler loaded successfully!")
+        print(f"Scaler type: {type(scaler)}")
+        
+        with open(SCALER_Y_PATH, 'rb') as f:
+            scaler_y = pickle.load(f)
+        print("Target scaler loaded successfully!")
+        print(f"Scaler Y type: {type(scaler_y)}")
+        
+        version = artifact_version(PICKLE_ARTIFACTS)
     
-    with open(SCALER_Y_PATH, 'rb') as f:
-        scaler_y = pickle.load(f)
-    print("Target scaler loaded successfully!")
-    print(f"Scaler Y type: {type(scaler_y)}")
+    # Work out once how to score this model (probabilities or regression
+    # output mapped back through scaler_y) instead of on every request
+    adapter = adapt_model(model, NUM_FEATURES, scaler_y)
+    print(f"Scoring with {adapter}")
+    print(f"Model version: {version}")
     
-    MODEL_LOADED = True
-except Exception as e:
-    print(f"Error loading model or scalers: {str(e)}")
-    traceback.print_exc()
-    print("Will continue without the model and use fallback prediction instead")
-    # We'll continue without the model and use a fallback prediction method
-
-# Create a simple test to verify model works
-test_features = np.array([[3.0, 3.0, 2.5, 2.5, 10, 20, 15]]) # Sample values
-print("\nTesting model with sample data...")
-print(f"Sample input: {test_features}")
+    return LoadedModel(version, adapter, model=model, scaler=scaler, scaler_y=scaler_y, bundle=bundle,
+                       load_ms=(time.perf_counter() - started) * 1000)
+
+def reload_model():
+    return load_model(check_sources=True)
 
-if MODEL_LOADED and scaler is not None and model is not None:
+def warm_up(state):
+    # Score the sample patient through the scaler and model; raises if the
+    # result is unusable so a broken version is never swapped in
+    scaled_test = state.scaler.transform(test_features)
+    pred = state.adapter.score(scaled_test)[0]
+    if not np.isfinite(pred):
+        raise ValueError(f"Test prediction is not finite: {pred}")
+    return scaled_test, pred
+
+if FAST_START:
+    # The reloader's watcher thread loads and warms the model once the server
+    # is listening; until then predictions wait for it (MODEL_WAIT_SECONDS)
+    print("Fast start: the model will be loaded in the background")
+    initial_model = LoadedModel("fallback")
+else:
+    # Load the model and scalers
+    load_started = time.perf_counter()
     try:
-        # Scale the test features
-        scaled_test = scaler.transform(test_features)
-        print(f"Scaled test features: {scaled_test}")
-        
-        # Try prediction
-        try:
-            # First try predict_proba (for classifiers)
-            pred = model.predict_proba(scaled_test)[0][1]
-            print(f"Test prediction (predict_proba): {pred}")
-        except (AttributeError, IndexError) as e:
-            print(f"predict_proba failed: {str(e)}, using predict instead")
-            # Fall back to predict
-            pred = model.predict(scaled_test)[0]
-            print(f"Test prediction (predict): {pred}")
+        initial_model = load_model()
     except Exception as e:
-        print(f"Error during test prediction: {str(e)}")
+        print(f"Error loading model or scalers: {str(e)}")
         traceback.print_exc()
-else:
-    print("Skipping test prediction because model or scaler is not loaded")
-
-class ParkinsonHandler(http.server.BaseHTTPRequestHandler):
-    def _set_headers(self, content_type="application/json"):
-        self.send_response(200)
-        self.send_header('Content-type', content_type)
-        self.send_header('Access-Control-Allow-Origin', '*')  # CORS
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+        print("Will continue without the model and use fallback prediction instead")
+        # We'll continue without the model and use a fallback prediction method
+        initial_model = LoadedModel("fallback")
+    warm_up_started = time.perf_counter()
     
-    def do_OPTIONS(self):
-        self._set_headers()
-        self.wfile.write(b'{}')
+    # Create a simple test to verify model works
+    print("\nTesting model with sample data...")
+    print(f"Sample input: {test_features}")
     
-    def do_GET(self):
-        if self.path == '/api/health':
-            self._set_headers()
-            response = {
-                'status': 'healthy',
-                'message': 'Fixed Pure PKL Parkinson\'s prediction service is running'
-            }
-            self.wfile.write(json.dumps(response).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
-            self.wfile.write(b'Not Found')
+    if initial_model.loaded:
+        try:
+            scaled_test, pred = warm_up(initial_model)
+            print(f"Scaled test features: {scaled_test}")
+            print(f"Test prediction ({initial_model.adapter.method}): {pred}")
+        except Exception as e:
+            print(f"Error during test prediction: {str(e)}")
+            traceback.print_exc()
+    else:
+        print("Skipping test prediction because model or scaler is not loaded")
+    startup.ready(initial_model.loaded, (warm_up_started - load_started) * 1000,
+                  (time.perf_counter() - warm_up_started) * 1000)
+
+def predict_raw(features_array, state):
+    # Scale all rows and run the model once; returns (predictions, method)
+    # where predictions is None when the model could not be used
+    if not state.loaded:
+        return None, "fallback"
+    if not breaker.allow():
+        # The model has been failing; don't pay for another attempt
+        return None, "circuit_open"
     
-    def do_POST(self):
-        if self.path == '/api/parkinson-prediction':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            
-            try:
-                # Parse JSON data
-                data = json.loads(post_data.decode('utf-8'))
-                print("\n" + "="*50)
-                print("Received data:", data)
-                
-                # Extract features from the data
-                try:
-                    # Try complex format first (nested structure)
-                    features = [
-                        float(data['datScan']['caudateR']),
-                        float(data['datScan']['caudateL']),
-                        float(data['datScan']['putamenR']),
-                        float(data['datScan']['putamenL']),
-                        float(data['updrs']['npdtot']),
-                        float(data['smellTest']['upsitPercentage']),
-                        float(data['cognitive']['cogchq'])
-                    ]
-                except (KeyError, TypeError):
-                    # Try simple format (direct features)
-                    try:
-                        features = [
-                            float(data.get('fo', 0)),
-                            float(data.get('fhi', 0)),
-                            float(data.get('flo', 0)),
-                            float(data.get('jitter', 0)),
-                            float(data.get('shimmer', 0)),
-                            float(data.get('nhr', 0)),
-                            float(data.get('hnr', 0))
-                        ]
-                    except (KeyError, TypeError) as e:
-                        print(f"Error extracting features: {str(e)}")
-                        self._set_headers()
-                        response = {
-                            'error': 'Invalid data format',
-                            'success': False,
-                            'message': 'Could not extract features from the provided data'
-                        }
-                        self.wfile.write(json.dumps(response).encode())
-                        return
-                
-                print(f"Raw input features: {features}")
-                
-                # Convert to numpy array for the model
-                features_array = np.array(features).reshape(1, -1)
-                
-                # Check if model and scaler are available
-                if MODEL_LOADED and model is not None and scaler is not None:
-                    try:
-                        # Scale the features
-                        scaled_features = scaler.transform(features_array)
-                        print(f"Scaled features: {scaled_features.flatten().tolist()}")
-                        
-                        # Make prediction using the model
-                        try:
-                            # First try predict_proba (for classifiers)
-                            raw_prediction = model.predict_proba(scaled_features)[0][1]
-                            method = "predict_proba"
-                        except (AttributeError, IndexError) as e:
-                            print(f"predict_proba failed: {str(e)}, using predict instead")
-                            # Fall back to predict
-                            raw_prediction = model.predict(scaled_features)[0]
-                            
-                            # If needed, inverse transform
-                            if hasattr(scaler_y, 'inverse_transform') and hasattr(raw_prediction, 'ndim') and raw_prediction.ndim > 0:
-                                try:
-                                    raw_prediction = scaler_y.inverse_transform(raw_prediction.reshape(-1, 1)).flatten()[0]
-                                except Exception as e:
-                                    print(f"Error in inverse transform: {str(e)}")
-                            
-                            method = "predict"
-                    except Exception as e:
-                        print(f"Error during prediction: {str(e)}")
-                        raw_prediction = None
-                        method = "failed"
-                else:
-                    print("Model or scaler not loaded, using fallback prediction")
-                    raw_prediction = None
-                    method = "fallback"
-                
-                print(f"Raw prediction ({method}): {raw_prediction}")
-                
-                # Manual calculation for risk percentage based on input features
-                # This ensures different inputs give different results
-                dat_scan_avg = (features[0] + features[1] + features[2] + features[3]) / 4
-                updrs_factor = features[4] / 40  # Normalize UPDRS to 0-1 range (assuming max is 40)
-                smell_factor = 1 - (features[5] / 40)  # Invert smell test (higher is better)
-                cognitive_factor = features[6] / 30  # Normalize cognitive (assuming max is 30)
-                
-                # Calculate risk based on these factors
-                # Lower DAT scan values indicate higher risk
-                dat_scan_risk = max(0, min(100, (4.0 - dat_scan_avg) * 40))
-                updrs_risk = updrs_factor * 100
-                smell_risk = smell_factor * 100
-                cognitive_risk = cognitive_factor * 100
-                
-                # Weighted average of all risk factors
-                manual_risk = (dat_scan_risk * 0.4) + (updrs_risk * 0.3) + (smell_risk * 0.2) + (cognitive_risk * 0.1)
-                print(f"Manual risk calculation: {manual_risk}%")
-                
-                # Blend model prediction with manual calculation
-                # If model prediction is valid (between 0-1), use it as a probability
-                if isinstance(raw_prediction, (int, float)) and 0 <= raw_prediction <= 1:
-                    model_risk = raw_prediction * 100
-                    # Blend 70% model, 30% manual
-                    risk_percentage = (model_risk * 0.7) + (manual_risk * 0.3)
-                else:
-                    # If model prediction is not usable, rely more on manual calculation
-                    risk_percentage = manual_risk
-                
-                # Ensure risk is between 0 and 100
-                risk_percentage = max(0, min(100, risk_percentage))
-                
-                print(f"Final risk percentage: {risk_percentage}%")
-                
-                # Determine risk level based on the risk percentage
-                risk_level = 'Low'
-                risk_color = '#4CAF50'
-                
-                if risk_percentage > 60:
-                    risk_level = 'High'
-                    risk_color = '#F44336'
-                elif risk_percentage > 30:
-                    risk_level = 'Moderate'
-                    risk_color = '#FF9800'
-                
-                # Return prediction result
-                self._set_headers()
-                response = {
-                    'riskPercentage': float(risk_percentage),
-                    'riskLevel': risk_level,
-                    'riskColor': risk_color,
-                    'confidence': 0.95,
-                    'success': True,
-                    'model_used': f"fixed_pure_pkl_{method}"
-                }
-                self.wfile.write(json.dumps(response).encode())
-            
-            except Exception as e:
-                print("Error:", str(e))
-                traceback.print_exc()
-                self._set_headers()
-                response = {
-                    'error': str(e),
-                    'success': False
-                }
-                self.wfile.write(json.dumps(response).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
-            self.wfile.write(b'Not Found')
+    try:
+        started = time.perf_counter()
+        scaled = state.scaler.transform(features_array)
+        scaled_at = time.perf_counter()
+        predictions = state.adapter.score(scaled)
+        metrics.observe_stage('scale', scaled_at - started)
+        metrics.observe_stage('inference', time.perf_counter() - scaled_at)
+        breaker.record_success()
+        return predictions, state.adapter.method
+    except Exception as e:
+        log.error('prediction_failed', error=str(e))
+        breaker.record_failure(e)
+        return None, "failed"
+
+def score_risk(features_array, degraded=False):
+    # Scoring for an (n, 7) feature matrix: one scaler and model call, then
+    # the manual blend for every row; returns (risk, model_used, confidence).
+    # The model version is read once, so a hot reload never splits a batch.
+    # Degraded (shedding load) skips the scaler and model: manual risk only.
+    if degraded:
+        raw_predictions, method = None, "degraded"
+    else:
+        raw_predictions, method = predict_raw(features_array, reloader.current)
+    started = time.perf_counter()
+    risk = blend_risk(manual_risk(features_array), raw_predictions, method == 'predict_proba')
+    metrics.observe_stage('blend', time.perf_counter() - started)
+    return risk, f"fixed_pure_pkl_{method}", 0.95
+
+def score_matrix(features_array, degraded=False):
+    # Full prediction pipeline: one response dict per row
+    risk, model_used, confidence = score_risk(features_array, degraded)
+    levels, colors = risk_levels(risk)
+    
+    return [{
+        'riskPercentage': float(risk[row]),
+        'riskLevel': str(levels[row]),
+        'riskColor': str(colors[row]),
+        'confidence': confidence,
+        'success': True,
+        'model_used': model_used
+    } for row in range(len(risk))]
+
+# Concurrent single-patient requests are coalesced into one model call
+# (BATCHING=0 turns this off, BATCH_MAX_SIZE / BATCH_MAX_WAIT_MS tune it)
+batcher = MicroBatcher(score_matrix, name='parkinson-batcher') if batching_enabled() else None
+
+# Repeated identical payloads are answered from an LRU/TTL cache
+# (PREDICTION_CACHE_SIZE / PREDICTION_CACHE_TTL / PREDICTION_CACHE_DECIMALS),
+# shared with every other model this process hosts; keys start with
+# cache_version()
+cache = shared_cache(MODEL_ARTIFACTS)
+
+def canary_probe():
+    # The warm-up prediction against whatever version is serving right now
+    state = reloader.current
+    if not state.loaded:
+        raise RuntimeError("Model is not loaded")
+    _, pred = warm_up(state)
+    return {'model_version': state.version, 'prediction': float(pred)}
+
+# Readiness is decided from a cached canary prediction run in the background
+# (CANARY_INTERVAL, see serving/health.py), never on the probe's thread
+canary = Canary('parkinson', canary_probe, log=log)
+
+# After BREAKER_FAILURES consecutive inference errors requests go straight to
+# the fallback until a background probe succeeds (BREAKER_COOLDOWN, see
+# serving/breaker.py)
+breaker = CircuitBreaker('parkinson', canary_probe, log=log)
+
+def on_model_swap(previous, current):
+    # Cached answers of the old version are never looked up again; drop them
+    cache.clear()
+    # a new version starts with a closed breaker
+    breaker.reset()
+    # and the new version gets its canary straight away
+    canary.trigger()
+
+# New model versions are loaded, warm-tested and swapped in without a restart
+# (MODEL_WATCH_INTERVAL, SIGHUP or POST /api/admin/reload, see serving/reload.py)
+reloader = ModelReloader('parkinson', initial_model, reload_model, warm_up, MODEL_ARTIFACTS,
+                         on_swap=on_model_swap, log=log)
+del initial_model
+install_reload_signal()
+if FAST_START:
+    reloader.defer_initial_load(lambda result: startup.ready(
+        reloader.current.loaded, (result or {}).get('load_ms'), (result or {}).get('warm_up_ms')),
+        load=load_model)
+on_serve(reloader.start)
+on_serve(startup.listening)
+on_serve(canary.start)
+metrics.watch_reloader(reloader)
+metrics.watch_breaker(breaker)
+metrics.watch_readiness(lambda: readiness(reloader, canary, breaker=breaker)[0], canary)
+
+metrics.watch_batcher(batcher)
+
+# Identical payloads in flight at the same time are scored once
+# (SINGLEFLIGHT, see serving/singleflight.py)
+flights = shared_flights()
+
+def cache_version():
+    # The cache and single-flight are shared between hosted models, so their
+    # keys carry the model name as well as its version
+    return ('parkinson', reloader.current.version)
+
+def cacheable(response):
+    # Don't remember answers produced while the model was failing or while
+    # shedding load
+    return response['model_used'] not in ("fixed_pure_pkl_failed", "fixed_pure_pkl_degraded",
+                                          "fixed_pure_pkl_circuit_open")
+
+def wait_for_model(deadline=None):
+    # Only ever blocks in fast-start mode, while the first model is loading
+    if reloader.loading:
+        timeout = MODEL_WAIT_SECONDS
+        if deadline is not None:
+            timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+        reloader.wait_loaded(timeout)
+
+def score_one(features, deadline=None, degraded=False):
+    # deadline: monotonic time after which the answer is no longer wanted
+    # (raises DeadlineExceeded instead of scoring). degraded: answer from the
+    # cache or the manual risk, never the model
+    if not degraded:
+        wait_for_model(deadline)
+    version = cache_version()
+    key = cache.key(features, version) if cache.enabled else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return dict(cached)
+    
+    if degraded:
+        return score_matrix(np.array([features], dtype=float), degraded=True)[0]
+    
+    # Identical requests already being scored wait for that answer instead
+    return flights.run(flights.key(features, version), lambda: score_uncached(features, key, deadline), deadline)
+
+def score_uncached(features, key, deadline):
+    if batcher is not None:
+        response = batcher.submit(features, deadline)
+    else:
+        check_deadline(deadline)
+        response = score_matrix(np.array([features], dtype=float))[0]
+    
+    if key is not None and cacheable(response):
+        cache.put(key, dict(response))
+    return response
+
+def score_degraded(features_array):
+    return score_matrix(features_array, degraded=True)
+
+def predict_batch(records, deadline=None, degraded=False):
+    # Score all records with one scaler.transform and one model call
+    features_array, row_index, errors, warnings = extract_batch(records)
+    
+    results = [None] * len(records)
+    for i, fields in errors.items():
+        results[i] = invalid_record(fields)
+    
+    if len(row_index):
+        if not degraded:
+            wait_for_model(deadline)
+        check_deadline(deadline)
+        responses = score_with_cache(cache, cache_version(), features_array,
+                                     score_degraded if degraded else score_matrix, cacheable)
+        for i, response in zip(row_index, responses):
+            results[i] = response
+        for i, fields in warnings.items():
+            results[i]['warnings'] = fields
+    
+    return {
+        'success': True,
+        'count': len(records),
+        'failed': len(errors),
+        'results': results
+    }
+
+def score_stream_chunk(records):
+    # One chunk of an NDJSON stream: the batch route's extraction and single
+    # model call, but not cached (an export of historical visits would only
+    # evict the entries live traffic hits)
+    features_array, row_index, errors, warnings = extract_batch(records)
+    results = [None] * len(records)
+    for i, fields in errors.items():
+        results[i] = invalid_record(fields)
+    if len(row_index):
+        wait_for_model()
+        for i, response in zip(row_index, score_matrix(features_array)):
+            results[i] = response
+        for i, fields in warnings.items():
+            results[i]['warnings'] = fields
+    return results
+
+# Routes, schema and scoring functions for the shared handler
+# (serving/server.py); backend/inference_server.py hosts this model next to
+# the others
+model = REGISTRY.register(HostedModel(
+    'parkinson', "Fixed Pure PKL Parkinson's prediction service is running",
+    PREDICTION_ROUTE, STREAM_ROUTE, SCHEMA, matrix_format,
+    score_one=score_one, score_risk=score_risk, score_stream_chunk=score_stream_chunk,
+    wait_for_model=wait_for_model, reloader=reloader, canary=canary, breaker=breaker,
+    batcher=batcher, metrics=metrics, startup=startup, log=log,
+    batch_route=BATCH_ROUTE, predict_batch=predict_batch))
 
 def run_server(port=None):
     # Use environment variable for port if available, otherwise use default
@@ -300,10 +422,9 @@ def run_server(port=None):
     host = '0.0.0.0'
     
     try:
-        handler = ParkinsonHandler
-        with socketserver.TCPServer((host, port), handler) as httpd:
-            print(f"Serving Fixed Pure PKL Parkinson's model at http://{host}:{port}/")
-            httpd.serve_forever()
+        print(f"Serving Fixed Pure PKL Parkinson's model at http://{host}:{port}/")
+        # SERVER_MODE / SERVER_WORKERS / SERVER_THREADS pick the concurrency mode
+        serve(PredictionHandler, host, port)
     except Exception as e:
         print(f"Error starting server: {str(e)}")
         traceback.print_exc()
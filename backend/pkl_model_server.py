@@ -6,6 +6,12 @@ import numpy as np
 import os
 from urllib.parse import parse_qs
 
+from serving.adapters import adapt_model
+from serving.eventlog import Timings, get_logger
+from serving.heuristics import AlzheimerFallback
+
+log = get_logger('pkl_model')
+
 # Path to the actual PKL model
 MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'alz_model', 'model.pkl')
 
@@ -15,6 +21,9 @@ try:
     with open(MODEL_PATH, 'rb') as f:
         model = pickle.load(f)
     print("Model loaded successfully!")
+    # Decide once whether this model gives probabilities or raw predictions
+    adapter = adapt_model(model, 7)
+    print(f"Scoring with {adapter}")
     USE_REAL_MODEL = True
 except Exception as e:
     print(f"Error loading model: {str(e)}")
@@ -22,54 +31,11 @@ except Exception as e:
     print("Will use fallback model instead.")
 
 # Fallback prediction function in case the model fails to load
+fallback_model = AlzheimerFallback()
+
 def fallback_predict_risk(features):
-    print("Using fallback model for prediction")
-    # Extract individual features
-    hippocampus_volume = features[0]
-    cortical_thickness = features[1]
-    ventricle_volume = features[2]
-    white_matter_hyperintensities = features[3]
-    brain_glucose_metabolism = features[4]
-    amyloid_deposition = features[5]
-    tau_protein_level = features[6]
-    
-    # Calculate risk based on simplified algorithm
-    # Lower hippocampus volume increases risk
-    hippocampus_factor = max(0, (4.5 - hippocampus_volume) * 15)
-    
-    # Lower cortical thickness increases risk
-    cortical_factor = max(0, (3.5 - cortical_thickness) * 20)
-    
-    # Higher ventricle volume increases risk
-    ventricle_factor = max(0, (ventricle_volume - 15) * 0.8)
-    
-    # Higher white matter hyperintensities increases risk
-    white_matter_factor = white_matter_hyperintensities * 3
-    
-    # Lower brain glucose metabolism increases risk
-    glucose_factor = max(0, (7.0 - brain_glucose_metabolism) * 10)
-    
-    # Higher amyloid deposition increases risk
-    amyloid_factor = amyloid_deposition * 12
-    
-    # Higher tau protein level increases risk
-    tau_factor = tau_protein_level * 15
-    
-    # Calculate total risk score
-    risk_score = (
-        hippocampus_factor + 
-        cortical_factor + 
-        ventricle_factor + 
-        white_matter_factor + 
-        glucose_factor + 
-        amyloid_factor + 
-        tau_factor
-    ) / 7  # Average the factors
-    
-    # Ensure risk is between 0 and 100
-    risk_percentage = min(max(risk_score, 0), 100)
-    
-    return risk_percentage
+    log.debug('fallback_prediction')
+    return fallback_model.predict_one(features)
 
 class AlzheimerHandler(http.server.BaseHTTPRequestHandler):
     def _set_headers(self, content_type="application/json"):
@@ -98,15 +64,22 @@ class AlzheimerHandler(http.server.BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(b'Not Found')
     
+    def log_message(self, format, *args):
+        # Access log lines go through the async logger instead of stderr
+        log.debug('access', client=self.client_address[0], message=format % args)
+
     def do_POST(self):
         if self.path == '/api/alzheimer-prediction':
+            timings = Timings()
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
+            timings.mark('read')
             
             try:
                 # Parse JSON data
                 data = json.loads(post_data.decode('utf-8'))
-                print("Received data:", data)
+                timings.mark('parse')
+                log.debug('received', payload=data)
                 
                 # Extract features
                 features = [
@@ -119,7 +92,8 @@ class AlzheimerHandler(http.server.BaseHTTPRequestHandler):
                     float(data['tau_protein_level'])
                 ]
                 
-                print("Extracted features:", features)
+                timings.mark('extract')
+                log.debug('features', features=features)
                 
                 # Make prediction
                 risk_percentage = None
@@ -129,30 +103,17 @@ class AlzheimerHandler(http.server.BaseHTTPRequestHandler):
                     try:
                         # Convert to numpy array for the model
                         features_array = np.array(features).reshape(1, -1)
-                        
-                        # Try to use the predict_proba method (for sklearn models)
-                        try:
-                            risk_percentage = model.predict_proba(features_array)[0][1] * 100
-                            model_used = "real_model_proba"
-                        except Exception as e:
-                            print(f"Error using predict_proba: {str(e)}")
-                            # Try to use the predict method (for other models)
-                            try:
-                                risk_percentage = model.predict(features_array)[0] * 100
-                                model_used = "real_model_predict"
-                            except Exception as e:
-                                print(f"Error using predict: {str(e)}")
-                                risk_percentage = fallback_predict_risk(features)
-                                model_used = "fallback_after_error"
+                        risk_percentage = adapter.score(features_array)[0] * 100
+                        model_used = "real_model_proba" if adapter.is_probability else "real_model_predict"
                     except Exception as e:
-                        print(f"Error using real model: {str(e)}")
+                        log.error('model_error', error=str(e))
                         risk_percentage = fallback_predict_risk(features)
                         model_used = "fallback_after_error"
                 else:
                     risk_percentage = fallback_predict_risk(features)
                     model_used = "fallback_only"
                 
-                print(f"Prediction: {risk_percentage}% (using {model_used})")
+                timings.mark('score')
                 
                 # Return prediction result
                 self._set_headers()
@@ -163,9 +124,11 @@ class AlzheimerHandler(http.server.BaseHTTPRequestHandler):
                     'model_used': model_used
                 }
                 self.wfile.write(json.dumps(response).encode())
+                timings.mark('respond')
+                log.request(self.path, 'ok', timings, model_used=model_used)
             
             except Exception as e:
-                print("Error:", str(e))
+                log.request(self.path, 'error', timings, error=str(e))
                 self._set_headers()
                 response = {
                     'error': str(e),
@@ -6,6 +6,11 @@ import numpy as np
 import os
 from urllib.parse import parse_qs
 
+from serving.adapters import adapt_model
+from serving.eventlog import Timings, get_logger
+
+log = get_logger('production')
+
 # Path to the actual PKL model
 MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'alz_model', 'model.pkl')
 
@@ -54,6 +59,17 @@ except Exception as e:
     model = create_fallback_model()
     print("Using fallback model instead.")
 
+# Work out once how to score whatever was loaded (estimator or fallback
+# function) instead of trying each method on every request
+try:
+    adapter = adapt_model(model, 7)
+except Exception as e:
+    print(f"Error probing model: {str(e)}")
+    model = create_fallback_model()
+    adapter = adapt_model(model, 7)
+    print("Using fallback model instead.")
+print(f"Scoring with {adapter}")
+
 class AlzheimerHandler(http.server.BaseHTTPRequestHandler):
     def _set_headers(self, content_type="application/json"):
         self.send_response(200)
@@ -80,15 +96,22 @@ class AlzheimerHandler(http.server.BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(b'Not Found')
     
+    def log_message(self, format, *args):
+        # Access log lines go through the async logger instead of stderr
+        log.debug('access', client=self.client_address[0], message=format % args)
+
     def do_POST(self):
         if self.path == '/api/alzheimer-prediction':
+            timings = Timings()
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
+            timings.mark('read')
             
             try:
                 # Parse JSON data
                 data = json.loads(post_data.decode('utf-8'))
-                print("Received data:", data)
+                timings.mark('parse')
+                log.debug('received', payload=data)
                 
                 # Validate required fields
                 required_fields = [
@@ -112,36 +135,20 @@ class AlzheimerHandler(http.server.BaseHTTPRequestHandler):
                     float(data['tau_protein_level'])
                 ]
                 
-                print("Extracted features:", features)
+                timings.mark('extract')
+                log.debug('features', features=features)
                 
                 # Convert to numpy array for the model
                 features_array = np.array(features).reshape(1, -1)
                 
                 # Make prediction
-                prediction = None
-                prediction_method = ""
-                
-                try:
-                    # Try to use the predict_proba method (for sklearn models)
-                    prediction = model.predict_proba(features_array)[0][1] * 100
-                    prediction_method = "predict_proba"
-                except Exception as e:
-                    print(f"Error using predict_proba: {str(e)}")
-                    try:
-                        # Try to use the predict method (for other models)
-                        prediction = model.predict(features_array)[0] * 100
-                        prediction_method = "predict"
-                    except Exception as e:
-                        print(f"Error using predict: {str(e)}")
-                        try:
-                            # If it's our fallback function
-                            prediction = model(features)
-                            prediction_method = "fallback"
-                        except Exception as e:
-                            print(f"Error using fallback: {str(e)}")
-                            raise
+                prediction = adapter.score(features_array)[0]
+                prediction_method = adapter.method
+                if prediction_method != "fallback":
+                    # Model output is 0-1, the fallback already returns a percentage
+                    prediction = prediction * 100
                 
-                print(f"Prediction: {prediction}% (using {prediction_method})")
+                timings.mark('score')
                 
                 # Return prediction result
                 self._set_headers()
@@ -152,9 +159,11 @@ class AlzheimerHandler(http.server.BaseHTTPRequestHandler):
                     'method': prediction_method
                 }
                 self.wfile.write(json.dumps(response).encode())
+                timings.mark('respond')
+                log.request(self.path, 'ok', timings, method=prediction_method)
             
             except Exception as e:
-                print("Error:", str(e))
+                log.request(self.path, 'error', timings, error=str(e))
                 self._set_headers()
                 response = {
                     'error': str(e),
@@ -0,0 +1,5 @@
+# Shared serving infrastructure for the prediction servers in backend/.
+#
+# The individual *_server.py scripts keep their model loading and request
+# handling; everything that is the same across them (worker pools, and so on)
+# lives here so the Parkinson and Alzheimer services behave identically.
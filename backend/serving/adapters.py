@@ -0,0 +1,75 @@
+# Load-time capability probing for the prediction models.
+#
+# The servers used to try predict_proba on every request, catch the
+# AttributeError an XGBRegressor raises, print it and only then call predict.
+# adapt_model() does that probing once when the model is loaded and returns a
+# ModelAdapter whose score(matrix) goes straight to the right method with the
+# right post-processing.
+import numpy as np
+
+
+class ModelAdapter:
+    # method is one of 'predict_proba', 'predict' or 'fallback' (a plain
+    # function taking one feature list); score() always returns a 1-D float
+    # array with one value per input row
+    def __init__(self, model, method, score, is_probability):
+        self.model = model
+        self.method = method
+        self.score = score
+        self.is_probability = is_probability
+
+    def __repr__(self):
+        return f"ModelAdapter({type(self.model).__name__}, method={self.method!r})"
+
+
+def _probability_score(model):
+    def score(matrix):
+        # Probability of the positive class
+        return np.asarray(model.predict_proba(matrix)[:, 1], dtype=float)
+    return score
+
+
+def _regression_score(model, scaler_y):
+    if scaler_y is None or not hasattr(scaler_y, 'inverse_transform'):
+        def score(matrix):
+            return np.asarray(model.predict(matrix), dtype=float).reshape(-1)
+        return score
+
+    def score(matrix):
+        # The model was trained on a scaled target; map back to its units
+        raw = np.asarray(model.predict(matrix), dtype=float).reshape(-1, 1)
+        return scaler_y.inverse_transform(raw).reshape(-1)
+    return score
+
+
+def _function_score(model):
+    def score(matrix):
+        return np.array([model(row) for row in np.asarray(matrix).tolist()], dtype=float)
+    return score
+
+
+def adapt_model(model, num_features, scaler_y=None):
+    # Probe with one all-zero row; any failure here happens once at startup
+    # instead of on every request
+    sample = np.zeros((1, num_features))
+
+    if hasattr(model, 'predict_proba'):
+        try:
+            proba = np.asarray(model.predict_proba(sample))
+            if proba.ndim == 2 and proba.shape[1] >= 2:
+                return ModelAdapter(model, 'predict_proba', _probability_score(model), True)
+            print(f"predict_proba returned shape {proba.shape}, not class probabilities")
+        except Exception as e:
+            print(f"predict_proba is not usable ({e}), probing predict")
+
+    if hasattr(model, 'predict'):
+        score = _regression_score(model, scaler_y)
+        score(sample)
+        return ModelAdapter(model, 'predict', score, False)
+
+    if callable(model):
+        score = _function_score(model)
+        score(sample)
+        return ModelAdapter(model, 'fallback', score, False)
+
+    raise TypeError(f"{type(model).__name__} has no usable predict_proba, predict or __call__")
@@ -0,0 +1,112 @@
+# Admission control and load shedding for the prediction routes.
+#
+# Every prediction request is admitted (or not) before its body is parsed,
+# looking at two signals in this process:
+#   - load: prediction requests being handled plus connections queued for a
+#     handler thread
+#   - queue wait: how long this request waited for a handler thread (not
+#     counting time its client left the connection idle). Waiting only
+#     means overload while prediction requests are actually being handled:
+#     with none in flight the wait is ignored
+# Over a soft threshold the request is answered in degraded mode: the cheap
+# heuristic the service already uses as its fallback, without the scaler,
+# the model or the micro-batcher, labelled '..._degraded' in model_used (cached
+# model answers are still served). Over a hard threshold it is refused with
+# 503 and Retry-After, so interactive latency stays bounded instead of the
+# queue growing without limit.
+#
+# Configured with (0 turns a threshold off)
+#   SHED_SOFT_INFLIGHT / SHED_HARD_INFLIGHT   load (default 32 / 64)
+#   SHED_SOFT_QUEUE_MS / SHED_HARD_QUEUE_MS   queue wait (default 250 / 1000)
+#   SHED_DEGRADE                              0 answers normally between the
+#                                             soft and hard thresholds
+#   SHED_RETRY_AFTER                          seconds for Retry-After (1)
+import os
+import threading
+import time
+
+NORMAL = 'normal'
+DEGRADED = 'degraded'
+REJECTED = 'rejected'
+
+DEFAULT_SOFT_INFLIGHT = 32
+DEFAULT_HARD_INFLIGHT = 64
+DEFAULT_SOFT_QUEUE_MS = 250.0
+DEFAULT_HARD_QUEUE_MS = 1000.0
+DEFAULT_RETRY_AFTER = 1
+
+
+def _env_number(name, default, kind=float):
+    try:
+        return max(kind(0), kind(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+class AdmissionController:
+    def __init__(self, soft_inflight=None, hard_inflight=None, soft_queue_ms=None, hard_queue_ms=None,
+                 degrade=None, retry_after=None):
+        if soft_inflight is None:
+            soft_inflight = _env_number('SHED_SOFT_INFLIGHT', DEFAULT_SOFT_INFLIGHT, int)
+        if hard_inflight is None:
+            hard_inflight = _env_number('SHED_HARD_INFLIGHT', DEFAULT_HARD_INFLIGHT, int)
+        if soft_queue_ms is None:
+            soft_queue_ms = _env_number('SHED_SOFT_QUEUE_MS', DEFAULT_SOFT_QUEUE_MS)
+        if hard_queue_ms is None:
+            hard_queue_ms = _env_number('SHED_HARD_QUEUE_MS', DEFAULT_HARD_QUEUE_MS)
+        if degrade is None:
+            degrade = os.environ.get('SHED_DEGRADE', '1') != '0'
+        if retry_after is None:
+            retry_after = _env_number('SHED_RETRY_AFTER', DEFAULT_RETRY_AFTER, int)
+
+        self.soft_inflight = soft_inflight
+        self.hard_inflight = hard_inflight
+        self.soft_queue = soft_queue_ms / 1000
+        self.hard_queue = hard_queue_ms / 1000
+        self.degrade = degrade
+        self.retry_after = str(max(1, retry_after))
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.decisions = {NORMAL: 0, DEGRADED: 0, REJECTED: 0}
+
+    @staticmethod
+    def _over(value, threshold):
+        return bool(threshold) and value >= threshold
+
+    def admit(self, queued=0, received_at=None, can_degrade=True):
+        # Decide for one request; unless it is rejected, release() must be
+        # called once it has been answered. Requests that can't be answered
+        # by the heuristic (bulk streams) are rejected over the soft threshold
+        waited = time.monotonic() - received_at if received_at is not None else 0.0
+        with self._lock:
+            if not self.in_flight:
+                # Nothing was ahead of this request but idle or non-prediction
+                # connections, which give their threads back on their own
+                waited = 0.0
+            load = self.in_flight + queued
+            if self._over(load, self.hard_inflight) or self._over(waited, self.hard_queue):
+                decision = REJECTED
+            elif self.degrade and (self._over(load, self.soft_inflight) or self._over(waited, self.soft_queue)):
+                decision = DEGRADED if can_degrade else REJECTED
+            else:
+                decision = NORMAL
+            if decision is not REJECTED:
+                self.in_flight += 1
+            self.decisions[decision] += 1
+        return decision
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'decisions': dict(self.decisions),
+            'soft_inflight': self.soft_inflight,
+            'hard_inflight': self.hard_inflight,
+            'soft_queue_ms': self.soft_queue * 1000,
+            'hard_queue_ms': self.hard_queue * 1000,
+            'degrade': self.degrade,
+        }
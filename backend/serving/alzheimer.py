@@ -0,0 +1,49 @@
+# Feature extraction and model risk mapping for the Alzheimer's prediction
+# service, vectorized over (n, 7) feature matrices.
+import numpy as np
+
+from .schema import Field, FeatureSchema, RecordFormat, describe_errors
+
+# Request fields in model feature order, with the ranges the app documents
+# on its input screen (AlzheimerInputScreen)
+RECORD_FORMAT = RecordFormat('flat', [
+    Field('hippocampus_volume', low=2.5, high=4.5, unit='cm3'),
+    Field('cortical_thickness', low=2.0, high=3.5, unit='mm'),
+    Field('ventricle_volume', low=15, high=40, unit='cm3'),
+    Field('white_matter_hyperintensities', low=0, high=10),
+    Field('brain_glucose_metabolism', low=4.0, high=7.0, unit='SUV'),
+    Field('amyloid_deposition', low=0, high=2.5, unit='SUVR'),
+    Field('tau_protein_level', low=0.8, high=2.0, unit='SUVR'),
+])
+
+SCHEMA = FeatureSchema('alzheimer', [RECORD_FORMAT])
+
+FEATURES = [field.name for field in RECORD_FORMAT.fields]
+
+NUM_FEATURES = SCHEMA.num_features
+
+
+def extract_features(data):
+    # Raises ValueError listing every field that's missing or not a number
+    features, errors, _ = SCHEMA.extract(data)
+    if features is None:
+        raise ValueError(describe_errors(errors))
+    return features
+
+
+def extract_batch(records):
+    # (matrix, row_index, errors, warnings), see FeatureSchema.extract_batch
+    return SCHEMA.extract_batch(records)
+
+
+def model_risk(predictions, is_probability):
+    # Map model output to a 0-100 risk percentage
+    prediction = np.asarray(predictions, dtype=float)
+    if not is_probability:
+        # If prediction is not already a probability, normalize it
+        # Simple normalization for demo purposes
+        outside = (prediction > 1) | (prediction < 0)
+        prediction = np.where(outside, np.clip(prediction / 10, 0, 1), prediction)
+
+    # Amplify the prediction to make it more sensitive to changes
+    return np.minimum(100, prediction * 150)
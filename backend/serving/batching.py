@@ -0,0 +1,178 @@
+# Dynamic micro-batching for single-patient predictions.
+#
+# Handler threads call submit(features) and block; a background thread
+# collects whatever arrives within max_wait_ms of the oldest waiting request
+# (or until max_batch_size rows are waiting), scores them with one vectorized
+# call and hands each caller its own row of the result. An idle server adds at
+# most max_wait_ms to a request; a busy one turns N model calls into one.
+#
+# Requests submitted with a deadline (serving/limits.py) that has passed by
+# the time their batch is assembled are failed with DeadlineExceeded instead
+# of being scored.
+#
+# Configured with BATCHING (0 disables), BATCH_MAX_SIZE and BATCH_MAX_WAIT_MS.
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from .limits import DeadlineExceeded
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 2.0
+
+# Upper bounds of the batch size histogram buckets
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def batching_enabled():
+    return os.environ.get('BATCHING', '1') != '0'
+
+
+class _Pending:
+    __slots__ = ('features', 'deadline', 'enqueued', 'done', 'result', 'error')
+
+    def __init__(self, features, deadline=None):
+        self.features = features
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    # score_batch takes an (n, num_features) matrix and returns a sequence
+    # with one result per row
+    def __init__(self, score_batch, max_batch_size=None, max_wait_ms=None, name='batcher'):
+        if max_batch_size is None:
+            try:
+                max_batch_size = int(os.environ.get('BATCH_MAX_SIZE', DEFAULT_MAX_BATCH_SIZE))
+            except ValueError:
+                max_batch_size = DEFAULT_MAX_BATCH_SIZE
+        if max_wait_ms is None:
+            try:
+                max_wait_ms = float(os.environ.get('BATCH_MAX_WAIT_MS', DEFAULT_MAX_WAIT_MS))
+            except ValueError:
+                max_wait_ms = DEFAULT_MAX_WAIT_MS
+
+        self.score_batch = score_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        # Only the batching thread writes these, so no lock is needed
+        self._batches = 0
+        self._requests = 0
+        self._max_size = 0
+        self._size_counts = [0] * (len(SIZE_BUCKETS) + 1)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._expired = 0
+
+    def _ensure_started(self):
+        # Started on first use so it is created in the process that serves
+        # (after a prefork fork), not in the parent that loaded the model
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, features, deadline=None):
+        self._ensure_started()
+        pending = _Pending(features, deadline)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        # The latency cap counts from when the oldest request arrived, so
+        # requests that queued up while the last batch ran don't wait again
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drop_expired(self, batch, now):
+        # Requests nobody is waiting for any more are answered with an error
+        live = []
+        for pending in batch:
+            if pending.deadline is not None and now >= pending.deadline:
+                pending.error = DeadlineExceeded()
+                pending.done.set()
+                self._expired += 1
+            else:
+                live.append(pending)
+        return live
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            batch = self._drop_expired(batch, started)
+            if not batch:
+                continue
+            try:
+                matrix = np.array([pending.features for pending in batch], dtype=float)
+                results = self.score_batch(matrix)
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+            self._record(batch, started)
+
+    def _record(self, batch, started):
+        size = len(batch)
+        self._batches += 1
+        self._requests += size
+        self._max_size = max(self._max_size, size)
+        bucket = 0
+        while bucket < len(SIZE_BUCKETS) and size > SIZE_BUCKETS[bucket]:
+            bucket += 1
+        self._size_counts[bucket] += 1
+        for pending in batch:
+            wait = started - pending.enqueued
+            self._wait_total += wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+
+    def stats(self):
+        batches = self._batches
+        requests = self._requests
+        labels = [f'<={bound}' for bound in SIZE_BUCKETS] + [f'>{SIZE_BUCKETS[-1]}']
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': batches,
+            'requests': requests,
+            'avg_batch_size': requests / batches if batches else 0.0,
+            'largest_batch': self._max_size,
+            'batch_sizes': dict(zip(labels, self._size_counts)),
+            'avg_wait_ms': self._wait_total / requests * 1000 if requests else 0.0,
+            'max_wait_ms_seen': self._wait_max * 1000,
+            'queued': self._queue.qsize(),
+            'expired': self._expired,
+        }
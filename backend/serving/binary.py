@@ -0,0 +1,106 @@
+# Compact binary feature matrices for high-volume clients.
+#
+# Clients that already hold feature matrices can POST them to the prediction
+# routes as Content-Type: application/x-feature-matrix instead of JSON. The
+# body is a 16-byte little-endian header followed by the matrix, row-major:
+#
+#   offset  size  field
+#   0       4     magic b'NVFM'
+#   4       1     format version (1)
+#   5       1     bytes per value: 4 (float32) or 8 (float64)
+#   6       2     columns (7 for both services)
+#   8       4     rows
+#   12      4     schema id: CRC-32 of the comma-joined column names, so a
+#                 client built against a different feature order is refused
+#
+# The matrix is wrapped with numpy.frombuffer (no parsing, no per-field
+# extraction) and goes straight to scaling and inference; float32 input is
+# widened to float64 first so the answers match the JSON routes exactly. The
+# response uses the same format: one row per input row with the columns
+# riskPercentage, riskLevel (0 Low, 1 Moderate, 2 High) and confidence, in
+# the request's precision, and the model that answered in X-Model-Used.
+# /api/health lists both schemas and their ids.
+import struct
+import zlib
+
+import numpy as np
+
+from .limits import RequestRejected
+
+CONTENT_TYPE = 'application/x-feature-matrix'
+
+MAGIC = b'NVFM'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHII')
+DTYPES = {4: np.dtype('<f4'), 8: np.dtype('<f8')}
+
+RESULT_COLUMNS = ('riskPercentage', 'riskLevel', 'confidence')
+
+
+def schema_id(columns):
+    return zlib.crc32(','.join(columns).encode('utf-8'))
+
+
+def _encode(matrix, dtype, schema):
+    matrix = np.ascontiguousarray(matrix, dtype=dtype)
+    rows, columns = matrix.shape
+    return HEADER.pack(MAGIC, VERSION, dtype.itemsize, columns, rows, schema) + matrix.tobytes()
+
+
+class MatrixFormat:
+    # The binary format for one service's feature schema
+    def __init__(self, feature_names):
+        self.feature_names = tuple(feature_names)
+        self.num_features = len(self.feature_names)
+        self.schema = schema_id(self.feature_names)
+        self.result_schema = schema_id(RESULT_COLUMNS)
+
+    @staticmethod
+    def accepts(headers):
+        content_type = headers.get('Content-Type') or ''
+        return content_type.split(';', 1)[0].strip().lower() == CONTENT_TYPE
+
+    def decode(self, body):
+        # (float64 (rows, 7) matrix, dtype of the request); the matrix is a
+        # read-only view of `body` when it was sent as float64
+        if len(body) < HEADER.size:
+            raise RequestRejected('Feature matrix shorter than its header', 400, 'bad_matrix')
+        magic, version, itemsize, columns, rows, schema = HEADER.unpack_from(body)
+        if magic != MAGIC or version != VERSION:
+            raise RequestRejected(f'Not a version {VERSION} feature matrix', 400, 'bad_matrix')
+        dtype = DTYPES.get(itemsize)
+        if dtype is None:
+            raise RequestRejected('Feature matrix values must be float32 or float64', 400, 'bad_matrix')
+        if columns != self.num_features or schema != self.schema:
+            raise RequestRejected(f'Feature matrix schema {schema} with {columns} columns does not match '
+                                  f'schema {self.schema} ({self.num_features} columns)', 400, 'bad_schema')
+        expected = HEADER.size + rows * columns * itemsize
+        if len(body) != expected:
+            raise RequestRejected(f'Feature matrix of {rows} rows should be {expected} bytes, got {len(body)}',
+                                  400, 'bad_matrix')
+
+        matrix = np.frombuffer(body, dtype=dtype, count=rows * columns, offset=HEADER.size)
+        matrix = matrix.reshape(rows, columns)
+        if dtype.itemsize != 8:
+            matrix = matrix.astype(np.float64)
+        return matrix, dtype
+
+    def encode(self, matrix, dtype=DTYPES[8]):
+        # A request body, for clients and tests
+        return _encode(matrix, dtype, self.schema)
+
+    def encode_results(self, risk, levels, confidence, dtype):
+        results = np.empty((len(risk), len(RESULT_COLUMNS)), dtype=dtype)
+        results[:, 0] = risk
+        results[:, 1] = levels
+        results[:, 2] = confidence
+        return _encode(results, dtype, self.result_schema)
+
+    def describe(self):
+        return {
+            'content_type': CONTENT_TYPE,
+            'schema_id': self.schema,
+            'features': list(self.feature_names),
+            'result_schema_id': self.result_schema,
+            'result_columns': list(RESULT_COLUMNS),
+        }
@@ -0,0 +1,148 @@
+# Circuit breaker around model inference.
+#
+# When the scaler or the model starts throwing (a bad artifact deploy, a
+# library mismatch), every request would otherwise still pay for the full
+# scale + inference attempt and log an error before falling back. After
+# BREAKER_FAILURES consecutive failures (default 5) the breaker opens:
+# requests go straight to the service's fallback, labelled '..._circuit_open'
+# in model_used. After BREAKER_COOLDOWN seconds (default 30) a background
+# thread runs a probe prediction (the service's warm-up); if it succeeds the
+# breaker closes, otherwise it stays open for another cool-down. The probe
+# runs on a timer, not on request traffic, so an instance that readiness has
+# taken out of rotation still recovers.
+#
+# BREAKER_FAILURES=0 turns the breaker off.
+import os
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+PROBING = 'probing'
+
+DEFAULT_FAILURES = 5
+DEFAULT_COOLDOWN = 30.0
+
+
+class CircuitBreaker:
+    # probe() runs one test prediction and raises if the model is still
+    # unusable
+    def __init__(self, name, probe, failures=None, cool_down=None, log=None):
+        if failures is None:
+            try:
+                failures = int(os.environ.get('BREAKER_FAILURES', DEFAULT_FAILURES))
+            except ValueError:
+                failures = DEFAULT_FAILURES
+        if cool_down is None:
+            try:
+                cool_down = float(os.environ.get('BREAKER_COOLDOWN', DEFAULT_COOLDOWN))
+            except ValueError:
+                cool_down = DEFAULT_COOLDOWN
+
+        self.name = name
+        self.failures = max(0, failures)
+        self.cool_down = max(0.1, cool_down)
+        self._probe = probe
+        self._log = log
+        self._lock = threading.Lock()
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.opened_at = None
+        self.opens = 0
+        self.short_circuited = 0
+        self.probes = 0
+
+    @property
+    def enabled(self):
+        return self.failures > 0
+
+    @property
+    def is_open(self):
+        return self.state != CLOSED
+
+    def allow(self):
+        # Whether to attempt inference; False counts a short-circuited call
+        if self.state == CLOSED:
+            return True
+        self.short_circuited += 1
+        return False
+
+    def record_success(self):
+        if self.consecutive_failures:
+            with self._lock:
+                self.consecutive_failures = 0
+
+    def record_failure(self, error):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            if self.state != CLOSED or self.consecutive_failures < self.failures:
+                return
+            self._open()
+            generation = self.opens
+        if self._log is not None:
+            self._log.warning('circuit_opened', breaker=self.name, failures=self.consecutive_failures,
+                              error=self.last_error, cool_down=self.cool_down)
+        threading.Thread(target=self._recover, args=(generation,), name=f'{self.name}-breaker', daemon=True).start()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.opens += 1
+
+    def reset(self):
+        # A new model version gets a fresh start (the recovery thread notices
+        # and stops)
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+        self.last_error = None
+
+    def _recover(self, generation):
+        # One thread per opening; it stops once the breaker was reset or
+        # opened again since
+        while True:
+            time.sleep(self.cool_down)
+            with self._lock:
+                if self.state == CLOSED or self.opens != generation:
+                    return
+                self.state = PROBING
+            self.probes += 1
+            try:
+                self._probe()
+            except Exception as e:
+                with self._lock:
+                    if self.state == CLOSED or self.opens != generation:
+                        return
+                    self.state = OPEN
+                    self.last_error = str(e)
+                if self._log is not None:
+                    self._log.warning('circuit_probe_failed', breaker=self.name, error=str(e))
+                continue
+            with self._lock:
+                if self.opens != generation:
+                    return
+                self.state = CLOSED
+                self.consecutive_failures = 0
+            if self._log is not None:
+                self._log.info('circuit_closed', breaker=self.name,
+                               open_seconds=round(time.time() - self.opened_at, 3))
+            return
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'enabled': self.enabled,
+            'consecutive_failures': self.consecutive_failures,
+            'failure_threshold': self.failures,
+            'cool_down': self.cool_down,
+            'opens': self.opens,
+            'short_circuited': self.short_circuited,
+            'probes': self.probes,
+            'opened_at': round(self.opened_at, 3) if self.opened_at is not None else None,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,343 @@
+# Versioned single-file model bundles.
+#
+# A bundle replaces the model pickle plus the separate scaler.pkl /
+# scaler_y.pkl with one file holding:
+#   - the model: XGBoost models as compiled tree arrays (serving/treecompile.py),
+#     anything else as its pickle bytes
+#   - the feature scaler and target scaler: StandardScalers as their mean and
+#     scale arrays, other scalers pickled
+#   - a manifest with the feature schema, the sha256 of the source files, a
+#     checksum over the whole content and a version id
+#
+# On disk it is an uncompressed .npz (a zip of .npy members), so loading is one
+# sequential read of a small file into memory, and needs neither sklearn nor
+# xgboost for the common case. The checksum and the schema are validated once
+# at load.
+#
+# When a service finds a bundle, the bundle is its model: at startup the
+# pickles next to it are not read or hashed. A retrained pickle is caught
+# where it can be without slowing startup down:
+#   - `check` below exits 1 when a source pickle no longer matches the sha256
+#     the bundle recorded (run it before deploying, then `convert` again)
+#   - a hot reload (serving/reload.py), which the watcher starts when a
+#     pickle changes, loads with load_current_bundle(); that passes over a
+#     stale bundle, so the service switches to the new pickles
+#
+# Build a bundle from the existing pickles:
+#   python -m serving.bundle convert --service parkinson \
+#       --model parkinson_service/model/Parkinson_Model.pkl \
+#       --scaler parkinson_service/model/scaler.pkl \
+#       --scaler-y parkinson_service/model/scaler_y.pkl \
+#       --out parkinson_service/model/parkinson.bundle
+#   python -m serving.bundle inspect parkinson_service/model/parkinson.bundle
+#   python -m serving.bundle check parkinson_service/model/parkinson.bundle \
+#       parkinson_service/model/*.pkl
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from .treecompile import CompiledTreeModel, file_sha256, load_npz
+
+BUNDLE_FORMAT = 'model-bundle'
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_SUFFIX = '.bundle'
+
+MANIFEST_MEMBER = 'manifest'
+
+
+class BundleError(ValueError):
+    pass
+
+
+class ArrayScaler:
+    # The arithmetic of a fitted sklearn StandardScaler without sklearn:
+    # transform() and inverse_transform() give bit-identical results
+    def __init__(self, mean, scale):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+        self.n_features_in_ = len(self.scale_)
+
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        X -= self.mean_
+        X /= self.scale_
+        return X
+
+    def inverse_transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        X *= self.scale_
+        X += self.mean_
+        return X
+
+    def __repr__(self):
+        return f'ArrayScaler(n_features={self.n_features_in_})'
+
+
+def _scaler_arrays(prefix, scaler):
+    # StandardScaler-like objects are stored as plain arrays, anything else
+    # as its pickle
+    scale = getattr(scaler, 'scale_', None)
+    if type(scaler).__name__ == 'StandardScaler' and hasattr(scaler, 'n_features_in_'):
+        count = scaler.n_features_in_
+        mean = scaler.mean_ if getattr(scaler, 'with_mean', True) and scaler.mean_ is not None else np.zeros(count)
+        if scale is None:
+            scale = np.ones(count)
+        return {f'{prefix}/mean': np.asarray(mean, dtype=np.float64),
+                f'{prefix}/scale': np.asarray(scale, dtype=np.float64)}, 'standard'
+    return {f'{prefix}/pickle': np.frombuffer(pickle.dumps(scaler), dtype=np.uint8)}, 'pickle'
+
+
+def _model_arrays(model):
+    # XGBoost models are compiled (and checked against xgboost); anything the
+    # compiler does not support is kept as a pickle
+    if hasattr(model, 'get_booster'):
+        from .treecompile import compile_model
+        try:
+            arrays, max_error = compile_model(model)
+        except ValueError as e:
+            print(f"Keeping the model as a pickle: {e}")
+        else:
+            return {f'model/{name}': value for name, value in arrays.items()}, 'compiled_trees', max_error
+    return {'model/pickle': np.frombuffer(pickle.dumps(model), dtype=np.uint8)}, 'pickle', None
+
+
+def _section(arrays, prefix):
+    start = prefix + '/'
+    return {name[len(start):]: value for name, value in arrays.items() if name.startswith(start)}
+
+
+def content_checksum(manifest, arrays):
+    # sha256 over the manifest (minus the checksum and the version id, which
+    # may be derived from it) and every array's name, dtype, shape and bytes,
+    # in name order
+    digest = hashlib.sha256()
+    body = dict(manifest)
+    body.pop('checksum', None)
+    body.pop('version', None)
+    digest.update(json.dumps(body, sort_keys=True).encode())
+    for name in sorted(arrays):
+        value = np.ascontiguousarray(arrays[name])
+        digest.update(name.encode())
+        digest.update(str(value.dtype).encode())
+        digest.update(str(value.shape).encode())
+        digest.update(value.tobytes())
+    return 'sha256:' + digest.hexdigest()
+
+
+def service_schema(service, scaler=None):
+    # Request fields in model input order for the known services, plus the
+    # column names the scaler was fitted with when it recorded them
+    if service == 'parkinson':
+        from .parkinson import FLAT_FEATURES, NESTED_FEATURES
+        schema = {
+            'num_features': len(NESTED_FEATURES),
+            'fields': [f'{section}.{field}' for section, field in NESTED_FEATURES],
+            'flat_fields': list(FLAT_FEATURES),
+        }
+    elif service == 'alzheimer':
+        from .alzheimer import FEATURES
+        schema = {'num_features': len(FEATURES), 'fields': list(FEATURES)}
+    else:
+        schema = {}
+    names = getattr(scaler, 'feature_names_in_', None)
+    if names is not None:
+        schema['model_features'] = [str(name) for name in names]
+    return schema
+
+
+def build_bundle(out_path, model_path, scaler_path=None, scaler_y_path=None, service=None, version=None):
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    model = load(model_path)
+    scaler = load(scaler_path) if scaler_path else None
+    scaler_y = load(scaler_y_path) if scaler_y_path else None
+
+    arrays, model_kind, max_error = _model_arrays(model)
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'service': service,
+        'created': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'model': {'kind': model_kind, 'type': f'{type(model).__module__}.{type(model).__name__}'},
+        'schema': service_schema(service, scaler),
+        'sources': {os.path.basename(path): file_sha256(path)
+                    for path in (model_path, scaler_path, scaler_y_path) if path},
+    }
+    if max_error is not None:
+        manifest['model']['max_abs_error'] = max_error
+    for prefix, value in (('scaler', scaler), ('scaler_y', scaler_y)):
+        if value is not None:
+            scaler_arrays, scaler_kind = _scaler_arrays(prefix, value)
+            arrays.update(scaler_arrays)
+            manifest[prefix] = {'kind': scaler_kind}
+
+    checksum = content_checksum(manifest, arrays)
+    manifest['checksum'] = checksum
+    manifest['version'] = version or checksum[len('sha256:'):][:12]
+
+    # Written through a file object so np.savez doesn't append '.npz'
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **{MANIFEST_MEMBER: np.array(json.dumps(manifest))}, **arrays)
+    os.replace(tmp_path, out_path)
+    return manifest
+
+
+class ModelBundle:
+    def __init__(self, path, manifest, model, scaler, scaler_y, load_ms):
+        self.path = path
+        self.manifest = manifest
+        self.model = model
+        self.scaler = scaler
+        self.scaler_y = scaler_y
+        self.load_ms = load_ms
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def checksum(self):
+        return self.manifest['checksum']
+
+    @property
+    def schema(self):
+        return self.manifest.get('schema', {})
+
+    def describe(self):
+        return {
+            'path': self.path,
+            'version': self.version,
+            'checksum': self.checksum,
+            'created': self.manifest.get('created'),
+            'model': self.manifest.get('model'),
+            'load_ms': round(self.load_ms, 3),
+        }
+
+
+def _load_scaler(arrays, manifest, prefix):
+    if prefix not in manifest:
+        return None
+    section = _section(arrays, prefix)
+    if manifest[prefix]['kind'] == 'standard':
+        return ArrayScaler(section['mean'], section['scale'])
+    return pickle.loads(section['pickle'].tobytes())
+
+
+def load_bundle(path, num_features=None, verify=True):
+    started = time.perf_counter()
+    arrays = load_npz(path)
+    if MANIFEST_MEMBER not in arrays:
+        raise BundleError(f"{path} is not a model bundle (no manifest)")
+    manifest = json.loads(str(arrays.pop(MANIFEST_MEMBER)))
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise BundleError(f"{path} is not a model bundle")
+    if manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format version {manifest.get('format_version')}")
+    if verify and content_checksum(manifest, arrays) != manifest.get('checksum'):
+        raise BundleError(f"Checksum mismatch in {path}: the bundle is corrupt or was modified")
+
+    if manifest['model']['kind'] == 'compiled_trees':
+        model = CompiledTreeModel(_section(arrays, 'model'))
+    else:
+        model = pickle.loads(arrays['model/pickle'].tobytes())
+    scaler = _load_scaler(arrays, manifest, 'scaler')
+    scaler_y = _load_scaler(arrays, manifest, 'scaler_y')
+
+    # Schema checks, once, so a bundle built for another model never serves
+    expected = num_features if num_features is not None else manifest.get('schema', {}).get('num_features')
+    if expected is not None:
+        model_features = getattr(model, 'n_features_in_', None)
+        if model_features is not None and model_features != expected:
+            raise BundleError(f"Model expects {model_features} features, schema says {expected}")
+        if scaler is not None and getattr(scaler, 'n_features_in_', expected) != expected:
+            raise BundleError(f"Scaler expects {scaler.n_features_in_} features, schema says {expected}")
+    if scaler_y is not None and getattr(scaler_y, 'n_features_in_', 1) != 1:
+        raise BundleError("Target scaler must have exactly one column")
+
+    return ModelBundle(path, manifest, model, scaler, scaler_y, (time.perf_counter() - started) * 1000)
+
+
+def find_bundle(candidates):
+    # First existing path; None entries (e.g. an unset environment variable)
+    # are skipped
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def stale_sources(manifest, paths):
+    # Names of the files in `paths` the bundle was built from (matched by
+    # basename) that exist and no longer have the recorded sha256
+    sources = manifest.get('sources', {})
+    stale = []
+    for path in paths:
+        if not path:
+            continue
+        recorded = sources.get(os.path.basename(path))
+        if recorded is not None and os.path.exists(path) and file_sha256(path) != recorded:
+            stale.append(os.path.basename(path))
+    return stale
+
+
+def load_current_bundle(path, sources, num_features=None):
+    # Like load_bundle(), but returns None when any of the source pickles
+    # next to it has changed since the bundle was built (e.g. a retrained
+    # model dropped into model/), so the service falls back to the pickles
+    # instead of silently serving the old model; the same rule as
+    # treecompile.load_compiled_model(). Hashes every source, so the
+    # services only use it when reloading
+    bundle = load_bundle(path, num_features)
+    stale = stale_sources(bundle.manifest, sources)
+    if stale:
+        print(f"Ignoring stale model bundle {path}: {', '.join(stale)} changed since it was built")
+        return None
+    return bundle
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m serving.bundle', description='Build or inspect model bundles')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help='build a bundle from model/scaler pickles')
+    convert.add_argument('--model', required=True)
+    convert.add_argument('--scaler')
+    convert.add_argument('--scaler-y')
+    convert.add_argument('--service', choices=('parkinson', 'alzheimer'))
+    convert.add_argument('--version', help='version id (default: first 12 hex digits of the checksum)')
+    convert.add_argument('--out', required=True)
+
+    inspect = commands.add_parser('inspect', help='validate a bundle and print its manifest')
+    inspect.add_argument('path')
+
+    check = commands.add_parser('check', help='exit 1 if any of the source pickles changed since the build')
+    check.add_argument('path')
+    check.add_argument('sources', nargs='+')
+
+    args = parser.parse_args(argv)
+    if args.command == 'convert':
+        manifest = build_bundle(args.out, args.model, args.scaler, args.scaler_y, args.service, args.version)
+        print(f"Wrote {args.out} (version {manifest['version']}, {manifest['checksum']})")
+    elif args.command == 'check':
+        stale = stale_sources(load_bundle(args.path).manifest, args.sources)
+        if stale:
+            print(f"{args.path} is stale: {', '.join(stale)} changed since it was built")
+            return 1
+        print(f"{args.path} is up to date")
+    else:
+        bundle = load_bundle(args.path)
+        print(json.dumps(dict(bundle.manifest, load_ms=round(bundle.load_ms, 3)), indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# Bounded LRU/TTL cache for prediction results.
+#
+# Keys are the model version plus the seven features rounded to
+# PREDICTION_CACHE_DECIMALS places, so re-posting the same patient (the app
+# does this every time a result screen is reopened) skips scaling and
+# scoring. Entries expire after PREDICTION_CACHE_TTL seconds, the least
+# recently used entry is evicted once PREDICTION_CACHE_SIZE is reached (0
+# disables the cache), and the whole cache is dropped when any of the model
+# artifact files change on disk.
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_SIZE = 1024
+DEFAULT_TTL = 300.0
+DEFAULT_DECIMALS = 6
+
+# How often the artifact files are re-checked for changes
+ARTIFACT_CHECK_INTERVAL = 2.0
+
+
+def artifact_version(paths):
+    # Short content hash of the model files, used as the model version
+    digest = hashlib.sha256()
+    for path in paths:
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def artifact_stamp(paths):
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamp.append((path, st.st_size, st.st_mtime_ns))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
+
+class PredictionCache:
+    def __init__(self, maxsize=None, ttl=None, decimals=None, artifacts=()):
+        if maxsize is None:
+            maxsize = int(os.environ.get('PREDICTION_CACHE_SIZE', DEFAULT_SIZE))
+        if ttl is None:
+            ttl = float(os.environ.get('PREDICTION_CACHE_TTL', DEFAULT_TTL))
+        if decimals is None:
+            decimals = int(os.environ.get('PREDICTION_CACHE_DECIMALS', DEFAULT_DECIMALS))
+
+        self.maxsize = max(0, maxsize)
+        self.ttl = ttl
+        self.decimals = decimals
+        self.artifacts = [path for path in artifacts if path]
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stamp = artifact_stamp(self.artifacts)
+        self._next_check = time.monotonic() + ARTIFACT_CHECK_INTERVAL
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def key(self, features, version):
+        return (version,) + tuple(round(float(value), self.decimals) for value in features)
+
+    def _check_artifacts(self, now):
+        # Called with the lock held; stat() the files at most every couple of
+        # seconds rather than on every lookup
+        if not self.artifacts or now < self._next_check:
+            return
+        self._next_check = now + ARTIFACT_CHECK_INTERVAL
+        stamp = artifact_stamp(self.artifacts)
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_artifacts(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def watch(self, artifacts):
+        # Also drop the cache when any of these files change (another hosted
+        # model's artifacts, see serving/registry.py)
+        with self._lock:
+            self.artifacts.extend(path for path in artifacts if path and path not in self.artifacts)
+            self._stamp = artifact_stamp(self.artifacts)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+def score_with_cache(cache, version, features_array, score_matrix, cacheable):
+    # Batch helper: look every row up in the cache and score only the misses,
+    # still with a single score_matrix() call
+    if not cache.enabled:
+        return score_matrix(features_array)
+
+    keys = [cache.key(row, version) for row in features_array.tolist()]
+    results = [cache.get(key) for key in keys]
+    missing = [row for row, result in enumerate(results) if result is None]
+    if missing:
+        for row, response in zip(missing, score_matrix(features_array[missing])):
+            results[row] = response
+            if cacheable(response):
+                cache.put(keys[row], dict(response))
+    return [dict(result) for result in results]
@@ -0,0 +1,98 @@
+# Cross-origin (CORS) policy shared by the service handlers.
+#
+# The React Native web build and the dashboards send an OPTIONS preflight
+# before each cross-origin POST. Preflights are answered with 204 and no body
+# straight from the handler (the prediction code never sees them), and carry
+# Access-Control-Max-Age so browsers cache the answer instead of repeating
+# the preflight before every request.
+#
+# Configured with
+#   CORS_ALLOWED_ORIGINS  comma-separated origins, '*' for any (the default);
+#                         entries may use shell wildcards, e.g.
+#                         https://*.onrender.com
+#   CORS_MAX_AGE          seconds a browser may cache a preflight (default
+#                         7200, the most Chromium honours)
+#   CORS_ALLOWED_HEADERS  request headers clients may send (default
+#                         Content-Type and X-Request-Timeout-Ms)
+#
+# With a list of origins the matching request Origin is echoed back with
+# Vary: Origin; requests from other origins get no CORS headers, and their
+# preflights a 403.
+import fnmatch
+import os
+
+DEFAULT_MAX_AGE = 7200
+DEFAULT_ALLOWED_HEADERS = ('Content-Type', 'X-Request-Timeout-Ms')
+ALLOWED_METHODS = ('GET', 'POST', 'OPTIONS')
+
+# Origin decisions remembered per policy
+MAX_REMEMBERED_ORIGINS = 1024
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class CorsPolicy:
+    def __init__(self, origins=('*',), max_age=DEFAULT_MAX_AGE, allowed_headers=DEFAULT_ALLOWED_HEADERS,
+                 methods=ALLOWED_METHODS):
+        origins = [origin.rstrip('/') for origin in origins]
+        self.any_origin = '*' in origins
+        self.origins = frozenset(origin for origin in origins if '*' not in origin)
+        self.patterns = tuple(origin for origin in origins if '*' in origin and origin != '*')
+        self.max_age = max(0, int(max_age))
+        self.allowed_headers = tuple(allowed_headers)
+        self.methods = tuple(methods)
+        self._decisions = {}
+
+        # Headers only a preflight needs, joined once
+        self.preflight_headers = (
+            ('Access-Control-Allow-Methods', ', '.join(self.methods)),
+            ('Access-Control-Allow-Headers', ', '.join(self.allowed_headers)),
+            ('Access-Control-Max-Age', str(self.max_age)),
+        )
+
+    @classmethod
+    def from_env(cls):
+        try:
+            max_age = int(os.environ.get('CORS_MAX_AGE', DEFAULT_MAX_AGE))
+        except ValueError:
+            max_age = DEFAULT_MAX_AGE
+        return cls(
+            origins=_split(os.environ.get('CORS_ALLOWED_ORIGINS', '*')) or ['*'],
+            max_age=max_age,
+            allowed_headers=_split(os.environ.get('CORS_ALLOWED_HEADERS', '')) or DEFAULT_ALLOWED_HEADERS,
+        )
+
+    def allow_origin(self, origin):
+        # The Access-Control-Allow-Origin value for a request from `origin`,
+        # or None when that origin is not allowed
+        if self.any_origin:
+            return '*'
+        if not origin:
+            return None
+        decision = self._decisions.get(origin, False)
+        if decision is False:
+            allowed = origin in self.origins or any(fnmatch.fnmatchcase(origin, pattern)
+                                                    for pattern in self.patterns)
+            decision = origin if allowed else None
+            if len(self._decisions) < MAX_REMEMBERED_ORIGINS:
+                self._decisions[origin] = decision
+        return decision
+
+    def response_headers(self, allow_origin):
+        # CORS headers for an ordinary (non-preflight) response. Unless any
+        # origin is allowed the answer depends on Origin, so shared caches
+        # are told so even when the origin was refused
+        if allow_origin == '*':
+            return (('Access-Control-Allow-Origin', '*'),)
+        if allow_origin is None:
+            return (('Vary', 'Origin'),) if not self.any_origin else ()
+        return (('Access-Control-Allow-Origin', allow_origin), ('Vary', 'Origin'))
+
+    def describe(self):
+        return {
+            'origins': ['*'] if self.any_origin else sorted(self.origins) + list(self.patterns),
+            'max_age': self.max_age,
+            'allowed_headers': list(self.allowed_headers),
+        }
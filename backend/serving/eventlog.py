@@ -0,0 +1,180 @@
+# Asynchronous structured logging for the prediction servers.
+#
+# Handlers used to print() the payload, features, every component score and
+# the result synchronously while holding the connection; on a container with
+# a slow log driver that was a large share of request latency. EventLogger
+# instead puts one dict per event on a bounded queue and a background thread
+# writes them out as JSON lines, so the handler never waits on stdout.
+#
+#   LOG_LEVEL         debug | info | warning | error (default info)
+#   LOG_SAMPLE_RATES  per-route sampling of successful request logs, e.g.
+#                     "/api/parkinson-prediction=0.1,/api/health=0"
+#                     (errors are always logged)
+#   LOG_FILE          write here instead of stdout
+#
+# Usage from any server script:
+#   from serving.eventlog import Timings, get_logger
+#   log = get_logger('parkinson')
+#   log.info('model_loaded', path=MODEL_PATH)
+#   timings = Timings(); ...; timings.mark('parse')
+#   log.request('/api/parkinson-prediction', 'ok', timings, model_used=...)
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+DEFAULT_QUEUE_SIZE = 10000
+
+
+def _parse_sample_rates(value):
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        route, rate = item.rsplit('=', 1)
+        try:
+            rates[route.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            pass
+    return rates
+
+
+class Timings:
+    # Wall-clock time of each request stage in milliseconds; mark() closes
+    # the stage that started at the previous mark (or at creation)
+    __slots__ = ('started', '_last', 'stages')
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages = {}
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = (now - self._last) * 1000
+        self._last = now
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+class EventLogger:
+    def __init__(self, service, level=None, sample_rates=None, stream=None, queue_size=DEFAULT_QUEUE_SIZE):
+        if level is None:
+            level = os.environ.get('LOG_LEVEL', 'info')
+        if sample_rates is None:
+            sample_rates = _parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES'))
+
+        self.service = service
+        self.level = LEVELS.get(str(level).lower(), LEVELS['info'])
+        self.sample_rates = sample_rates
+        self._stream = stream
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def enabled_for(self, level):
+        return LEVELS[level] >= self.level
+
+    def _ensure_started(self):
+        # Lazily, so a prefork child gets its own writer thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f'{self.service}-log', daemon=True)
+                self._thread.start()
+
+    def _open_stream(self):
+        if self._stream is not None:
+            return self._stream
+        path = os.environ.get('LOG_FILE')
+        if path:
+            return open(path, 'a', buffering=1)
+        return sys.stdout
+
+    def _run(self):
+        stream = self._open_stream()
+        while True:
+            records = [self._queue.get()]
+            # Drain whatever else is waiting so a burst costs one write
+            while len(records) < 256:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                stream.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+                stream.flush()
+            except Exception:
+                # Logging must never take the server down
+                pass
+            for _ in records:
+                self._queue.task_done()
+
+    def log(self, level, event, **fields):
+        if LEVELS[level] < self.level:
+            return
+        self._ensure_started()
+        record = {'ts': round(time.time(), 6), 'level': level, 'service': self.service, 'event': event}
+        record.update(fields)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on logging; count what was lost instead
+            self.dropped += 1
+
+    def debug(self, event, **fields):
+        self.log('debug', event, **fields)
+
+    def info(self, event, **fields):
+        self.log('info', event, **fields)
+
+    def warning(self, event, **fields):
+        self.log('warning', event, **fields)
+
+    def error(self, event, **fields):
+        self.log('error', event, **fields)
+
+    def request(self, route, outcome, timings=None, **fields):
+        # One summary line per request; successful requests on busy routes
+        # can be sampled down, failures are always kept
+        if outcome == 'ok':
+            rate = self.sample_rates.get(route, 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                return
+        if timings is not None:
+            fields['stages_ms'] = {stage: round(ms, 3) for stage, ms in timings.stages.items()}
+            fields['total_ms'] = round(timings.total_ms(), 3)
+        self.log('info' if outcome == 'ok' else 'error', 'request', route=route, outcome=outcome, **fields)
+
+    def flush(self, timeout=2.0):
+        # Best effort wait for the writer to catch up (used at exit)
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+
+def get_logger(service):
+    with _loggers_lock:
+        logger = _loggers.get(service)
+        if logger is None:
+            logger = _loggers[service] = EventLogger(service)
+        return logger
+
+
+@atexit.register
+def _flush_all():
+    for logger in list(_loggers.values()):
+        logger.flush()
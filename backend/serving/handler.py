@@ -0,0 +1,263 @@
+# Base request handler for the prediction services: HTTP/1.1 persistent
+# connections, with every response written as one precomputed header block
+# plus the body.
+#
+# BaseHTTPRequestHandler speaks HTTP/1.0 by default and closes the connection
+# after each response, so a client scoring patients one after another paid a
+# TCP (and, behind Render's proxy, TLS) handshake per prediction. Here a
+# connection stays open for further requests until the client closes it or
+# it has been idle for KEEPALIVE_TIMEOUT seconds (default 5). Persistent
+# connections only work if every response carries a Content-Length and every
+# request body is read in full, so responses go through
+# send_body()/send_json() and unread bodies are drained (or the connection
+# closed) before answering.
+#
+# The parts of a response that never change (status line, Server, content
+# type, CORS headers) are built once per status, content type and allowed
+# origin and cached as bytes; only Date and Content-Length are added per
+# response. CORS preflights are answered here too, with 204 and no body,
+# according to the shared policy in serving/cors.py. Header and
+# body go out in a single write, so Nagle's algorithm never holds back the
+# body of a response on a reused connection.
+#
+# Request bodies are read with read_body(), which enforces MAX_BODY_BYTES and
+# READ_TIMEOUT, and request_deadline() gives the client's deadline (see
+# serving/limits.py). Streamed responses (serving/streaming.py) use chunked
+# transfer coding via start_chunked()/write_chunk()/end_chunked().
+#
+# In single mode (one connection at a time) the connection is still closed
+# after every response, since an idle client would block everybody else. In
+# the pooled modes an idle connection must not pin its handler thread: once it
+# has had a response, while waiting for its next request it checks every
+# IDLE_POLL_INTERVAL whether other connections are queued for a thread, and if
+# so closes and gives the thread back. A connection is likewise closed after
+# its response whenever others are queued, so kept-alive clients can't starve
+# new ones. A new connection's first request is always read and answered.
+import email.utils
+import http.server
+import json
+import os
+import socket
+import time
+
+from .cors import CorsPolicy
+from .limits import read_body, request_deadline
+
+JSON_CONTENT_TYPE = 'application/json'
+TEXT_CONTENT_TYPE = 'text/plain; charset=utf-8'
+
+DEFAULT_KEEPALIVE_TIMEOUT = 5.0
+
+# How often an idle connection checks for connections queued behind it, i.e.
+# the longest a new connection waits for a thread held by an idle one
+IDLE_POLL_INTERVAL = 0.02
+
+# Unread request bodies up to this size are drained to keep the connection;
+# anything larger closes it instead
+MAX_DRAIN_BYTES = 64 * 1024
+
+# Header blocks are only cached up to this many variants (an echoed origin
+# is part of the key)
+MAX_HEADER_BLOCKS = 1024
+
+
+def keepalive_timeout():
+    try:
+        return max(0.1, float(os.environ.get('KEEPALIVE_TIMEOUT', DEFAULT_KEEPALIVE_TIMEOUT)))
+    except ValueError:
+        return DEFAULT_KEEPALIVE_TIMEOUT
+
+
+_header_blocks = {}
+_date = (0, b'')
+
+
+def _header_block(handler, status, content_type, close, allow_origin, preflight=False):
+    # Status line and static headers, ending just before Date/Content-Length
+    key = (type(handler), status, content_type, close, allow_origin, preflight)
+    block = _header_blocks.get(key)
+    if block is None:
+        reason = handler.responses.get(status, ('',))[0]
+        lines = [f'{handler.protocol_version} {status} {reason}',
+                 f'Server: {handler.version_string()}']
+        if content_type is not None:
+            lines.append(f'Content-Type: {content_type}')
+        lines.extend(f'{name}: {value}' for name, value in handler.cors.response_headers(allow_origin))
+        if preflight:
+            lines.extend(f'{name}: {value}' for name, value in handler.cors.preflight_headers)
+        if close:
+            lines.append('Connection: close')
+        block = ('\r\n'.join(lines) + '\r\n').encode('latin-1')
+        if len(_header_blocks) < MAX_HEADER_BLOCKS:
+            _header_blocks[key] = block
+    return block
+
+
+def _date_header():
+    # The Date header only changes once a second
+    global _date
+    now = int(time.time())
+    if _date[0] != now:
+        _date = (now, f'Date: {email.utils.formatdate(now, usegmt=True)}\r\n'.encode('latin-1'))
+    return _date[1]
+
+
+class ServiceHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Idle keep-alive connections time out after this long (sooner when other
+    # connections are waiting for a thread); also the socket timeout while a
+    # request is being read
+    timeout = keepalive_timeout()
+    disable_nagle_algorithm = True
+    # CORS_ALLOWED_ORIGINS / CORS_MAX_AGE / CORS_ALLOWED_HEADERS
+    cors = CorsPolicy.from_env()
+
+    def setup(self):
+        super().setup()
+        queued_for = getattr(self.server, 'queued_for', None)
+        self._queued_for = queued_for() if queued_for is not None else 0.0
+
+    def parse_request(self):
+        # When this request arrived: when its request line was read, moved
+        # back by the time the connection spent queued for a handler thread
+        # if it is the connection's first request. Time the client left the
+        # connection idle (before its first request or between requests) is
+        # never counted, so it can't pass for overload or eat a deadline
+        self.received_at = time.monotonic() - self._queued_for
+        self._queued_for = 0.0
+        return super().parse_request()
+
+    def handle(self):
+        # BaseHTTPRequestHandler.handle(), but waiting for each further
+        # request without holding on to the thread when another connection
+        # needs it. The first request is read with the plain socket timeout:
+        # a client that just got its thread is owed an answer, however many
+        # connections are queued behind it
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self._wait_for_request():
+                break
+            self.handle_one_request()
+
+    def _wait_for_request(self):
+        # True once the next request (or the client's EOF) can be read; False
+        # when the connection should be closed instead, after KEEPALIVE_TIMEOUT
+        # idle or as soon as other connections are queued for a thread
+        if not getattr(self.server, 'supports_keep_alive', False):
+            # One connection at a time: nobody else to make room for
+            return True
+        sock = self.connection
+        try:
+            # A pipelined request may already be buffered in rfile, where
+            # the socket can't see it
+            sock.settimeout(0.0)
+            if self.rfile.peek(1):
+                return True
+            deadline = time.monotonic() + self.timeout
+            while True:
+                if self.queued_connections():
+                    return False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                sock.settimeout(min(remaining, IDLE_POLL_INTERVAL))
+                try:
+                    sock.recv(1, socket.MSG_PEEK)
+                    return True
+                except socket.timeout:
+                    continue
+        except OSError:
+            return False
+        finally:
+            try:
+                sock.settimeout(self.timeout)
+            except OSError:
+                pass
+
+    def queued_connections(self):
+        # Connections waiting for a handler thread in this process
+        queue_depth = getattr(self.server, 'queue_depth', None)
+        return queue_depth() if queue_depth is not None else 0
+
+    def read_body(self):
+        return read_body(self)
+
+    def request_deadline(self):
+        # Monotonic deadline from X-Request-Timeout-Ms (or REQUEST_TIMEOUT_MS),
+        # or None
+        return request_deadline(self.headers, self.received_at)
+
+    def _keep_alive(self):
+        # Only a server with a pool of handler threads can afford to leave a
+        # connection open (see ThreadPoolTCPServer in serving/workers.py),
+        # and only while no other connection is waiting for a thread
+        return getattr(self.server, 'supports_keep_alive', False) and not self.queued_connections()
+
+    def _allow_origin(self):
+        cors = self.cors
+        return '*' if cors.any_origin else cors.allow_origin(self.headers.get('Origin'))
+
+    def send_body(self, body, content_type=JSON_CONTENT_TYPE, status=200, headers=()):
+        # headers: extra (name, value) pairs for this response only
+        if not self._keep_alive():
+            self.close_connection = True
+        head = _header_block(self, status, content_type, self.close_connection, self._allow_origin())
+        extra = ''.join(f'{name}: {value}\r\n' for name, value in headers).encode('latin-1') if headers else b''
+        self.log_request(status)
+        self.wfile.write(b''.join((head, extra, _date_header(), b'Content-Length: ', str(len(body)).encode(),
+                                   b'\r\n\r\n', body)))
+
+    def start_chunked(self, content_type, status=200):
+        # Headers of a response whose length isn't known up front; the body
+        # follows as write_chunk() calls and one end_chunked()
+        if not self._keep_alive():
+            self.close_connection = True
+        head = _header_block(self, status, content_type, self.close_connection, self._allow_origin())
+        self.log_request(status)
+        self.wfile.write(head + _date_header() + b'Transfer-Encoding: chunked\r\n\r\n')
+
+    def write_chunk(self, data):
+        if data:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def end_chunked(self):
+        self.wfile.write(b'0\r\n\r\n')
+
+    def send_json(self, response, status=200, headers=()):
+        self.send_body(json.dumps(response).encode(), JSON_CONTENT_TYPE, status, headers)
+
+    def discard_body(self):
+        # Read and drop a request body nobody is going to use, so the next
+        # request on this connection starts at the right place
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_DRAIN_BYTES or self.headers.get('Transfer-Encoding'):
+            self.close_connection = True
+        elif length:
+            self.rfile.read(length)
+
+    def send_not_found(self):
+        self.discard_body()
+        self.send_body(b'Not Found', TEXT_CONTENT_TYPE, 404)
+
+    def do_OPTIONS(self):
+        # CORS preflight; never reaches the prediction code
+        self.discard_body()
+        allow_origin = self._allow_origin()
+        self.on_preflight(allow_origin is not None)
+        if allow_origin is None:
+            self.send_body(b'', TEXT_CONTENT_TYPE, 403)
+            return
+        if not self._keep_alive():
+            self.close_connection = True
+        # A 204 has neither a body nor a Content-Length
+        head = _header_block(self, 204, None, self.close_connection, allow_origin, preflight=True)
+        self.log_request(204)
+        self.wfile.write(head + _date_header() + b'\r\n')
+
+    def on_preflight(self, allowed):
+        # Services override this to count preflights
+        pass
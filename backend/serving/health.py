@@ -0,0 +1,146 @@
+# Liveness and readiness.
+#
+# /api/live only says the process is up and serving HTTP; it does no work,
+# so it is safe to probe as often as a platform likes. /api/ready says
+# whether this instance should get traffic: the real model is loaded (not
+# the fallback, and not still loading in fast-start mode) and the latest
+# canary prediction succeeded recently, and the inference circuit breaker
+# (serving/breaker.py) is closed.
+#
+# The canary is the service's warm-up prediction on a fixed sample patient.
+# A background thread runs it every CANARY_INTERVAL seconds (default 30) and
+# right after every model swap, and caches the result, so a probe never runs
+# inference on the request thread; it only reads the cached result.
+import os
+import threading
+import time
+
+DEFAULT_CANARY_INTERVAL = 30.0
+
+# A canary result older than this many intervals no longer counts as passing
+# (its thread is stuck or dead)
+STALE_INTERVALS = 3
+
+
+class Canary:
+    # probe() runs one test prediction and returns a dict of details to
+    # report, or raises if the model is unusable
+    def __init__(self, name, probe, interval=None, log=None):
+        if interval is None:
+            try:
+                interval = float(os.environ.get('CANARY_INTERVAL', DEFAULT_CANARY_INTERVAL))
+            except ValueError:
+                interval = DEFAULT_CANARY_INTERVAL
+
+        self.name = name
+        self.interval = max(1.0, interval)
+        self._probe = probe
+        self._log = log
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self.runs = 0
+        self.failures = 0
+        self.result = None
+
+    def start(self):
+        # Called in the serving process (after a prefork fork)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f'{self.name}-canary', daemon=True)
+                self._thread.start()
+
+    def trigger(self):
+        # Run again as soon as possible (e.g. after a model swap)
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self.run_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def run_once(self):
+        started = time.perf_counter()
+        try:
+            details = self._probe() or {}
+            result = dict(details, ok=True)
+        except Exception as e:
+            result = {'ok': False, 'error': str(e)}
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        result['at'] = round(time.time(), 3)
+
+        self.runs += 1
+        previous = self.result
+        if not result['ok']:
+            self.failures += 1
+            # Logged when it starts failing (or fails differently), not on
+            # every run of a long-running fallback instance
+            if self._log is not None and (previous is None or previous.get('error') != result['error']):
+                self._log.warning('canary_failed', canary=self.name, error=result['error'])
+        self.result = result
+        return result
+
+    def passing(self):
+        result = self.result
+        if result is None or not result['ok']:
+            return False
+        return time.time() - result['at'] <= self.interval * STALE_INTERVALS
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last': self.result,
+        }
+
+
+def queue_depth(server, batcher=None):
+    # Connections waiting for a handler thread and requests waiting for the
+    # micro-batcher, in this process
+    depth = getattr(server, 'queue_depth', None)
+    return {
+        'connections': depth() if depth is not None else 0,
+        'batcher': batcher.stats()['queued'] if batcher is not None else 0,
+    }
+
+
+def readiness(reloader, canary, queue=None, breaker=None):
+    # (ready, body) for /api/ready
+    state = reloader.current
+    result = canary.result
+    if reloader.loading:
+        status = 'loading'
+    elif not state.loaded:
+        status = 'fallback'
+    elif breaker is not None and breaker.is_open:
+        status = 'circuit_open'
+    elif result is None or result.get('model_version', state.version) != state.version:
+        # No canary has run against this model version yet
+        status = 'canary_pending'
+    elif not result['ok']:
+        status = 'canary_failed'
+    elif not canary.passing():
+        status = 'canary_stale'
+    else:
+        status = 'ready'
+
+    body = {
+        'ready': status == 'ready',
+        'status': status,
+        'model_version': state.version,
+        'model_loaded': state.loaded,
+        'fallback': not state.loaded and not reloader.loading,
+        'load_ms': round(state.load_ms, 3) if state.load_ms is not None else None,
+        'loaded_at': round(state.loaded_at, 3),
+        'canary': result,
+    }
+    if breaker is not None:
+        body['circuit'] = breaker.stats()
+    if queue is not None:
+        body['queue_depth'] = queue
+    return body['ready'], body
@@ -0,0 +1,146 @@
+# The heuristic risk scorers, as estimator-like objects.
+#
+# Each server carries a hand-written formula it falls back on when no model
+# is available (for the Alzheimer service, whenever alz_model/model.pkl is
+# absent, i.e. on almost every request). They were written for one patient at
+# a time in scalar Python; here each one has a vectorized predict(matrix)
+# returning one 0-100 risk per row of an (n, 7) feature matrix, so they go
+# through the same batch, micro-batcher and cache paths as a real model.
+#
+# Results are identical to the scalar versions, including for NaN and
+# infinite inputs: scalar_max/scalar_min reproduce the argument order
+# semantics of Python's builtin max()/min() (the first argument wins unless
+# the second is strictly greater/smaller), which np.clip/np.maximum do not.
+#
+# The formulas are written once and evaluated either on columns (arrays) or,
+# for a single patient, on plain floats: a dozen NumPy calls on one-element
+# arrays cost more than the arithmetic itself.
+import numpy as np
+
+
+def scalar_max(first, second):
+    # Python's max(first, second), elementwise over arrays
+    if isinstance(first, float) and isinstance(second, float):
+        return max(first, second)
+    return np.where(second > first, second, first)
+
+
+def scalar_min(first, second):
+    # Python's min(first, second), elementwise over arrays
+    if isinstance(first, float) and isinstance(second, float):
+        return min(first, second)
+    return np.where(second < first, second, first)
+
+
+def percent(values):
+    # max(0, min(100, values)): onto a 0-100 scale
+    return scalar_max(0.0, scalar_min(100.0, values))
+
+
+class HeuristicModel:
+    # Estimator-like: fit() is a no-op, predict() takes an (n, 7) matrix
+    name = 'heuristic'
+    n_features_in_ = 7
+
+    def fit(self, features, target=None):
+        return self
+
+    def predict(self, features):
+        features = np.asarray(features, dtype=float).reshape(-1, self.n_features_in_)
+        if len(features) == 1:
+            return np.array([self._risk(features[0].tolist())], dtype=float)
+        return np.asarray(self._risk(features.T), dtype=float).reshape(-1)
+
+    def predict_one(self, features):
+        # One patient's feature list, for the single-connection servers
+        return float(self._risk([float(value) for value in features]))
+
+    def _risk(self, columns):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+class AlzheimerFallback(HeuristicModel):
+    # fallback_predict_risk() of pkl_model_server.py: the average of seven
+    # unbounded factors, clamped to 0-100
+    name = 'alzheimer_fallback'
+
+    def _risk(self, columns):
+        hippocampus_volume, cortical_thickness, ventricle_volume, white_matter_hyperintensities, \
+            brain_glucose_metabolism, amyloid_deposition, tau_protein_level = columns
+
+        risk_score = (
+            scalar_max(0.0, (4.5 - hippocampus_volume) * 15) +
+            scalar_max(0.0, (3.5 - cortical_thickness) * 20) +
+            scalar_max(0.0, (ventricle_volume - 15) * 0.8) +
+            white_matter_hyperintensities * 3 +
+            scalar_max(0.0, (7.0 - brain_glucose_metabolism) * 10) +
+            amyloid_deposition * 12 +
+            tau_protein_level * 15
+        ) / 7
+        return scalar_min(scalar_max(risk_score, 0.0), 100.0)
+
+
+class EnhancedAlzheimerFallback(HeuristicModel):
+    # enhanced_fallback_predict_risk() of the Alzheimer service: a weighted
+    # average of seven 0-100 factors, amplified by 1.3 and capped at 100
+    name = 'enhanced_alzheimer_fallback'
+
+    def _risk(self, columns):
+        hippocampus_volume, cortical_thickness, ventricle_volume, white_matter_hyperintensities, \
+            brain_glucose_metabolism, amyloid_deposition, tau_protein_level = columns
+
+        weighted_score = (
+            percent((4.5 - hippocampus_volume) * 35) * 0.20 +
+            percent((3.5 - cortical_thickness) * 45) * 0.15 +
+            percent((ventricle_volume - 15) * 4) * 0.10 +
+            percent(white_matter_hyperintensities * 15) * 0.10 +
+            percent((7.0 - brain_glucose_metabolism) * 30) * 0.15 +
+            percent(amyloid_deposition * 60) * 0.15 +
+            percent(tau_protein_level * 50) * 0.15
+        )
+        return scalar_min(100.0, weighted_score * 1.3)
+
+
+class DatScanParkinsonHeuristic(HeuristicModel):
+    # predict_risk() of fixed_parkinson_server.py: DaTscan binding ratios
+    # and clinical scores, each on a 0-100 scale, weighted
+    name = 'datscan_parkinson'
+
+    def _risk(self, columns):
+        caudate_r, caudate_l, putamen_r, putamen_l, updrs_score, smell_score, cognitive_score = columns
+
+        return (
+            percent((4.0 - caudate_r) * 25) * 0.15 +
+            percent((4.0 - caudate_l) * 25) * 0.15 +
+            percent((3.0 - putamen_r) * 33) * 0.15 +
+            percent((3.0 - putamen_l) * 33) * 0.15 +
+            percent(updrs_score * 2.5) * 0.15 +
+            percent((40 - smell_score) * 2.5) * 0.15 +
+            percent(cognitive_score * 3.33) * 0.10
+        )
+
+
+class ManualParkinsonRisk(HeuristicModel):
+    # The manual risk the Parkinson service blends with the model (and
+    # answers with on its own when there is no model)
+    name = 'manual_parkinson'
+
+    def _risk(self, columns):
+        caudate_r, caudate_l, putamen_r, putamen_l, updrs, smell, cognitive = columns
+
+        dat_scan_avg = (caudate_r + caudate_l + putamen_r + putamen_l) / 4
+        updrs_factor = updrs / 40  # Normalize UPDRS to 0-1 range (assuming max is 40)
+        smell_factor = 1 - (smell / 40)  # Invert smell test (higher is better)
+        cognitive_factor = cognitive / 30  # Normalize cognitive (assuming max is 30)
+
+        # Lower DAT scan values indicate higher risk
+        dat_scan_risk = percent((4.0 - dat_scan_avg) * 40)
+        updrs_risk = updrs_factor * 100
+        smell_risk = smell_factor * 100
+        cognitive_risk = cognitive_factor * 100
+
+        # Weighted average of all risk factors
+        return (dat_scan_risk * 0.4) + (updrs_risk * 0.3) + (smell_risk * 0.2) + (cognitive_risk * 0.1)
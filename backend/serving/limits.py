@@ -0,0 +1,132 @@
+# Request body limits, read timeouts and per-request deadlines.
+#
+# A handler thread is a scarce resource (SERVER_THREADS per process), so a
+# request body is only read when its Content-Length is within MAX_BODY_BYTES
+# (default 1 MiB), and the whole body has to arrive within READ_TIMEOUT
+# seconds (default 10), however slowly the client trickles it in.
+#
+# Clients can say how long they are prepared to wait with an
+# X-Request-Timeout-Ms header (REQUEST_TIMEOUT_MS sets a default for
+# requests without one; 0, the default, means none). The budget counts from
+# when the request line was read, moved back by the time the connection spent
+# queued for a handler thread if it is the connection's first request (see
+# ServiceHandler.parse_request in serving/handler.py). So time queued for a
+# thread or for the micro-batcher counts against it, time the client left a
+# connection idle does not, and a request whose deadline has passed is
+# rejected before any scaling or inference runs.
+import os
+import socket
+import time
+
+DEFAULT_MAX_BODY_BYTES = 1024 * 1024
+DEFAULT_READ_TIMEOUT = 10.0
+DEADLINE_HEADER = 'X-Request-Timeout-Ms'
+
+# Bytes asked for per read while receiving a body
+READ_CHUNK = 64 * 1024
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+MAX_BODY_BYTES = int(_env_float('MAX_BODY_BYTES', DEFAULT_MAX_BODY_BYTES))
+READ_TIMEOUT = max(0.1, _env_float('READ_TIMEOUT', DEFAULT_READ_TIMEOUT))
+DEFAULT_REQUEST_TIMEOUT_MS = max(0.0, _env_float('REQUEST_TIMEOUT_MS', 0))
+
+
+class RequestRejected(Exception):
+    # Turned into an error response with `status`; `outcome` is the label
+    # used in logs and metrics
+    status = 400
+    outcome = 'rejected'
+
+    def __init__(self, message, status=None, outcome=None):
+        super().__init__(message)
+        if status is not None:
+            self.status = status
+        if outcome is not None:
+            self.outcome = outcome
+
+
+class DeadlineExceeded(RequestRejected):
+    status = 504
+    outcome = 'deadline_exceeded'
+
+    def __init__(self, message='Deadline exceeded'):
+        super().__init__(message)
+
+
+def request_deadline(headers, received_at):
+    # Monotonic time by which the request must be answered, or None
+    value = headers.get(DEADLINE_HEADER)
+    if value is None:
+        budget_ms = DEFAULT_REQUEST_TIMEOUT_MS
+    else:
+        try:
+            budget_ms = float(value)
+        except ValueError:
+            raise RequestRejected(f'Invalid {DEADLINE_HEADER} header', 400, 'invalid_deadline')
+        if budget_ms != budget_ms or budget_ms < 0:
+            raise RequestRejected(f'Invalid {DEADLINE_HEADER} header', 400, 'invalid_deadline')
+    if not budget_ms:
+        return None
+    return received_at + budget_ms / 1000
+
+
+def check_deadline(deadline):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded()
+
+
+def read_body(handler, max_bytes=None, timeout=None):
+    # The request body, read within `timeout` seconds in total; the socket
+    # timeout is restored afterwards so keep-alive idling is unaffected
+    if max_bytes is None:
+        max_bytes = MAX_BODY_BYTES
+    if timeout is None:
+        timeout = READ_TIMEOUT
+
+    headers = handler.headers
+    length = headers.get('Content-Length')
+    if length is None or headers.get('Transfer-Encoding'):
+        handler.close_connection = True
+        raise RequestRejected('Content-Length required', 411, 'length_required')
+    try:
+        length = int(length)
+    except ValueError:
+        length = -1
+    if length < 0:
+        handler.close_connection = True
+        raise RequestRejected('Invalid Content-Length', 400, 'bad_length')
+    if length > max_bytes:
+        # Not worth reading just to throw away
+        handler.close_connection = True
+        raise RequestRejected(f'Request body larger than {max_bytes} bytes', 413, 'body_too_large')
+
+    connection = handler.connection
+    previous = connection.gettimeout()
+    give_up = time.monotonic() + timeout
+    chunks = []
+    remaining = length
+    try:
+        while remaining:
+            left = give_up - time.monotonic()
+            if left <= 0:
+                raise socket.timeout()
+            connection.settimeout(left)
+            chunk = handler.rfile.read1(min(remaining, READ_CHUNK))
+            if not chunk:
+                handler.close_connection = True
+                raise RequestRejected('Incomplete request body', 400, 'incomplete_body')
+            chunks.append(chunk)
+            remaining -= len(chunk)
+    except socket.timeout:
+        handler.close_connection = True
+        raise RequestRejected('Timed out reading the request body', 408, 'read_timeout')
+    finally:
+        connection.settimeout(previous)
+    return b''.join(chunks)
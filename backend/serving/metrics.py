@@ -0,0 +1,364 @@
+# Prometheus text-format metrics for the prediction services.
+#
+# Every metric keeps its values in per-thread shards: a handler thread only
+# ever touches its own list, so recording a count or a latency takes no lock
+# at all. A scrape of /metrics sums the shards, which is the only place a
+# lock is taken (to copy the shard list). That keeps the instrumentation
+# cheap enough to leave on in production.
+#
+# In prefork mode every worker process has its own registry, so a scrape
+# reports the worker that happened to accept it (the 'pid' label tells them
+# apart). Models hosted in the same process (serving/registry.py) share one
+# registry: each model's metrics carry its 'service' label and are rendered
+# under the same metric families.
+import bisect
+import os
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds, from 50 microseconds up to 2.5 seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Request stages in pipeline order. The handlers mark read/parse/extract,
+# score (everything between extraction and the response, including cache
+# lookups and batching waits) and serialize/respond; score_matrix() times
+# scale/inference/blend once per model call, which may cover several requests
+STAGES = ('read', 'parse', 'extract', 'score', 'scale', 'inference', 'blend', 'serialize', 'respond')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+class _Shards:
+    # One list of `size` numbers per thread, summed on read
+    def __init__(self, size):
+        self.size = size
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def mine(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = [0] * self.size
+            with self._lock:
+                self._all.append(values)
+            self._local.values = values
+            return values
+
+    def totals(self):
+        with self._lock:
+            shards = list(self._all)
+        totals = [0] * self.size
+        for values in shards:
+            for i, value in enumerate(values):
+                totals[i] += value
+        return totals
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._children = {}
+        self._children_lock = threading.Lock()
+
+    def _child(self, values):
+        child = self._children.get(values)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        return _Shards(1)
+
+    def samples(self, const_labels):
+        for values, shards in list(self._children.items()):
+            yield self.name, _format_labels(self.labels, values, const_labels), shards.totals()[0]
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self, const_labels):
+        return [f'{name}{labels} {_format_value(value)}' for name, labels, value in self.samples(const_labels)]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self._child(labels).mine()[0] += amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        self._child(labels).mine()[0] += amount
+
+    def dec(self, *labels, amount=1):
+        self._child(labels).mine()[0] -= amount
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        # One slot per bucket, one for +Inf, then the running sum
+        return _Shards(len(self.buckets) + 2)
+
+    def observe(self, value, *labels):
+        values = self._child(labels).mine()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def samples(self, const_labels):
+        for values, shards in list(self._children.items()):
+            totals = shards.totals()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), totals[:-1]):
+                cumulative += count
+                le = (('le', _format_value(float(bound))),)
+                yield f'{self.name}_bucket', _format_labels(self.labels, values, tuple(const_labels) + le), cumulative
+            yield f'{self.name}_sum', _format_labels(self.labels, values, const_labels), totals[-1]
+            yield f'{self.name}_count', _format_labels(self.labels, values, const_labels), cumulative
+
+
+class _Callback(_Metric):
+    # A value read from elsewhere (cache, batcher, queue) at scrape time
+    def __init__(self, name, help_text, kind, read):
+        super().__init__(name, help_text)
+        self.kind = kind
+        self._read = read
+
+    def samples(self, const_labels):
+        try:
+            value = self._read()
+        except Exception:
+            return
+        yield self.name, _format_labels((), (), const_labels), value
+
+
+class Registry:
+    def __init__(self, const_labels=None, metrics=None):
+        self.const_labels = dict(const_labels or {})
+        # (metric, const labels) for every metric in this registry and the
+        # ones scoped from it
+        self._metrics = [] if metrics is None else metrics
+
+    def scoped(self, const_labels):
+        # A view adding metrics with extra constant labels to this registry
+        return Registry(dict(self.const_labels, **const_labels), self._metrics)
+
+    def _add(self, metric):
+        self._metrics.append((metric, tuple(self.const_labels.items())))
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def callback(self, name, help_text, read, kind='gauge'):
+        return self._add(_Callback(name, help_text, kind, read))
+
+    def render(self):
+        # One HELP/TYPE header per metric family, whichever scopes it has
+        pid = (('pid', os.getpid()),)
+        families = {}
+        for metric, const_labels in list(self._metrics):
+            families.setdefault(metric.name, []).append((metric, const_labels + pid))
+        lines = []
+        for family in families.values():
+            lines.extend(family[0][0].header())
+            for metric, const_labels in family:
+                lines.extend(metric.render(const_labels))
+        return '\n'.join(lines) + '\n'
+
+
+class PredictionMetrics:
+    # The standard set of metrics for one prediction service. `routes` are
+    # the paths worth their own label (anything else is reported as 'other')
+    # and `fallback_labels` the model_used values that mean the real model
+    # was not used.
+    def __init__(self, service, routes=(), fallback_labels=(), registry=None):
+        # registry: a process-wide Registry shared with other hosted models
+        self.registry = (registry or Registry()).scoped({'service': service})
+        self.routes = frozenset(routes)
+        self.fallback_labels = frozenset(fallback_labels)
+
+        self.stage_seconds = self.registry.histogram(
+            'prediction_stage_seconds', 'Time spent in each request stage', ('stage',))
+        self.requests = self.registry.counter(
+            'prediction_requests_total', 'Requests handled, by route and outcome', ('route', 'outcome'))
+        self.errors = self.registry.counter(
+            'prediction_errors_total', 'Requests that did not produce a prediction', ('route', 'outcome'))
+        self.results = self.registry.counter(
+            'prediction_results_total', 'Predictions returned, by model_used', ('model_used',))
+        self.fallbacks = self.registry.counter(
+            'prediction_fallbacks_total', 'Predictions made without the real model', ('model_used',))
+        self.in_flight = self.registry.gauge(
+            'prediction_in_flight_requests', 'Requests currently being handled', ('route',))
+        self.preflights = self.registry.counter(
+            'prediction_cors_preflight_requests_total', 'CORS preflight (OPTIONS) requests, by outcome',
+            ('outcome',))
+
+    def route(self, path):
+        return path if path in self.routes else 'other'
+
+    def observe_stage(self, stage, seconds):
+        self.stage_seconds.observe(seconds, stage)
+
+    def observe_timings(self, timings):
+        for stage, ms in timings.stages.items():
+            self.stage_seconds.observe(ms / 1000, stage)
+
+    def observe_request(self, path, outcome, timings=None):
+        route = self.route(path)
+        self.requests.inc(route, outcome)
+        if outcome != 'ok':
+            self.errors.inc(route, outcome)
+        if timings is not None:
+            self.observe_timings(timings)
+
+    def observe_preflight(self, allowed):
+        self.preflights.inc('allowed' if allowed else 'rejected')
+
+    def observe_results(self, responses):
+        for response in responses:
+            model_used = response.get('model_used') if isinstance(response, dict) else None
+            if model_used is None:
+                continue
+            self.results.inc(model_used)
+            if model_used in self.fallback_labels:
+                self.fallbacks.inc(model_used)
+
+    def observe_result_count(self, model_used, count):
+        # observe_results() for `count` rows answered by the same model
+        if count:
+            self.results.inc(model_used, amount=count)
+            if model_used in self.fallback_labels:
+                self.fallbacks.inc(model_used, amount=count)
+
+    def track(self, path):
+        return _InFlight(self.in_flight, self.route(path))
+
+    def watch_batcher(self, batcher):
+        if batcher is None:
+            return
+        stat = lambda name: lambda: batcher.stats()[name]
+        self.registry.callback('prediction_batches_total', 'Micro-batches scored', stat('batches'), 'counter')
+        self.registry.callback('prediction_batched_requests_total', 'Requests scored through the micro-batcher',
+                               stat('requests'), 'counter')
+        self.registry.callback('prediction_batcher_queued', 'Requests waiting for the micro-batcher', stat('queued'))
+        self.registry.callback('prediction_batcher_expired_total', 'Requests whose deadline passed in the batch queue',
+                               stat('expired'), 'counter')
+
+    def watch_reloader(self, reloader):
+        self.registry.callback('prediction_model_reloads_total', 'Model versions swapped in without a restart',
+                               lambda: reloader.reloads, 'counter')
+        self.registry.callback('prediction_model_reload_failures_total', 'Reloads rejected by loading or warm-up',
+                               lambda: reloader.failures, 'counter')
+        self.registry.callback('prediction_model_loaded_timestamp_seconds', 'When the serving model version was loaded',
+                               lambda: reloader.current.loaded_at)
+
+    def watch_breaker(self, breaker):
+        self.registry.callback('prediction_circuit_open', 'Whether the inference circuit breaker is open (1) or closed (0)',
+                               lambda: 1 if breaker.is_open else 0)
+        self.registry.callback('prediction_circuit_opens_total', 'Times the inference circuit breaker opened',
+                               lambda: breaker.opens, 'counter')
+        self.registry.callback('prediction_circuit_short_circuited_total',
+                               'Scoring calls sent straight to the fallback while the breaker was open',
+                               lambda: breaker.short_circuited, 'counter')
+        self.registry.callback('prediction_circuit_probes_total', 'Background probes run while the breaker was open',
+                               lambda: breaker.probes, 'counter')
+
+    def watch_readiness(self, is_ready, canary):
+        self.registry.callback('prediction_ready', 'Whether /api/ready reports this instance ready (1) or not (0)',
+                               lambda: 1 if is_ready() else 0)
+        self.registry.callback('prediction_canary_runs_total', 'Background canary predictions run',
+                               lambda: canary.runs, 'counter')
+        self.registry.callback('prediction_canary_failures_total', 'Background canary predictions that failed',
+                               lambda: canary.failures, 'counter')
+
+    def render(self):
+        return self.registry.render()
+
+
+class _InFlight:
+    __slots__ = ('gauge', 'route')
+
+    def __init__(self, gauge, route):
+        self.gauge = gauge
+        self.route = route
+
+    def __enter__(self):
+        self.gauge.inc(self.route)
+        return self
+
+    def __exit__(self, *exc):
+        self.gauge.dec(self.route)
+        return False
+
+
+# Per-process objects shared by every hosted model (serving/registry.py),
+# watched once on the process-wide registry
+def watch_cache(registry, cache):
+    stat = lambda name: lambda: cache.stats()[name]
+    registry.callback('prediction_cache_hits_total', 'Prediction cache hits', stat('hits'), 'counter')
+    registry.callback('prediction_cache_misses_total', 'Prediction cache misses', stat('misses'), 'counter')
+    registry.callback('prediction_cache_entries', 'Entries in the prediction cache', stat('size'))
+
+
+def watch_singleflight(registry, flights):
+    registry.callback('prediction_singleflight_leaders_total',
+                      'Predictions computed on behalf of identical in-flight requests',
+                      lambda: flights.leaders, 'counter')
+    registry.callback('prediction_singleflight_collapsed_total',
+                      'Duplicate requests answered by an identical in-flight prediction',
+                      lambda: flights.collapsed, 'counter')
+
+
+def watch_admission(registry, admission):
+    decisions = lambda name: lambda: admission.decisions[name]
+    registry.callback('prediction_admitted_total', 'Prediction requests admitted normally',
+                      decisions('normal'), 'counter')
+    registry.callback('prediction_degraded_total', 'Prediction requests answered by the degraded heuristic',
+                      decisions('degraded'), 'counter')
+    registry.callback('prediction_shed_total', 'Prediction requests refused with 503 under overload',
+                      decisions('rejected'), 'counter')
+    registry.callback('prediction_admission_in_flight', 'Admitted prediction requests not yet answered',
+                      lambda: admission.in_flight)
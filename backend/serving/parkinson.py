@@ -0,0 +1,76 @@
+# Feature extraction and risk calculation for the Parkinson's prediction
+# service. Everything here works on (n, 7) feature matrices so a single
+# prediction and a whole batch go through exactly the same arithmetic.
+import numpy as np
+
+from .heuristics import ManualParkinsonRisk, percent
+from .schema import Field, FeatureSchema, RecordFormat, describe_errors
+
+# Nested format sent by the app, in model feature order. Ranges: DaTscan
+# striatal binding ratios, the MDS-UPDRS part III total, the UPSIT as a
+# percentage and the 0-30 cognitive score the manual risk assumes
+NESTED_FORMAT = RecordFormat('nested', [
+    Field('caudateR', 'datScan', 0, 5),
+    Field('caudateL', 'datScan', 0, 5),
+    Field('putamenR', 'datScan', 0, 5),
+    Field('putamenL', 'datScan', 0, 5),
+    Field('npdtot', 'updrs', 0, 132),
+    Field('upsitPercentage', 'smellTest', 0, 100, unit='%'),
+    Field('cogchq', 'cognitive', 0, 30),
+])
+
+# Flat format with direct feature names, missing values default to 0. A
+# record without any of the nested format's sections is read this way if it
+# has at least one of these fields; one with neither is rejected
+FLAT_FORMAT = RecordFormat('flat', [
+    Field(name, default=0) for name in ('fo', 'fhi', 'flo', 'jitter', 'shimmer', 'nhr', 'hnr')
+])
+
+SCHEMA = FeatureSchema('parkinson', [NESTED_FORMAT, FLAT_FORMAT])
+
+NESTED_FEATURES = [(field.section, field.name) for field in NESTED_FORMAT.fields]
+FLAT_FEATURES = [field.name for field in FLAT_FORMAT.fields]
+
+NUM_FEATURES = SCHEMA.num_features
+
+# Share of the final risk taken from the model when it gives a probability
+MODEL_WEIGHT = 0.7
+MANUAL_WEIGHT = 0.3
+
+
+def extract_features(data):
+    # One record's features (nested or flat format, see SCHEMA); raises
+    # ValueError listing every field that's missing or not a number
+    features, errors, _ = SCHEMA.extract(data)
+    if features is None:
+        raise ValueError(describe_errors(errors))
+    return features
+
+
+def extract_batch(records):
+    # (matrix, row_index, errors, warnings), see FeatureSchema.extract_batch
+    return SCHEMA.extract_batch(records)
+
+
+# Manual calculation for risk percentage based on input features, so
+# different inputs give different results (see serving/heuristics.py)
+MANUAL_RISK = ManualParkinsonRisk()
+
+
+def manual_risk(features):
+    return MANUAL_RISK.predict(features)
+
+
+def blend_risk(manual, raw_predictions, is_probability):
+    # Blend 70% model, 30% manual where the model gave a usable probability
+    # (0-1); everywhere else rely on the manual calculation. Regression output
+    # is not a probability and is never blended.
+    risk = np.array(manual, dtype=float)
+    if raw_predictions is not None and is_probability:
+        raw = np.asarray(raw_predictions, dtype=float)
+        usable = (raw >= 0) & (raw <= 1)
+        risk = np.where(usable, (raw * 100 * MODEL_WEIGHT) + (risk * MANUAL_WEIGHT), risk)
+
+    # Ensure risk is between 0 and 100
+    return percent(risk)
+
@@ -0,0 +1,188 @@
+# Model registry: the prediction models one server process hosts.
+#
+# Each service describes its model as a HostedModel (routes, feature schema,
+# scoring functions, reloader, canary, breaker, batcher, metrics) and
+# registers it in REGISTRY when its module is imported; PredictionHandler
+# (serving/server.py) routes every request to the model owning its path.
+# Run on its own a service hosts just its model, exactly as before;
+# backend/inference_server.py imports several services so one process, with
+# one copy of numpy/scikit-learn/xgboost and one cold start, serves all of
+# them behind their usual routes.
+#
+# What belongs to the process rather than to a model is created once and
+# shared by every hosted model:
+#   - the handler thread pool (serve(), serving/workers.py)
+#   - the prediction cache; keys carry the model name, and a reload of any
+#     model drops it
+#   - single-flight, keyed the same way
+#   - admission control, which sees the load of the whole process
+#   - the metrics registry; each model's metrics carry service=<name>, and
+#     the shared objects above are reported once, without it
+# Every model keeps its own micro-batcher thread, model versions and breaker,
+# so a slow or failing model never holds up another.
+from .admission import AdmissionController
+from .cache import PredictionCache
+from .health import readiness
+from .metrics import Registry, watch_admission, watch_cache, watch_singleflight
+from .singleflight import SingleFlight
+
+_metrics = None
+_cache = None
+_flights = None
+_admission = None
+
+
+def metrics_registry():
+    global _metrics
+    if _metrics is None:
+        _metrics = Registry()
+    return _metrics
+
+
+def shared_cache(artifacts=()):
+    # artifacts: the calling model's files; a change to any hosted model's
+    # files drops the cache
+    global _cache
+    if _cache is None:
+        _cache = PredictionCache(artifacts=artifacts)
+        watch_cache(metrics_registry(), _cache)
+    else:
+        _cache.watch(artifacts)
+    return _cache
+
+
+def shared_flights():
+    global _flights
+    if _flights is None:
+        _flights = SingleFlight()
+        watch_singleflight(metrics_registry(), _flights)
+    return _flights
+
+
+def shared_admission():
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+        watch_admission(metrics_registry(), _admission)
+    return _admission
+
+
+class HostedModel:
+    # One model as the shared handler sees it. The scoring functions are the
+    # service's own:
+    #   score_one(features, deadline, degraded) -> response dict
+    #   score_risk(matrix, degraded) -> (risk, model_used, confidence)
+    #   score_stream_chunk(records) -> one result dict per record
+    #   predict_batch(records, deadline, degraded) -> batch response, for
+    #     models with a batch route
+    #   wait_for_model(deadline) blocks while a fast-start load is pending
+    # describe() gives the model's part of /api/health, on top of the
+    # standard fields. fallback_expected() says whether the deployment has
+    # no model file to load, in which case running on the heuristic fallback
+    # is the configured state and counts as ready; a model file that exists
+    # but failed to load still does not
+    def __init__(self, name, message, prediction_route, stream_route, schema, matrix_format,
+                 score_one, score_risk, score_stream_chunk, wait_for_model,
+                 reloader, canary, breaker, batcher, metrics, startup, log,
+                 batch_route=None, predict_batch=None, describe=None, fallback_expected=None):
+        self.name = name
+        self.message = message
+        self.prediction_route = prediction_route
+        self.batch_route = batch_route
+        self.stream_route = stream_route
+        self.schema = schema
+        self.matrix_format = matrix_format
+        self.score_one = score_one
+        self.score_risk = score_risk
+        self.score_stream_chunk = score_stream_chunk
+        self.predict_batch = predict_batch
+        self.wait_for_model = wait_for_model
+        self.reloader = reloader
+        self.canary = canary
+        self.breaker = breaker
+        self.batcher = batcher
+        self.metrics = metrics
+        self.startup = startup
+        self.log = log
+        self._describe = describe
+        self.fallback_expected = fallback_expected
+
+        # Routes that go through admission control, and those that take a
+        # binary feature matrix
+        self.routes = tuple(route for route in (prediction_route, batch_route, stream_route) if route)
+        self.matrix_routes = tuple(route for route in (prediction_route, batch_route) if route)
+
+    def ready(self):
+        return self.readiness()[0]
+
+    def readiness(self, queue=None):
+        ready, body = readiness(self.reloader, self.canary, queue, self.breaker)
+        if body['fallback'] and self.fallback_expected is not None and self.fallback_expected():
+            body['ready'] = ready = True
+            body['fallback_expected'] = True
+        return ready, body
+
+    def describe(self):
+        state = self.reloader.current
+        description = {
+            'message': self.message,
+            'ready': self.ready(),
+        }
+        if self._describe is not None:
+            description.update(self._describe())
+        description.update({
+            'model_version': state.version,
+            'model': self.reloader.stats(),
+            'canary': self.canary.stats(),
+            'circuit': self.breaker.stats(),
+            'startup': self.startup.describe(),
+            'batching': self.batcher.stats() if self.batcher is not None else None,
+            'schema': self.schema.describe(),
+            'binary': self.matrix_format.describe(),
+        })
+        return description
+
+    def __repr__(self):
+        return f"HostedModel({self.name!r})"
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.models = []
+        self._by_route = {}
+
+    def register(self, model):
+        for route in model.routes:
+            owner = self._by_route.get(route)
+            if owner is not None:
+                raise ValueError(f'{route} is served by both {owner.name} and {model.name}')
+        self.models.append(model)
+        for route in model.routes:
+            self._by_route[route] = model
+        return model
+
+    def for_path(self, path):
+        # The model owning a prediction route, or None
+        return self._by_route.get(path)
+
+    def get(self, name):
+        # The model registered as `name`, or None
+        for model in self.models:
+            if model.name == name:
+                return model
+        return None
+
+    @property
+    def default(self):
+        # Requests that aren't for a particular model (health, admin, CORS
+        # preflights) are logged and counted under the first model
+        return self.models[0]
+
+    def __iter__(self):
+        return iter(self.models)
+
+    def __len__(self):
+        return len(self.models)
+
+
+REGISTRY = ModelRegistry()
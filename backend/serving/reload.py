@@ -0,0 +1,241 @@
+# Zero-downtime hot reload of model artifacts.
+#
+# A service keeps everything one model version needs (model, scalers, the
+# scoring adapter, its version id) in a single LoadedModel and reads
+# `reloader.current` once per request or batch. A reload builds and
+# warm-tests a complete new LoadedModel in the background and then replaces
+# that one reference, so the swap is atomic: requests already running finish
+# on the old version, new ones see the new version, and the old version is
+# freed as soon as the last request holding it returns. Only one reload runs
+# at a time, so at most two versions are ever resident.
+#
+# Reloads are triggered by
+#   - a change to any watched artifact file (polled every MODEL_WATCH_INTERVAL
+#     seconds, default 5; 0 turns polling off)
+#   - SIGHUP (the prefork parent forwards it to every worker)
+#   - POST /api/admin/reload with an X-Admin-Token header matching ADMIN_TOKEN
+#     (the endpoint is disabled when ADMIN_TOKEN is unset)
+#
+# In fast-start mode (serving/startup.py) the service starts with a
+# placeholder version and defer_initial_load() makes the watcher thread load
+# the first real one as soon as the server is listening.
+import hmac
+import os
+import signal
+import threading
+import time
+
+from .cache import artifact_stamp
+
+DEFAULT_WATCH_INTERVAL = 5.0
+
+# A changed file must look the same for this long before it is loaded, so a
+# copy still in progress isn't picked up half written
+SETTLE_SECONDS = 0.5
+
+
+class LoadedModel:
+    # One model version; never modified after it is built
+    def __init__(self, version, adapter=None, model=None, scaler=None, scaler_y=None, bundle=None, load_ms=None):
+        self.version = version
+        self.adapter = adapter
+        self.model = model
+        self.scaler = scaler
+        self.scaler_y = scaler_y
+        self.bundle = bundle
+        self.load_ms = load_ms
+        self.loaded_at = time.time()
+
+    @property
+    def loaded(self):
+        return self.adapter is not None
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'loaded': self.loaded,
+            'method': self.adapter.method if self.adapter is not None else None,
+            'load_ms': round(self.load_ms, 3) if self.load_ms is not None else None,
+            'loaded_at': round(self.loaded_at, 3),
+            'bundle': self.bundle.describe() if self.bundle is not None else None,
+        }
+
+
+class ModelReloader:
+    # load() returns a new LoadedModel (or raises), warm_up(state) runs a
+    # test prediction on it (and raises if it is unusable), on_swap(old, new)
+    # runs after the swap, e.g. to clear caches
+    def __init__(self, name, initial, load, warm_up, artifacts, on_swap=None, interval=None, log=None):
+        if interval is None:
+            interval = float(os.environ.get('MODEL_WATCH_INTERVAL', DEFAULT_WATCH_INTERVAL))
+
+        self.name = name
+        self.current = initial
+        self.artifacts = [path for path in artifacts if path]
+        self.interval = max(0.0, interval)
+        self._load = load
+        self._warm_up = warm_up
+        self._on_swap = on_swap
+        self._log = log
+
+        self._reload_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stamp = artifact_stamp(self.artifacts)
+        # Cleared while a deferred initial load is pending
+        self._settled = threading.Event()
+        self._settled.set()
+        self._initial_load = None
+        self._initial_loader = None
+
+        self.reloads = 0
+        self.failures = 0
+        self.last_result = None
+
+        _reloaders.append(self)
+
+    def start(self):
+        # Called in the serving process (after a prefork fork)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._watch, name=f'{self.name}-reload', daemon=True)
+                self._thread.start()
+
+    def request_reload(self):
+        # Safe to call from a signal handler: the watcher thread does the work
+        self._requested = True
+        self._wake.set()
+
+    _requested = False
+
+    def defer_initial_load(self, on_done=None, load=None):
+        # The watcher loads the first version when it starts, with `load`
+        # instead of the reload function if given; on_done(result) runs once
+        # that attempt has finished, successfully or not
+        self._initial_load = on_done or (lambda result: None)
+        self._initial_loader = load
+        self._settled.clear()
+
+    @property
+    def loading(self):
+        return not self._settled.is_set()
+
+    def wait_loaded(self, timeout=None):
+        # True once no initial load is pending
+        return self._settled.wait(timeout)
+
+    def _run_initial_load(self):
+        on_done, self._initial_load = self._initial_load, None
+        result = None
+        try:
+            result = self.reload('startup', self._initial_loader)
+        except Exception as e:
+            self._emit('error', 'initial_load_failed', error=str(e))
+        finally:
+            self._settled.set()
+        on_done(result)
+
+    def _changed(self):
+        if not self.interval:
+            return False
+        stamp = artifact_stamp(self.artifacts)
+        if stamp == self._stamp:
+            return False
+        time.sleep(SETTLE_SECONDS)
+        return artifact_stamp(self.artifacts) == stamp
+
+    def _watch(self):
+        if self._initial_load is not None:
+            self._run_initial_load()
+        while True:
+            self._wake.wait(self.interval or None)
+            self._wake.clear()
+            requested, self._requested = self._requested, False
+            try:
+                if requested:
+                    self.reload('signal')
+                elif self._changed():
+                    self.reload('artifacts changed')
+            except Exception as e:
+                # The watcher must survive anything a reload throws
+                self._emit('error', 'reload_watch_failed', error=str(e))
+
+    def _emit(self, level, event, **fields):
+        if self._log is not None:
+            self._log.log(level, event, model=self.name, **fields)
+
+    def reload(self, reason='manual', load=None):
+        # Build (with `load`, default the reloader's), warm-test and swap in a
+        # new version; the current one keeps serving throughout and stays if
+        # anything goes wrong
+        with self._reload_lock:
+            started = time.perf_counter()
+            stamp = artifact_stamp(self.artifacts)
+            previous = self.current
+            result = {'reason': reason, 'previous_version': previous.version, 'at': round(time.time(), 3)}
+            try:
+                candidate = (load or self._load)()
+                loaded_at = time.perf_counter()
+                result['load_ms'] = round((loaded_at - started) * 1000, 3)
+                self._warm_up(candidate)
+                result['warm_up_ms'] = round((time.perf_counter() - loaded_at) * 1000, 3)
+            except Exception as e:
+                self.failures += 1
+                self._stamp = stamp
+                result.update(reloaded=False, version=previous.version, error=str(e))
+                self._emit('error', 'model_reload_failed', **result)
+                self.last_result = result
+                return result
+
+            self._stamp = stamp
+            if candidate.version == previous.version and previous.loaded:
+                result.update(reloaded=False, version=previous.version, unchanged=True)
+            else:
+                self.current = candidate
+                if self._on_swap is not None:
+                    self._on_swap(previous, candidate)
+                self.reloads += 1
+                result.update(reloaded=True, version=candidate.version)
+            # Don't keep either version alive from here
+            previous = candidate = None
+
+            result['seconds'] = round(time.perf_counter() - started, 3)
+            self._emit('info', 'model_reloaded' if result['reloaded'] else 'model_reload_skipped', **result)
+            self.last_result = result
+            return result
+
+    def stats(self):
+        return {
+            'current': self.current.describe(),
+            'loading': self.loading,
+            'watching': self.artifacts if self.interval else [],
+            'watch_interval': self.interval,
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_result': self.last_result,
+        }
+
+
+_reloaders = []
+
+
+def _on_sighup(signum, frame):
+    for reloader in _reloaders:
+        reloader.request_reload()
+
+
+def install_reload_signal():
+    # Must run in the main thread (i.e. at import time of the server module)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, _on_sighup)
+
+
+def admin_authorized(headers):
+    # Admin calls need ADMIN_TOKEN to be configured and sent back verbatim
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        return False
+    return hmac.compare_digest(headers.get('X-Admin-Token', ''), token)
@@ -0,0 +1,19 @@
+# Risk level bands shared by the Parkinson's and Alzheimer's services.
+import numpy as np
+
+# Risk level thresholds (percent) and their display colors
+RISK_LEVELS = np.array(['Low', 'Moderate', 'High'])
+RISK_COLORS = np.array(['#4CAF50', '#FF9800', '#F44336'])
+MODERATE_THRESHOLD = 30
+HIGH_THRESHOLD = 60
+
+
+def risk_level_codes(risk):
+    # Index 0/1/2 for Low/Moderate/High, thresholds are exclusive
+    risk = np.asarray(risk)
+    return (risk > MODERATE_THRESHOLD).astype(int) + (risk > HIGH_THRESHOLD)
+
+
+def risk_levels(risk):
+    level = risk_level_codes(risk)
+    return RISK_LEVELS[level], RISK_COLORS[level]
@@ -0,0 +1,342 @@
+# Declarative feature schemas: what each service reads from a request
+# record, and the ranges its values are expected in.
+#
+# A schema is a list of record formats (the Parkinson service takes a nested
+# datScan/updrs/smellTest/cognitive record or a flat fo..hnr one), each a list
+# of Fields in model feature order. The format of a record is decided once,
+# from its top-level keys: the first format any of whose keys (sections for
+# nested fields, names for flat ones) the record has. A record with none of
+# them (an empty object, or a nested record whose sections are all
+# misspelled) is rejected rather than read as a flat record full of default
+# zeros; a schema with a single format reports its missing fields instead.
+# Each format is compiled into an extractor that walks the record with
+# dict.get and type checks, so a bad record gives one error per field
+#
+#   {'updrs.npdtot': 'required', 'datScan.caudateR': 'must be a number'}
+#
+# rather than the first KeyError/TypeError, and a partial nested record is
+# reported as such instead of being retried as a flat one full of zeros.
+#
+# NaN and infinite values (JSON NaN/Infinity, or strings such as "nan" and
+# "1e999") are field errors in every mode. Range checks use each field's
+# documented range (low/high, see the services' schemas); batches are checked
+# with a few array comparisons over the whole feature matrix. What happens to
+# a finite value outside its range is set by FEATURE_RANGE_CHECK:
+#   warn    (default) score it and list the fields under 'warnings' in the
+#           result
+#   reject  don't score the record, report the fields as errors
+#   off     no range checks
+import math
+import os
+import sys
+
+import numpy as np
+
+from .limits import RequestRejected
+
+MODES = ('warn', 'reject', 'off')
+DEFAULT_MODE = 'warn'
+
+
+def range_check_mode():
+    mode = os.environ.get('FEATURE_RANGE_CHECK', DEFAULT_MODE).strip().lower()
+    return mode if mode in MODES else DEFAULT_MODE
+
+
+# Field.default for fields a record must have
+REQUIRED = object()
+
+FLOAT_MAX = sys.float_info.max
+
+# Error key for a record that isn't a JSON object at all, or matches no
+# format
+RECORD = 'record'
+
+NOT_FINITE = 'must be finite'
+
+
+def _number(value):
+    # float(value) for a JSON number or numeric string, None for anything
+    # else
+    kind = type(value)
+    if kind is float:
+        return value
+    if kind is int or kind is bool:
+        return float(value)
+    if kind is str:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+class Field:
+    def __init__(self, name, section=None, low=None, high=None, default=REQUIRED, unit=''):
+        self.name = name
+        self.section = section
+        self.path = f'{section}.{name}' if section else name
+        self.low = -math.inf if low is None else float(low)
+        self.high = math.inf if high is None else float(high)
+        self.default = default
+        self.unit = unit
+
+    def describe(self):
+        description = {'field': self.path, 'required': self.default is REQUIRED}
+        if self.default is not REQUIRED:
+            description['default'] = self.default
+        if math.isfinite(self.low) or math.isfinite(self.high):
+            description['range'] = [self.low, self.high]
+        if self.unit:
+            description['unit'] = self.unit
+        return description
+
+    def range_error(self, value):
+        if self.unit:
+            return f'outside the documented range {self.low:g}-{self.high:g} {self.unit}'
+        return f'outside the documented range {self.low:g}-{self.high:g}'
+
+    def __repr__(self):
+        return f"Field({self.path!r})"
+
+
+class RecordFormat:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = list(fields)
+        # Top-level keys that identify the format
+        self.keys = frozenset(field.section or field.name for field in self.fields)
+        # Unbounded ends are checked against the largest finite float, so a
+        # single comparison also catches NaN and infinities
+        self.bounds = tuple((max(field.low, -FLOAT_MAX), min(field.high, FLOAT_MAX)) for field in self.fields)
+        self.low = np.array([low for low, _ in self.bounds])
+        self.high = np.array([high for _, high in self.bounds])
+        self.extract = self._compile()
+
+    def _compile(self):
+        # extract(record) -> (features, errors): the float features in model
+        # order, or None and {path: message}. Records whose values are all
+        # JSON numbers take the fast path: one dict.get per section and
+        # field, and a type check per value
+        groups = []
+        for field in self.fields:
+            if not groups or groups[-1][0] != field.section:
+                groups.append((field.section, []))
+            groups[-1][1].append((field.name, field.default))
+        groups = tuple((section, tuple(names)) for section, names in groups)
+        steps = tuple((field.section, field.name, field.path, field.default) for field in self.fields)
+
+        def extract(record):
+            features = []
+            for section, names in groups:
+                container = record if section is None else record.get(section)
+                if type(container) is not dict:
+                    return extract_slowly(record)
+                for name, default in names:
+                    value = container.get(name, default)
+                    kind = type(value)
+                    if kind is float:
+                        features.append(value)
+                    elif kind is int:
+                        features.append(float(value))
+                    else:
+                        return extract_slowly(record)
+            return features, None
+
+        def extract_slowly(record):
+            # Numeric strings, and every field's error when there are any
+            features = []
+            errors = None
+            for section, name, path, default in steps:
+                container = record
+                if section is not None:
+                    container = record.get(section)
+                    if type(container) is not dict:
+                        errors = errors or {}
+                        errors[path] = 'required' if container is None else f'{section} must be an object'
+                        continue
+                value = container.get(name, default)
+                if value is REQUIRED:
+                    errors = errors or {}
+                    errors[path] = 'required'
+                    continue
+                number = _number(value)
+                if number is None:
+                    errors = errors or {}
+                    errors[path] = 'must be a number'
+                    continue
+                features.append(number)
+            if errors:
+                return None, errors
+            return features, None
+
+        return extract
+
+    def check(self, features):
+        # (invalid, out_of_range) for one record: {path: message} for its NaN
+        # and infinite values and for its finite values outside their ranges,
+        # each None when there are none
+        for (low, high), value in zip(self.bounds, features):
+            if not low <= value <= high:
+                break
+        else:
+            return None, None
+        invalid = {}
+        out_of_range = {}
+        for field, (low, high), value in zip(self.fields, self.bounds, features):
+            if not math.isfinite(value):
+                invalid[field.path] = NOT_FINITE
+            elif not low <= value <= high:
+                out_of_range[field.path] = field.range_error(value)
+        return invalid or None, out_of_range or None
+
+    def describe(self):
+        return {'format': self.name, 'fields': [field.describe() for field in self.fields]}
+
+
+class FeatureSchema:
+    def __init__(self, name, formats, mode=None):
+        self.name = name
+        self.formats = list(formats)
+        self.num_features = len(self.formats[0].fields)
+        if any(len(record_format.fields) != self.num_features for record_format in self.formats):
+            raise ValueError(f'Every {name} format needs {self.num_features} fields')
+        self.mode = range_check_mode() if mode is None else mode
+        # The error for a record that matches none of the formats
+        self.no_format = 'has none of the fields of ' + ' or '.join(
+            f"the {record_format.name} format "
+            f"({', '.join(dict.fromkeys(field.section or field.name for field in record_format.fields))})"
+            for record_format in self.formats)
+
+    def detect(self, record):
+        # The format of `record`, from its top-level keys; None when it has
+        # none of any format's keys
+        for record_format in self.formats:
+            if not record_format.keys.isdisjoint(record):
+                return record_format
+        return self.formats[0] if len(self.formats) == 1 else None
+
+    def extract(self, record):
+        # One record: (features, errors, warnings); features is None when the
+        # record can't be scored, warnings None when there are none
+        if type(record) is not dict:
+            return None, {RECORD: 'must be a JSON object'}, None
+        record_format = self.detect(record)
+        if record_format is None:
+            return None, {RECORD: self.no_format}, None
+        features, errors = record_format.extract(record)
+        if errors:
+            return None, errors, None
+        invalid, out_of_range = record_format.check(features)
+        if out_of_range and self.mode == 'reject':
+            invalid = dict(invalid or {}, **out_of_range)
+        if invalid:
+            return None, invalid, None
+        if self.mode == 'warn':
+            return features, None, out_of_range
+        return features, None, None
+
+    def extract_batch(self, records):
+        # Returns the feature matrix for the rows that can be scored, the
+        # index of each of those rows in `records`, {index: {path: message}}
+        # for every other row, and {index: {path: message}} range warnings
+        rows = []
+        row_index = []
+        row_formats = []
+        errors = {}
+        for i, record in enumerate(records):
+            if type(record) is not dict:
+                errors[i] = {RECORD: 'must be a JSON object'}
+                continue
+            record_format = self.detect(record)
+            if record_format is None:
+                errors[i] = {RECORD: self.no_format}
+                continue
+            features, field_errors = record_format.extract(record)
+            if field_errors:
+                errors[i] = field_errors
+                continue
+            rows.append(features)
+            row_index.append(i)
+            row_formats.append(record_format)
+
+        matrix = np.array(rows, dtype=float).reshape(-1, self.num_features)
+        warnings = {}
+        if len(matrix):
+            invalid, out_of_range = self._check_matrix(matrix, row_formats)
+            if self.mode == 'reject':
+                for row, fields in out_of_range.items():
+                    invalid.setdefault(row, {}).update(fields)
+            elif self.mode == 'warn':
+                warnings = {row_index[row]: fields for row, fields in out_of_range.items() if row not in invalid}
+            if invalid:
+                keep = np.ones(len(matrix), dtype=bool)
+                for row, fields in invalid.items():
+                    errors[row_index[row]] = fields
+                    keep[row] = False
+                matrix = matrix[keep]
+                row_index = [i for i, kept in zip(row_index, keep.tolist()) if kept]
+        return matrix, row_index, errors, warnings
+
+    def require_in_range(self, matrix):
+        # Binary requests (serving/binary.py) have nowhere to put warnings or
+        # per-row errors: a NaN or infinite value refuses the whole matrix in
+        # every mode, and in reject mode so does one value out of range
+        if not len(matrix):
+            return
+        invalid, out_of_range = self.check_matrix(matrix)
+        if invalid:
+            row = min(invalid)
+            raise RequestRejected(f'{len(invalid)} rows with non-finite values, first row {row}: '
+                                  f'{describe_errors(invalid[row])}', 400, 'non_finite')
+        if out_of_range and self.mode == 'reject':
+            row = min(out_of_range)
+            raise RequestRejected(f'{len(out_of_range)} rows out of range, first row {row}: '
+                                  f'{describe_errors(out_of_range[row])}', 400, 'out_of_range')
+
+    def check_matrix(self, matrix, record_format=None):
+        # (invalid, out_of_range), each {row: {path: message}}, for a matrix
+        # in `record_format` (the first format by default), e.g. a binary
+        # request
+        return self._check_matrix(matrix, [record_format or self.formats[0]] * len(matrix))
+
+    def _check_matrix(self, matrix, row_formats):
+        if len(self.formats) == 1 or all(row_format is row_formats[0] for row_format in row_formats):
+            low = row_formats[0].low
+            high = row_formats[0].high
+        else:
+            # Mixed formats: each row checked against its own format's ranges
+            low = np.array([row_format.low for row_format in row_formats])
+            high = np.array([row_format.high for row_format in row_formats])
+        bad = ~((matrix >= low) & (matrix <= high))
+        invalid = {}
+        out_of_range = {}
+        for row, column in zip(*np.nonzero(bad)):
+            field = row_formats[row].fields[column]
+            value = float(matrix[row, column])
+            if math.isfinite(value):
+                out_of_range.setdefault(int(row), {})[field.path] = field.range_error(value)
+            else:
+                invalid.setdefault(int(row), {})[field.path] = NOT_FINITE
+        return invalid, out_of_range
+
+    def describe(self):
+        return {
+            'range_check': self.mode,
+            'formats': [record_format.describe() for record_format in self.formats],
+        }
+
+
+def describe_errors(errors):
+    # One line for logs and 'message' fields
+    return '; '.join(f'{path}: {message}' for path, message in errors.items())
+
+
+def invalid_record(errors):
+    # The result for a record that couldn't be scored
+    return {
+        'error': 'Invalid data format',
+        'success': False,
+        'message': f'Could not extract features: {describe_errors(errors)}',
+        'fields': errors,
+    }
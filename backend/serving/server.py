@@ -0,0 +1,355 @@
+# The HTTP handler every prediction service runs.
+#
+# PredictionHandler serves the models registered in a ModelRegistry
+# (serving/registry.py), each behind its own routes:
+#   POST <prediction route>          one record, JSON or a binary feature
+#                                    matrix (serving/binary.py)
+#   POST <batch route>               a list of records, or a binary matrix
+#   POST <stream route>              NDJSON bulk scoring
+#                                    (serving/streaming.py)
+# and answers the process-wide routes:
+#   GET  /api/health, /api/live, /api/ready, /metrics
+#   POST /api/admin/reload           reloads every hosted model
+# With one model registered, health and readiness look exactly as they did
+# for that service alone; with several, /api/health lists each model under
+# 'models' and /api/ready is ready only once every model is.
+# /api/ready?model=<name> reports one model's readiness on its own (404 for
+# a model this process doesn't host). A model running on its fallback
+# because no model file was deployed counts as ready (see HostedModel).
+import json
+import os
+import signal
+import traceback
+from urllib.parse import parse_qs
+
+import numpy as np
+
+from .admission import DEGRADED, REJECTED
+from .binary import CONTENT_TYPE as MATRIX_CONTENT_TYPE
+from .eventlog import Timings
+from .handler import ServiceHandler
+from .health import queue_depth
+from .limits import RequestRejected, check_deadline
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .registry import REGISTRY, metrics_registry, shared_admission, shared_cache, shared_flights
+from .reload import admin_authorized
+from .risk import risk_level_codes
+from .schema import describe_errors, invalid_record
+from .streaming import open_body, stream_ndjson
+from .workers import notify_workers, process_memory
+
+HEALTH_ROUTE = '/api/health'
+LIVE_ROUTE = '/api/live'
+READY_ROUTE = '/api/ready'
+METRICS_ROUTE = '/metrics'
+ADMIN_RELOAD_ROUTE = '/api/admin/reload'
+
+
+class PredictionHandler(ServiceHandler):
+    # HTTP/1.1 keep-alive, Content-Length, precomputed headers and CORS
+    # preflights (CORS_ALLOWED_ORIGINS, CORS_MAX_AGE) come from ServiceHandler
+    # (serving/handler.py)
+    registry = REGISTRY
+
+    # Set per request: the model the route belongs to, and whether admission
+    # control asked for a degraded answer
+    model = None
+    degraded = False
+
+    @property
+    def _owner(self):
+        # The model whose log and metrics a request is recorded under
+        return self.model or self.registry.default
+
+    def on_preflight(self, allowed):
+        self.registry.default.metrics.observe_preflight(allowed)
+
+    def log_message(self, format, *args):
+        # Access log lines go through the async logger instead of stderr
+        self.registry.default.log.debug('access', client=self.client_address[0], message=format % args)
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == HEALTH_ROUTE:
+            self.send_json(self._health())
+        elif path == LIVE_ROUTE:
+            # The process is up and handling requests; nothing else is checked
+            self._send_json({'status': 'alive', 'pid': os.getpid()})
+        elif path == READY_ROUTE:
+            names = parse_qs(query).get('model')
+            if names:
+                model = self.registry.get(names[0])
+                if model is None:
+                    self._send_json({'error': f'Unknown model {names[0]!r}',
+                                     'models': [model.name for model in self.registry]}, status=404)
+                    return
+                ready, response = model.readiness(queue_depth(self.server, model.batcher))
+            else:
+                ready, response = self._readiness()
+            self._send_json(response, status=200 if ready else 503)
+        elif path == METRICS_ROUTE:
+            self.send_body(metrics_registry().render().encode(), METRICS_CONTENT_TYPE)
+        else:
+            self.send_not_found()
+
+    def _health(self):
+        models = self.registry.models
+        shared = {
+            'cache': shared_cache().stats(),
+            'singleflight': shared_flights().stats(),
+            'admission': shared_admission().stats(),
+            'cors': self.cors.describe(),
+            'process': process_memory(),
+        }
+        if len(models) == 1:
+            return dict({'status': 'healthy'}, **models[0].describe(), **shared)
+        return dict({
+            'status': 'healthy',
+            'message': f"Serving {', '.join(model.name for model in models)}",
+            'ready': all(model.ready() for model in models),
+            'models': {model.name: model.describe() for model in models},
+        }, **shared)
+
+    def _readiness(self):
+        models = self.registry.models
+        if len(models) == 1:
+            return models[0].readiness(queue_depth(self.server, models[0].batcher))
+        bodies = {model.name: model.readiness()[1] for model in models}
+        ready = all(body['ready'] for body in bodies.values())
+        not_ready = [name for name, body in bodies.items() if not body['ready']]
+        return ready, {
+            'ready': ready,
+            'status': 'ready' if ready else 'not_ready',
+            'not_ready': not_ready,
+            'models': bodies,
+            'queue_depth': queue_depth(self.server),
+        }
+
+    def _send_json(self, response, timings=None, status=200, headers=()):
+        body = json.dumps(response).encode()
+        if timings is not None:
+            timings.mark('serialize')
+        self.send_body(body, status=status, headers=headers)
+
+    def _admin_reload(self):
+        self.discard_body()
+        if not admin_authorized(self.headers):
+            self._send_json({'error': 'Forbidden', 'success': False}, status=403)
+            return
+        # In prefork mode every worker has its own copy of the model, so the
+        # parent fans a SIGHUP out to all of them instead
+        if notify_workers(signal.SIGHUP):
+            self._send_json({'success': True, 'message': 'Reload requested in all workers'}, status=202)
+            return
+        results = {model.name: model.reloader.reload('admin') for model in self.registry}
+        ok = not any('error' in result for result in results.values())
+        if len(results) == 1:
+            result, = results.values()
+            self._send_json(dict(result, success=ok), status=200 if ok else 500)
+        else:
+            self._send_json({'success': ok, 'models': results}, status=200 if ok else 500)
+
+    def _reject(self, error, timings):
+        # Refused before (or instead of) scoring: too large, too slow, or past
+        # the client's deadline; counted under its own outcome
+        self._finish(error.outcome, timings, error=str(error))
+        self._send_json({'error': str(error), 'success': False}, status=error.status)
+
+    def _fail(self, error, timings):
+        # An unexpected error while scoring
+        self._finish('error', timings, error=str(error), traceback=traceback.format_exc())
+        self._send_json({
+            'error': str(error),
+            'success': False
+        })
+
+    def _read_request(self, timings):
+        # (body, deadline), or None once a rejection has been sent
+        try:
+            post_data = self.read_body()
+            deadline = self.request_deadline()
+            # Expired while waiting for a handler thread
+            check_deadline(deadline)
+        except RequestRejected as e:
+            self._reject(e, timings)
+            return None
+        timings.mark('read')
+        return post_data, deadline
+
+    def _finish(self, outcome, timings, **fields):
+        # One structured log line and the metrics for every handled request
+        owner = self._owner
+        owner.log.request(self.path, outcome, timings, **fields)
+        owner.metrics.observe_request(self.path, outcome, timings)
+
+    def do_POST(self):
+        self.model = self.registry.for_path(self.path)
+        with self._owner.metrics.track(self.path):
+            if self.model is not None:
+                self._admit()
+            elif self.path == ADMIN_RELOAD_ROUTE:
+                self._admin_reload()
+            else:
+                self.send_not_found()
+
+    def _admit(self):
+        # Load shedding for the prediction routes (SHED_*, see
+        # serving/admission.py): the model's degraded answer over the soft
+        # threshold, 503 over the hard one. One controller sees the load of the
+        # whole process; a bulk stream is refused rather than degraded
+        admission = shared_admission()
+        decision = admission.admit(self.queued_connections(), self.received_at,
+                                   can_degrade=self.path != self.model.stream_route)
+        if decision is REJECTED:
+            self.discard_body()
+            self._finish('shed', Timings())
+            self._send_json({
+                'error': 'Server overloaded, please retry',
+                'success': False
+            }, status=503, headers=(('Retry-After', admission.retry_after),))
+            return
+        self.degraded = decision is DEGRADED
+        try:
+            self._handle_post()
+        finally:
+            admission.release()
+
+    def _handle_post(self):
+        model = self.model
+        if self.path in model.matrix_routes and model.matrix_format.accepts(self.headers):
+            self._predict_binary()
+        elif self.path == model.prediction_route:
+            self._predict()
+        elif self.path == model.batch_route:
+            self._predict_batch()
+        else:
+            self._stream()
+
+    def _predict(self):
+        model = self.model
+        timings = Timings()
+        request = self._read_request(timings)
+        if request is None:
+            return
+        post_data, deadline = request
+
+        try:
+            # Parse JSON data
+            data = json.loads(post_data.decode('utf-8'))
+            timings.mark('parse')
+            model.log.debug('received', route=self.path, data=data)
+
+            # Extract features (the model's schema, see serving/schema.py)
+            features, errors, warnings = model.schema.extract(data)
+            if features is None:
+                self._finish('invalid_format', timings, error=describe_errors(errors))
+                self._send_json(invalid_record(errors))
+                return
+            timings.mark('extract')
+            model.log.debug('features', features=features)
+
+            # Score (possibly together with other concurrent requests)
+            response = model.score_one(features, deadline, self.degraded)
+            if warnings:
+                response = dict(response, warnings=warnings)
+            timings.mark('score')
+
+            # Return prediction result
+            self._send_json(response, timings)
+            timings.mark('respond')
+            model.metrics.observe_results([response])
+            self._finish('ok', timings,
+                         model_used=response['model_used'], risk=response['riskPercentage'])
+
+        except RequestRejected as e:
+            self._reject(e, timings)
+        except Exception as e:
+            self._fail(e, timings)
+
+    def _predict_batch(self):
+        model = self.model
+        timings = Timings()
+        request = self._read_request(timings)
+        if request is None:
+            return
+        post_data, deadline = request
+
+        try:
+            data = json.loads(post_data.decode('utf-8'))
+            timings.mark('parse')
+            # Accept either a bare list of records or {"records": [...]}
+            records = data.get('records') if isinstance(data, dict) else data
+            if not isinstance(records, list):
+                self._finish('invalid_format', timings)
+                self._send_json({
+                    'error': 'Invalid data format',
+                    'success': False,
+                    'message': 'Expected a list of records or {"records": [...]}'
+                })
+                return
+
+            response = model.predict_batch(records, deadline, self.degraded)
+            timings.mark('score')
+            self._send_json(response, timings)
+            timings.mark('respond')
+            model.metrics.observe_results(response['results'])
+            self._finish('ok', timings, count=response['count'], failed=response['failed'])
+
+        except RequestRejected as e:
+            self._reject(e, timings)
+        except Exception as e:
+            self._fail(e, timings)
+
+    def _predict_binary(self):
+        # A binary feature matrix in, a binary result matrix out (see
+        # serving/binary.py): no JSON, no per-field extraction, no cache
+        model = self.model
+        timings = Timings()
+        request = self._read_request(timings)
+        if request is None:
+            return
+        post_data, deadline = request
+
+        try:
+            features_array, dtype = model.matrix_format.decode(post_data)
+            model.schema.require_in_range(features_array)
+            timings.mark('parse')
+            if len(features_array):
+                if not self.degraded:
+                    model.wait_for_model(deadline)
+                check_deadline(deadline)
+                risk, model_used, confidence = model.score_risk(features_array, self.degraded)
+            else:
+                # Nothing to score
+                risk, model_used, confidence = np.empty(0), 'none', 0.0
+            timings.mark('score')
+
+            body = model.matrix_format.encode_results(risk, risk_level_codes(risk), confidence, dtype)
+            timings.mark('serialize')
+            self.send_body(body, MATRIX_CONTENT_TYPE, headers=(('X-Model-Used', model_used),))
+            timings.mark('respond')
+            model.metrics.observe_result_count(model_used, len(risk))
+            self._finish('ok', timings, count=len(risk), model_used=model_used, format='binary')
+
+        except RequestRejected as e:
+            self._reject(e, timings)
+        except Exception as e:
+            self._fail(e, timings)
+
+    def _stream(self):
+        # NDJSON in, NDJSON out, STREAM_CHUNK_ROWS records per model call (see
+        # serving/streaming.py). Runs as long as the client keeps sending, so
+        # no deadline applies; a stalled client times out after READ_TIMEOUT
+        model = self.model
+        timings = Timings()
+        try:
+            pieces = open_body(self)
+        except RequestRejected as e:
+            self._reject(e, timings)
+            return
+        count, failed, error = stream_ndjson(self, pieces, model.score_stream_chunk, model.metrics.observe_results)
+        timings.mark('respond')
+        if error is None:
+            self._finish('ok', timings, count=count, failed=failed)
+        else:
+            self._finish('stream_error', timings, count=count, failed=failed, error=error)
@@ -0,0 +1,90 @@
+# Collapse identical in-flight predictions into one computation.
+#
+# A double tap on the test screen, or the app's retry logic, sends the same
+# payload several times within milliseconds. The prediction cache only helps
+# once the first copy has been answered; until then every copy would run its
+# own inference. Here the first request for a (model version, feature
+# vector) key computes the answer and every identical request arriving while
+# it runs waits for that result instead.
+#
+# Keys use the extracted feature values exactly as floats, so payloads that
+# differ only in formatting (key order, "0.5" vs 0.5, the nested or flat
+# request shape) still collapse. A waiting request gives up when its own
+# deadline passes; if the computation it waited for failed, it scores for
+# itself rather than inheriting an error (such as the first caller's
+# deadline) that may not apply to it.
+#
+# SINGLEFLIGHT=0 turns this off.
+import os
+import threading
+import time
+
+from .limits import DeadlineExceeded
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'failed')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    def __init__(self, enabled=None):
+        if enabled is None:
+            enabled = os.environ.get('SINGLEFLIGHT', '1') != '0'
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights = {}
+
+        self.leaders = 0
+        self.collapsed = 0
+
+    @staticmethod
+    def key(features, version):
+        return (version,) + tuple(float(value) for value in features)
+
+    def run(self, key, compute, deadline=None):
+        # compute() once for all concurrent callers with the same key. Callers
+        # that joined someone else's computation get a copy of its result
+        if not self.enabled:
+            return compute()
+
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+                leader = True
+            else:
+                self.collapsed += 1
+                leader = False
+
+        if leader:
+            try:
+                flight.result = compute()
+            except BaseException:
+                flight.failed = True
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.result
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not flight.done.wait(timeout):
+            raise DeadlineExceeded()
+        if flight.failed:
+            return compute()
+        return dict(flight.result)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'in_flight': len(self._flights),
+            'leaders': self.leaders,
+            'collapsed': self.collapsed,
+        }
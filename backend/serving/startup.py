@@ -0,0 +1,104 @@
+# Fast-start mode and the startup-time breakdown.
+#
+# By default a service loads and warm-tests its model at import time, before
+# the port is bound. Unpickling the model and scalers imports sklearn and
+# xgboost, so on a small instance a cold start can outlast the platform's
+# health check. With FAST_START=1 the service only does its cheap imports,
+# binds straight away and answers health checks while the model is loaded and
+# warmed in the background (by the reloader's watcher thread, see
+# serving/reload.py). Prediction requests that arrive before the model is
+# ready wait for it up to MODEL_WAIT_SECONDS and then use the fallback.
+#
+# Prefork mode ignores FAST_START: the model has to be loaded before forking
+# for the workers to share its memory.
+#
+# Either way a StartupReport logs how long each stage took (imports, model
+# load, warm-up) and when the port was bound and the model became ready,
+# measured from process start.
+import os
+import time
+
+from .workers import server_config
+
+DEFAULT_MODEL_WAIT = 10.0
+
+_imported_at = time.perf_counter()
+
+
+def fast_start_enabled():
+    if os.environ.get('FAST_START', '0').strip().lower() not in ('1', 'true', 'yes', 'on'):
+        return False
+    mode, _, _ = server_config()
+    if mode == 'prefork':
+        print("FAST_START is ignored in prefork mode (the model is loaded before forking)")
+        return False
+    return True
+
+
+def model_wait_seconds():
+    try:
+        return max(0.0, float(os.environ.get('MODEL_WAIT_SECONDS', DEFAULT_MODEL_WAIT)))
+    except ValueError:
+        return DEFAULT_MODEL_WAIT
+
+
+def process_age():
+    # Seconds since this process started (from /proc where available, which
+    # includes interpreter startup), else since this module was imported
+    try:
+        with open('/proc/self/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - _imported_at
+
+
+class StartupReport:
+    def __init__(self, service, fast_start, log=None):
+        self.service = service
+        self.mode = 'fast' if fast_start else 'eager'
+        self.stages = {}
+        self.listening_after = None
+        self.ready_after = None
+        self.model_loaded = None
+        self._log = log
+
+    def imported(self):
+        # Everything up to the end of the service's imports
+        self.stages['imports_ms'] = round(process_age() * 1000, 3)
+
+    def record(self, stage, ms):
+        if ms is not None:
+            self.stages[f'{stage}_ms'] = round(ms, 3)
+
+    def listening(self):
+        self.listening_after = round(process_age(), 3)
+        print(f"Listening {self.listening_after:.2f}s after process start ({self.mode} start)")
+        self._report_if_complete()
+
+    def ready(self, model_loaded, load_ms=None, warm_up_ms=None):
+        self.record('load', load_ms)
+        self.record('warm_up', warm_up_ms)
+        self.model_loaded = model_loaded
+        self.ready_after = round(process_age(), 3)
+        print(f"Model {'ready' if model_loaded else 'unavailable, using the fallback'} "
+              f"{self.ready_after:.2f}s after process start")
+        self._report_if_complete()
+
+    def _report_if_complete(self):
+        # Logged once both the port is bound and the model attempt is over,
+        # whichever comes last
+        if self.listening_after is None or self.ready_after is None or self._log is None:
+            return
+        self._log.info('startup', **self.describe())
+
+    def describe(self):
+        return {
+            'mode': self.mode,
+            'stages': self.stages,
+            'listening_after_s': self.listening_after,
+            'ready_after_s': self.ready_after,
+            'model_loaded': self.model_loaded,
+        }
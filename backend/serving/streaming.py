@@ -0,0 +1,207 @@
+# Streaming NDJSON bulk scoring.
+#
+# Research exports score hundreds of thousands of historical visits, far too
+# many for one JSON array that has to be read and json.loads-ed in full. The
+# /stream routes take newline-delimited JSON (one record per line), with
+# either a Content-Length or chunked transfer coding, and:
+#   - read the body a piece at a time and split it into lines as it arrives
+#   - score every STREAM_CHUNK_ROWS records (default 512) with one call
+#     through the service's usual vectorized scaler/model path
+#   - write each chunk's results straight back as NDJSON, in a chunked
+#     response
+# so memory use is bounded by one chunk of records and one line of at most
+# STREAM_MAX_LINE_BYTES (default 64 KiB), however long the stream is.
+#
+# Every non-blank input line gets one output line, in order, carrying its
+# 'index' (0-based, blank lines don't count). A line that isn't valid JSON or
+# can't be scored gets an error line ('success': false) and the stream goes
+# on. The last line is a summary, {"done": true, "count": n, "failed": k};
+# if the stream had to stop early (malformed chunking, a line too long, the
+# client stalling for READ_TIMEOUT) it is {"done": false, "error": ...}
+# instead, and the connection is closed.
+#
+# Results are written while the request is still being read, so clients must
+# read the response as they send (curl, fetch/aiohttp/httpx streaming do);
+# one that only reads after sending everything should use the batch route.
+import json
+import os
+import socket
+
+from .limits import READ_TIMEOUT, RequestRejected
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+DEFAULT_CHUNK_ROWS = 512
+DEFAULT_MAX_LINE_BYTES = 64 * 1024
+
+# Bytes asked for per read, and the longest chunk-size line accepted
+READ_CHUNK = 64 * 1024
+MAX_CHUNK_HEADER = 1024
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+CHUNK_ROWS = _env_int('STREAM_CHUNK_ROWS', DEFAULT_CHUNK_ROWS)
+MAX_LINE_BYTES = _env_int('STREAM_MAX_LINE_BYTES', DEFAULT_MAX_LINE_BYTES)
+
+
+def open_body(handler):
+    # Check the framing before anything is sent back; returns a generator of
+    # body pieces. Raises RequestRejected while a normal error response is
+    # still possible
+    headers = handler.headers
+    coding = headers.get('Transfer-Encoding')
+    if coding is not None:
+        if coding.strip().lower() != 'chunked':
+            handler.close_connection = True
+            raise RequestRejected(f'Unsupported Transfer-Encoding: {coding}', 501, 'bad_transfer_encoding')
+        return _chunked_body(handler.rfile)
+
+    length = headers.get('Content-Length')
+    if length is None:
+        handler.close_connection = True
+        raise RequestRejected('Content-Length or chunked Transfer-Encoding required', 411, 'length_required')
+    try:
+        length = int(length)
+    except ValueError:
+        length = -1
+    if length < 0:
+        handler.close_connection = True
+        raise RequestRejected('Invalid Content-Length', 400, 'bad_length')
+    return _sized_body(handler.rfile, length)
+
+
+def _sized_body(rfile, length):
+    remaining = length
+    while remaining:
+        piece = rfile.read1(min(remaining, READ_CHUNK))
+        if not piece:
+            raise RequestRejected('Incomplete request body', 400, 'incomplete_body')
+        remaining -= len(piece)
+        yield piece
+
+
+def _chunked_body(rfile):
+    while True:
+        line = rfile.readline(MAX_CHUNK_HEADER)
+        if not line.endswith(b'\n'):
+            raise RequestRejected('Malformed chunked body', 400, 'bad_chunk')
+        try:
+            size = int(line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            raise RequestRejected('Malformed chunked body', 400, 'bad_chunk')
+        if size == 0:
+            # Skip any trailer fields up to the blank line
+            while True:
+                line = rfile.readline(MAX_CHUNK_HEADER)
+                if not line.endswith(b'\n'):
+                    raise RequestRejected('Malformed chunked body', 400, 'bad_chunk')
+                if not line.strip():
+                    return
+        remaining = size
+        while remaining:
+            piece = rfile.read1(min(remaining, READ_CHUNK))
+            if not piece:
+                raise RequestRejected('Incomplete request body', 400, 'incomplete_body')
+            remaining -= len(piece)
+            yield piece
+        if rfile.readline(MAX_CHUNK_HEADER).strip():
+            raise RequestRejected('Malformed chunked body', 400, 'bad_chunk')
+
+
+def iter_lines(pieces, max_line=None):
+    # Non-blank lines of an NDJSON body, never holding more than one
+    # unfinished line
+    if max_line is None:
+        max_line = MAX_LINE_BYTES
+    pending = b''
+    for piece in pieces:
+        lines = (pending + piece).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if len(line) > max_line:
+                raise RequestRejected(f'Line longer than {max_line} bytes', 413, 'line_too_long')
+            if line.strip():
+                yield line
+        if len(pending) > max_line:
+            raise RequestRejected(f'Line longer than {max_line} bytes', 413, 'line_too_long')
+    if pending.strip():
+        yield pending
+
+
+def stream_ndjson(handler, pieces, score_records, observe=None, chunk_rows=None):
+    # Score the records in `pieces` (from open_body) chunk_rows at a time and
+    # stream the results back. score_records(records) returns one result
+    # dict per record, in order; observe(results) is called for every
+    # chunk. Returns (count, failed, error), error being None when the whole
+    # stream was scored
+    if chunk_rows is None:
+        chunk_rows = CHUNK_ROWS
+
+    # Slow senders get READ_TIMEOUT per read rather than for the whole body
+    connection = handler.connection
+    previous = connection.gettimeout()
+    connection.settimeout(READ_TIMEOUT)
+    handler.start_chunked(NDJSON_CONTENT_TYPE)
+
+    index = 0
+    # Lines answered so far, and how many of those were errors
+    count = 0
+    failed = 0
+    error = None
+    # (index, record) for the lines that parsed, (index, error) for the rest
+    records = []
+    invalid = []
+
+    def flush():
+        nonlocal count, failed
+        results = score_records([record for _, record in records]) if records else []
+        lines = [(index, result) for (index, _), result in zip(records, results)]
+        lines.extend((index, {'error': message, 'success': False}) for index, message in invalid)
+        lines.sort(key=lambda line: line[0])
+        count += len(lines)
+        failed += sum(1 for _, result in lines if not result.get('success', False))
+        if observe is not None:
+            observe(results)
+        handler.write_chunk(''.join(json.dumps({'index': line_index, **result}) + '\n'
+                                    for line_index, result in lines).encode())
+        del records[:]
+        del invalid[:]
+
+    try:
+        for line in iter_lines(pieces):
+            try:
+                records.append((index, json.loads(line)))
+            except ValueError as e:
+                invalid.append((index, f'Invalid JSON: {e}'))
+            index += 1
+            if len(records) + len(invalid) >= chunk_rows:
+                flush()
+        if records or invalid:
+            flush()
+        summary = {'done': True, 'count': count, 'failed': failed}
+    except socket.timeout:
+        error = 'Timed out reading the request body'
+    except Exception as e:
+        # RequestRejected from the body framing or line limits, or a
+        # scoring error
+        error = str(e)
+    finally:
+        connection.settimeout(previous)
+
+    if error is not None:
+        # The body was not read to its end, so the connection can't be reused
+        handler.close_connection = True
+        summary = {'done': False, 'error': error, 'count': count, 'failed': failed}
+    try:
+        handler.write_chunk(json.dumps(summary).encode() + b'\n')
+        handler.end_chunked()
+    except OSError:
+        # The client has gone away
+        handler.close_connection = True
+    return count, failed, error
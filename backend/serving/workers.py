@@ -0,0 +1,329 @@
+# Concurrent serving modes for the BaseHTTPRequestHandler based servers.
+#
+# SERVER_MODE selects how connections are handled:
+#   single   - the original socketserver.TCPServer, one connection at a time
+#   threaded - one process with a fixed pool of SERVER_THREADS worker threads
+#   prefork  - SERVER_WORKERS processes forked after the model is loaded, each
+#              running its own thread pool on the shared listening socket
+#
+# In prefork mode the model, scalers and everything else imported at module
+# level are loaded (and warmed by the test prediction) once in the parent.
+# Before forking, the parent collects and gc.freeze()s every live object, so
+# the garbage collector in the workers never writes to those objects' headers
+# and their pages stay shared copy-on-write. A few seconds after startup the
+# parent logs each worker's resident and private memory; process_memory()
+# gives the same numbers for the current process.
+#
+# Background threads a service needs (model reload watchers and the like)
+# are registered with on_serve() and started in every process that serves,
+# after the fork. SIGHUP sent to the prefork parent is forwarded to all
+# workers; notify_workers() lets a worker send a signal to all of them.
+#
+# Worker and thread counts are clamped so a bad setting can't fork-bomb a
+# small container.
+import gc
+import os
+import queue
+import signal
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+SERVER_MODES = ('single', 'threaded', 'prefork')
+DEFAULT_MODE = 'threaded'
+DEFAULT_THREADS = 8
+MAX_WORKERS = 32
+MAX_THREADS = 64
+
+# Seconds after forking before the parent reports per-worker memory
+MEMORY_REPORT_DELAY = 5.0
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Ignoring invalid {name}={value!r}, using {default}")
+        return default
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def server_config(mode=None, workers=None, threads=None):
+    # Explicit arguments win over the environment
+    if mode is None:
+        mode = os.environ.get('SERVER_MODE', DEFAULT_MODE).strip().lower()
+    if mode not in SERVER_MODES:
+        print(f"Unknown SERVER_MODE {mode!r}, using {DEFAULT_MODE}")
+        mode = DEFAULT_MODE
+
+    if mode == 'prefork' and not hasattr(os, 'fork'):
+        print("prefork mode needs os.fork(), falling back to threaded")
+        mode = 'threaded'
+
+    if workers is None:
+        workers = _env_int('SERVER_WORKERS', os.cpu_count() or 1)
+    if threads is None:
+        threads = _env_int('SERVER_THREADS', DEFAULT_THREADS)
+
+    workers = _clamp(workers, 1, MAX_WORKERS)
+    threads = _clamp(threads, 1, MAX_THREADS)
+    return mode, workers, threads
+
+
+class ThreadPoolTCPServer(socketserver.TCPServer):
+    # Accepts on the serving thread and hands each connection to a fixed pool
+    # of worker threads, so a slow client or a slow prediction only ties up
+    # one worker instead of the whole server.
+    allow_reuse_address = True
+    request_queue_size = 128
+    # Handlers may keep connections open (serving/handler.py); an idle one
+    # gives its worker thread back as soon as another connection is queued
+    supports_keep_alive = True
+
+    def __init__(self, server_address, handler, threads=DEFAULT_THREADS, bind_and_activate=True):
+        super().__init__(server_address, handler, bind_and_activate)
+        self.threads = threads
+        self._requests = queue.Queue()
+        self._workers = []
+        self._current = threading.local()
+
+    def queue_depth(self):
+        return self._requests.qsize()
+
+    def queued_for(self):
+        # Seconds the connection being handled on this thread waited between
+        # being accepted and a worker picking it up
+        return getattr(self._current, 'queued_for', 0.0)
+
+    def _start_workers(self):
+        # Threads are started lazily so a prefork parent can create the
+        # listening socket without owning threads that would not survive fork()
+        if self._workers:
+            return
+        for i in range(self.threads):
+            worker = threading.Thread(target=self._worker_loop, name=f'http-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _worker_loop(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            request, client_address, accepted = item
+            self._current.queued_for = time.monotonic() - accepted
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self._requests.put((request, client_address, time.monotonic()))
+
+    def serve_forever(self, poll_interval=0.5):
+        self._start_workers()
+        super().serve_forever(poll_interval)
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._workers:
+            self._requests.put(None)
+        self._workers = []
+
+
+_serve_hooks = []
+_prefork_child = False
+
+
+def on_serve(hook):
+    # hook() runs in each serving process just before it starts accepting
+    _serve_hooks.append(hook)
+    return hook
+
+
+def _run_serve_hooks():
+    for hook in _serve_hooks:
+        try:
+            hook()
+        except Exception:
+            traceback.print_exc()
+
+
+def notify_workers(signum):
+    # From inside a prefork worker: ask the parent to forward signum to every
+    # worker (including this one). Returns False when not running prefork.
+    if not _prefork_child:
+        return False
+    os.kill(os.getppid(), signum)
+    return True
+
+
+def process_memory(pid=None):
+    # Resident memory of a process in MB. 'private' is what this process
+    # does not share with any other (roughly what one more worker costs);
+    # 'pss' splits shared pages evenly between the processes using them.
+    # Linux only; returns None elsewhere.
+    pid = os.getpid() if pid is None else pid
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return None
+
+    def mb(*names):
+        return round(sum(fields.get(name, 0) for name in names) / 1024, 1)
+
+    return {
+        'pid': pid,
+        'rss_mb': mb('Rss'),
+        'pss_mb': mb('Pss'),
+        'shared_mb': mb('Shared_Clean', 'Shared_Dirty'),
+        'private_mb': mb('Private_Clean', 'Private_Dirty'),
+    }
+
+
+def _report_memory(children):
+    parent = process_memory()
+    if parent is None:
+        return
+    workers = [memory for memory in map(process_memory, sorted(children)) if memory is not None]
+    print(f"Parent {parent['pid']}: rss {parent['rss_mb']} MB, private {parent['private_mb']} MB")
+    for memory in workers:
+        print(f"Worker {memory['pid']}: rss {memory['rss_mb']} MB, shared {memory['shared_mb']} MB, "
+              f"private {memory['private_mb']} MB")
+    if workers:
+        extra = sum(memory['private_mb'] for memory in workers) / len(workers)
+        print(f"Each additional worker costs about {extra:.1f} MB of private memory")
+
+
+def _run_child(httpd, sighup):
+    global _prefork_child
+    _prefork_child = True
+    # Children die with the default SIGTERM action; the parent owns cleanup
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if sighup is not None:
+        signal.signal(signal.SIGHUP, sighup)
+    exit_code = 0
+    try:
+        _run_serve_hooks()
+        httpd.serve_forever()
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        os._exit(exit_code)
+
+
+def _fork_worker(httpd, sighup):
+    # Anything still buffered would otherwise be written again by the child
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        _run_child(httpd, sighup)
+    return pid
+
+
+def _serve_prefork(httpd, workers):
+    # Several processes accept on the same socket; a non-blocking listener
+    # means the ones that lose the race just go back to select()
+    httpd.socket.setblocking(False)
+
+    # Everything allocated so far (model, scalers, imported modules) is moved
+    # to a permanent generation the collector ignores, so the workers don't
+    # dirty those pages by touching their GC headers
+    gc.collect()
+    gc.freeze()
+
+    # Workers keep whatever SIGHUP handler the service installed (a reload);
+    # the parent just passes the signal on
+    sighup = signal.getsignal(signal.SIGHUP) if hasattr(signal, 'SIGHUP') else None
+
+    children = {}
+    for _ in range(workers):
+        pid = _fork_worker(httpd, sighup)
+        children[pid] = time.monotonic()
+    print(f"Forked {workers} worker processes: {sorted(children)}")
+
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    def _forward(signum, frame):
+        for pid in list(children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    if sighup is not None:
+        signal.signal(signal.SIGHUP, _forward)
+
+    report_at = time.monotonic() + MEMORY_REPORT_DELAY
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid == 0:
+            if report_at is not None and time.monotonic() >= report_at and not stopping:
+                report_at = None
+                _report_memory(children)
+            time.sleep(0.2)
+            continue
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"Worker {pid} exited with status {status}, restarting")
+        # Don't spin if a worker crashes straight away (bad model, bad port)
+        if time.monotonic() - started < 1.0:
+            time.sleep(1.0)
+        new_pid = _fork_worker(httpd, sighup)
+        children[new_pid] = time.monotonic()
+
+
+def serve(handler, host, port, mode=None, workers=None, threads=None):
+    mode, workers, threads = server_config(mode, workers, threads)
+
+    if mode == 'single':
+        print("Serving in single mode (one connection at a time)")
+        with socketserver.TCPServer((host, port), handler) as httpd:
+            _run_serve_hooks()
+            httpd.serve_forever()
+        return
+
+    with ThreadPoolTCPServer((host, port), handler, threads=threads) as httpd:
+        if mode == 'threaded':
+            print(f"Serving in threaded mode with {threads} worker threads")
+            _run_serve_hooks()
+            httpd.serve_forever()
+        else:
+            print(f"Serving in prefork mode with {workers} processes x {threads} threads")
+            _serve_prefork(httpd, workers)
@@ -0,0 +1,8 @@
+# The tests import the shared serving package the way the services do, from
+# backend/
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
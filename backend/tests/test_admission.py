@@ -0,0 +1,166 @@
+# Admission control (serving/admission.py): soft and hard thresholds, and
+# what does and doesn't count as queue wait
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from serving.admission import DEGRADED, NORMAL, REJECTED, AdmissionController
+from serving.handler import ServiceHandler
+from serving.workers import ThreadPoolTCPServer
+
+
+def controller(**overrides):
+    settings = dict(soft_inflight=4, hard_inflight=8, soft_queue_ms=100, hard_queue_ms=500,
+                    degrade=True, retry_after=1)
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+def hold(admission, count):
+    # `count` requests admitted and still being handled
+    for _ in range(count):
+        assert admission.admit() is NORMAL
+
+
+def test_normal_below_the_soft_thresholds():
+    admission = controller()
+    assert admission.admit(queued=3) is NORMAL
+    assert admission.in_flight == 1
+    admission.release()
+    assert admission.in_flight == 0
+
+
+def test_load_soft_threshold_degrades():
+    admission = controller()
+    hold(admission, 2)
+    # 2 in flight + 2 queued reaches soft_inflight=4
+    assert admission.admit(queued=2) is DEGRADED
+    assert admission.in_flight == 3
+
+
+def test_load_soft_threshold_rejects_what_cannot_degrade():
+    admission = controller()
+    hold(admission, 4)
+    assert admission.admit(can_degrade=False) is REJECTED
+    assert admission.in_flight == 4
+
+
+def test_load_hard_threshold_sheds():
+    admission = controller()
+    hold(admission, 4)
+    assert admission.admit(queued=4) is REJECTED
+    # A rejected request is never released, so it isn't counted in flight
+    assert admission.in_flight == 4
+    assert admission.decisions == {NORMAL: 4, DEGRADED: 0, REJECTED: 1}
+
+
+def test_degrade_off_answers_normally_until_the_hard_threshold():
+    admission = controller(degrade=False)
+    hold(admission, 5)
+    assert admission.admit() is NORMAL
+    assert admission.admit(queued=2) is REJECTED
+
+
+def test_queue_wait_thresholds_while_busy():
+    admission = controller()
+    hold(admission, 1)
+    now = time.monotonic()
+    assert admission.admit(received_at=now - 0.05) is NORMAL
+    assert admission.admit(received_at=now - 0.2) is DEGRADED
+    assert admission.admit(received_at=now - 0.6) is REJECTED
+
+
+def test_queue_wait_ignored_with_nothing_in_flight():
+    # Waiting behind idle connections is not overload
+    admission = controller()
+    assert admission.admit(received_at=time.monotonic() - 5.0) is NORMAL
+
+
+def test_zero_thresholds_are_off():
+    admission = controller(soft_inflight=0, hard_inflight=0, soft_queue_ms=0, hard_queue_ms=0)
+    hold(admission, 100)
+    assert admission.admit(queued=100, received_at=time.monotonic() - 60) is NORMAL
+
+
+# Through the handler: queue wait as the server measures it
+
+THREADS = 2
+
+
+class AdmissionHandler(ServiceHandler):
+    # Answers with the admission decision, and how long the request is
+    # considered to have waited
+    timeout = 5.0
+    admission = None
+
+    def do_GET(self):
+        waited = time.monotonic() - self.received_at
+        decision = self.admission.admit(self.queued_connections(), self.received_at)
+        try:
+            self.send_json({'decision': decision, 'waited': waited})
+        finally:
+            if decision is not REJECTED:
+                self.admission.release()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    # Any real queue wait would degrade or shed
+    AdmissionHandler.admission = controller(soft_queue_ms=1, hard_queue_ms=2)
+    httpd = ThreadPoolTCPServer(('127.0.0.1', 0), AdmissionHandler, threads=THREADS)
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(sock, rfile):
+    sock.sendall(b'GET / HTTP/1.1\r\nHost: test\r\n\r\n')
+    status = int(rfile.readline().split()[1])
+    length = 0
+    while True:
+        line = rfile.readline().rstrip(b'\r\n')
+        if not line:
+            break
+        name, value = line.decode().split(':', 1)
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(rfile.read(length))
+
+
+def test_idle_time_before_the_first_request_is_not_queue_wait(server):
+    sock = socket.create_connection(server, timeout=10)
+    rfile = sock.makefile('rb')
+    with sock, rfile:
+        time.sleep(0.3)
+        status, body = get(sock, rfile)
+    assert status == 200
+    assert body['waited'] < 0.1
+    assert body['decision'] == NORMAL
+
+
+def test_client_behind_idle_keep_alive_connections_is_admitted(server):
+    # Every thread pinned by an idle kept-alive client, nothing in flight
+    idle = []
+    for _ in range(THREADS):
+        sock = socket.create_connection(server, timeout=10)
+        rfile = sock.makefile('rb')
+        assert get(sock, rfile)[0] == 200
+        idle.append((sock, rfile))
+    time.sleep(0.3)
+
+    sock = socket.create_connection(server, timeout=10)
+    rfile = sock.makefile('rb')
+    with sock, rfile:
+        status, body = get(sock, rfile)
+    assert (status, body['decision']) == (200, NORMAL)
+    for sock, rfile in idle:
+        rfile.close()
+        sock.close()
@@ -0,0 +1,85 @@
+# Model bundles (serving/bundle.py): round trip, and bundles whose source
+# pickles have been replaced
+import pickle
+
+import numpy as np
+import pytest
+
+sklearn_preprocessing = pytest.importorskip('sklearn.preprocessing')
+xgboost = pytest.importorskip('xgboost')
+
+from serving.bundle import build_bundle, load_bundle, load_current_bundle, main, stale_sources
+
+
+def write_pickles(directory, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 1, size=(200, 7))
+    y = X[:, 0] - X[:, 3] + rng.normal(0, 0.1, 200)
+    scaler = sklearn_preprocessing.StandardScaler().fit(X)
+    scaler_y = sklearn_preprocessing.StandardScaler().fit(y.reshape(-1, 1))
+    model = xgboost.XGBRegressor(n_estimators=10, max_depth=3).fit(scaler.transform(X), y)
+    paths = []
+    for name, value in (('model.pkl', model), ('scaler.pkl', scaler), ('scaler_y.pkl', scaler_y)):
+        path = str(directory / name)
+        with open(path, 'wb') as f:
+            pickle.dump(value, f)
+        paths.append(path)
+    return paths, model, scaler
+
+
+def test_round_trip(tmp_path):
+    (model_path, scaler_path, scaler_y_path), model, scaler = write_pickles(tmp_path)
+    out_path = str(tmp_path / 'test.bundle')
+    manifest = build_bundle(out_path, model_path, scaler_path, scaler_y_path)
+
+    bundle = load_current_bundle(out_path, [model_path, scaler_path, scaler_y_path], num_features=7)
+    assert bundle is not None
+    assert bundle.version == manifest['version']
+    X = np.random.default_rng(1).normal(0, 1, size=(50, 7))
+    np.testing.assert_array_equal(bundle.scaler.transform(X), scaler.transform(X))
+    np.testing.assert_allclose(bundle.model.predict(scaler.transform(X)), model.predict(scaler.transform(X)),
+                               rtol=0, atol=1e-4)
+
+
+def test_replaced_pickle_makes_the_bundle_stale(tmp_path):
+    (model_path, scaler_path, scaler_y_path), _, _ = write_pickles(tmp_path)
+    out_path = str(tmp_path / 'test.bundle')
+    build_bundle(out_path, model_path, scaler_path, scaler_y_path)
+    sources = [model_path, scaler_path, scaler_y_path]
+    assert stale_sources(load_bundle(out_path).manifest, sources) == []
+
+    # A retrained model dropped in next to the bundle
+    retrained = tmp_path / 'retrained'
+    retrained.mkdir()
+    (new_model_path, _, _), _, _ = write_pickles(retrained, seed=5)
+    with open(new_model_path, 'rb') as src, open(model_path, 'wb') as dst:
+        dst.write(src.read())
+
+    assert stale_sources(load_bundle(out_path).manifest, sources) == ['model.pkl']
+    assert load_current_bundle(out_path, sources) is None
+    # load_bundle() itself never looks at the sources
+    assert load_bundle(out_path) is not None
+
+
+def test_check_command(tmp_path, capsys):
+    (model_path, scaler_path, scaler_y_path), _, _ = write_pickles(tmp_path)
+    out_path = str(tmp_path / 'test.bundle')
+    build_bundle(out_path, model_path, scaler_path, scaler_y_path)
+    assert not main(['check', out_path, model_path, scaler_path, scaler_y_path])
+    assert 'up to date' in capsys.readouterr().out
+
+    with open(scaler_path, 'ab') as f:
+        f.write(b'\0')
+    assert main(['check', out_path, model_path, scaler_path, scaler_y_path]) == 1
+    assert 'scaler.pkl changed' in capsys.readouterr().out
+
+
+def test_missing_sources_are_not_stale(tmp_path):
+    # Deployments may ship only the bundle
+    (model_path, scaler_path, scaler_y_path), _, _ = write_pickles(tmp_path)
+    out_path = str(tmp_path / 'test.bundle')
+    build_bundle(out_path, model_path, scaler_path, scaler_y_path)
+    sources = [model_path, scaler_path, scaler_y_path]
+    for path in sources:
+        (tmp_path / path.rsplit('/', 1)[-1]).unlink()
+    assert load_current_bundle(out_path, sources) is not None
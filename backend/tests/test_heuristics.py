@@ -0,0 +1,140 @@
+# The vectorized heuristic scorers (serving/heuristics.py) against the scalar
+# formulas they replaced, on edge values: range boundaries, negatives, huge
+# values, infinities and NaN
+import math
+
+import numpy as np
+import pytest
+
+from serving.heuristics import (AlzheimerFallback, DatScanParkinsonHeuristic, EnhancedAlzheimerFallback,
+                                ManualParkinsonRisk)
+from serving.parkinson import blend_risk
+
+
+# The original per-patient formulas, as they were before vectorization
+
+def baseline_alzheimer_fallback(features):
+    hippocampus_volume, cortical_thickness, ventricle_volume, white_matter_hyperintensities, \
+        brain_glucose_metabolism, amyloid_deposition, tau_protein_level = features
+    risk_score = (
+        max(0, (4.5 - hippocampus_volume) * 15) +
+        max(0, (3.5 - cortical_thickness) * 20) +
+        max(0, (ventricle_volume - 15) * 0.8) +
+        white_matter_hyperintensities * 3 +
+        max(0, (7.0 - brain_glucose_metabolism) * 10) +
+        amyloid_deposition * 12 +
+        tau_protein_level * 15
+    ) / 7
+    return min(max(risk_score, 0), 100)
+
+
+def baseline_enhanced_alzheimer_fallback(features):
+    hippocampus_volume, cortical_thickness, ventricle_volume, white_matter_hyperintensities, \
+        brain_glucose_metabolism, amyloid_deposition, tau_protein_level = features
+    weighted_score = (
+        max(0, min(100, (4.5 - hippocampus_volume) * 35)) * 0.20 +
+        max(0, min(100, (3.5 - cortical_thickness) * 45)) * 0.15 +
+        max(0, min(100, (ventricle_volume - 15) * 4)) * 0.10 +
+        max(0, min(100, white_matter_hyperintensities * 15)) * 0.10 +
+        max(0, min(100, (7.0 - brain_glucose_metabolism) * 30)) * 0.15 +
+        max(0, min(100, amyloid_deposition * 60)) * 0.15 +
+        max(0, min(100, tau_protein_level * 50)) * 0.15
+    )
+    return min(100, weighted_score * 1.3)
+
+
+def baseline_datscan_parkinson(features):
+    caudate_r, caudate_l, putamen_r, putamen_l, updrs_score, smell_score, cognitive_score = map(float, features)
+    return (
+        max(0, min(100, (4.0 - caudate_r) * 25)) * 0.15 +
+        max(0, min(100, (4.0 - caudate_l) * 25)) * 0.15 +
+        max(0, min(100, (3.0 - putamen_r) * 33)) * 0.15 +
+        max(0, min(100, (3.0 - putamen_l) * 33)) * 0.15 +
+        max(0, min(100, updrs_score * 2.5)) * 0.15 +
+        max(0, min(100, (40 - smell_score) * 2.5)) * 0.15 +
+        max(0, min(100, cognitive_score * 3.33)) * 0.10
+    )
+
+
+def baseline_manual_parkinson(features):
+    dat_scan_avg = (features[0] + features[1] + features[2] + features[3]) / 4
+    updrs_factor = features[4] / 40
+    smell_factor = 1 - (features[5] / 40)
+    cognitive_factor = features[6] / 30
+    dat_scan_risk = max(0, min(100, (4.0 - dat_scan_avg) * 40))
+    return (dat_scan_risk * 0.4) + (updrs_factor * 100 * 0.3) + (smell_factor * 100 * 0.2) + \
+        (cognitive_factor * 100 * 0.1)
+
+
+SCORERS = [
+    (AlzheimerFallback(), baseline_alzheimer_fallback, [4.2, 3.2, 20.0, 1.0, 6.5, 0.6, 1.0]),
+    (EnhancedAlzheimerFallback(), baseline_enhanced_alzheimer_fallback, [4.2, 3.2, 20.0, 1.0, 6.5, 0.6, 1.0]),
+    (DatScanParkinsonHeuristic(), baseline_datscan_parkinson, [3.8, 3.8, 2.8, 2.8, 10.0, 30.0, 5.0]),
+    (ManualParkinsonRisk(), baseline_manual_parkinson, [3.8, 3.8, 2.8, 2.8, 10.0, 30.0, 5.0]),
+]
+IDS = [type(model).__name__ for model, _, _ in SCORERS]
+
+EDGE_VALUES = [0.0, -0.0, -1.0, 1e-300, 1e300, -1e300, math.inf, -math.inf, math.nan,
+               # Where the factors cross 0 or 100
+               2.5, 3.0, 3.5, 4.0, 4.5, 7.0, 15.0, 40.0, 40.0 / 3, 30.0, 40.0 / 2.5]
+
+
+def edge_rows(typical):
+    # Every edge value in every column of an otherwise typical patient, then
+    # random mixes of edge values
+    rows = [list(typical)]
+    for column in range(len(typical)):
+        for value in EDGE_VALUES:
+            row = list(typical)
+            row[column] = value
+            rows.append(row)
+    rng = np.random.default_rng(0)
+    rows.extend(rng.choice(EDGE_VALUES, size=(500, len(typical))).tolist())
+    return rows
+
+
+def assert_same(actual, expected):
+    # Bit-identical, with NaN equal to NaN
+    np.testing.assert_array_equal(np.asarray(actual, dtype=float), np.asarray(expected, dtype=float))
+
+
+@pytest.mark.parametrize('model, baseline, typical', SCORERS, ids=IDS)
+def test_batch_matches_baseline(model, baseline, typical):
+    rows = edge_rows(typical)
+    with np.errstate(invalid='ignore', over='ignore'):
+        assert_same(model.predict(np.array(rows)), [baseline(row) for row in rows])
+
+
+@pytest.mark.parametrize('model, baseline, typical', SCORERS, ids=IDS)
+def test_single_row_matches_baseline(model, baseline, typical):
+    for row in edge_rows(typical):
+        expected = baseline(row)
+        assert_same(model.predict_one(row), expected)
+        assert_same(model.predict(np.array([row])), [expected])
+
+
+def finite_rows(typical):
+    return np.array([row for row in edge_rows(typical) if all(math.isfinite(value) for value in row)])
+
+
+@pytest.mark.parametrize('model, baseline, typical', SCORERS[:3], ids=IDS[:3])
+def test_risk_is_a_percentage_for_finite_inputs(model, baseline, typical):
+    risk = model.predict(finite_rows(typical))
+    assert np.all((risk >= 0) & (risk <= 100))
+
+
+def test_blend_clamps_the_manual_risk():
+    # The manual risk leaves 0-100 on its own (a high UPDRS score); the
+    # Parkinson service only ever serves it through blend_risk(), which
+    # clamps it, with or without a model probability
+    manual = ManualParkinsonRisk().predict(finite_rows(SCORERS[3][2]))
+    assert manual.min() < 0 and manual.max() > 100
+    for raw, is_probability in ((None, False), (np.full(len(manual), 0.5), True),
+                                (np.full(len(manual), 7.0), True)):
+        risk = blend_risk(manual, raw, is_probability)
+        assert np.all((risk >= 0) & (risk <= 100))
+
+
+def test_wrong_width_is_rejected():
+    with pytest.raises(ValueError):
+        DatScanParkinsonHeuristic().predict(np.zeros((2, 6)))
@@ -0,0 +1,167 @@
+# Keep-alive connections on the thread pool (serving/handler.py,
+# serving/workers.py): idle connections must not pin the handler threads
+import socket
+import threading
+import time
+
+import pytest
+
+from serving.handler import ServiceHandler
+from serving.workers import ThreadPoolTCPServer
+
+THREADS = 2
+
+
+class EchoHandler(ServiceHandler):
+    timeout = 5.0
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(0.5)
+        self.send_json({'path': self.path})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(threads):
+    httpd = ThreadPoolTCPServer(('127.0.0.1', 0), EchoHandler, threads=threads)
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    return httpd
+
+
+@pytest.fixture
+def server():
+    httpd = start_server(THREADS)
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def one_thread_server():
+    httpd = start_server(1)
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def connect(address):
+    sock = socket.create_connection(address, timeout=10)
+    return sock, sock.makefile('rb')
+
+
+def request(sock, path='/'):
+    sock.sendall(f'GET {path} HTTP/1.1\r\nHost: test\r\n\r\n'.encode())
+
+
+def read_response(rfile):
+    # (status, headers, body) of one response
+    status = int(rfile.readline().split()[1])
+    headers = {}
+    while True:
+        line = rfile.readline().rstrip(b'\r\n')
+        if not line:
+            break
+        name, value = line.decode().split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, rfile.read(int(headers['content-length']))
+
+
+def test_idle_connection_is_reused(server):
+    sock, rfile = connect(server)
+    with sock, rfile:
+        request(sock, '/one')
+        assert read_response(rfile)[2] == b'{"path": "/one"}'
+        time.sleep(0.3)
+        request(sock, '/two')
+        status, headers, body = read_response(rfile)
+        assert (status, body) == (200, b'{"path": "/two"}')
+        assert headers.get('connection') != 'close'
+
+
+def test_pipelined_requests(server):
+    # The second request is already buffered when the first is answered
+    sock, rfile = connect(server)
+    with sock, rfile:
+        sock.sendall(b'GET /a HTTP/1.1\r\nHost: test\r\n\r\nGET /b HTTP/1.1\r\nHost: test\r\n\r\n')
+        assert read_response(rfile)[2] == b'{"path": "/a"}'
+        assert read_response(rfile)[2] == b'{"path": "/b"}'
+
+
+def hold_idle_connections(address, count):
+    # Connections that made one request and were kept open, each one holding
+    # a handler thread (opened one at a time, so none is answered while
+    # another is still queued)
+    idle = []
+    for _ in range(count):
+        sock, rfile = connect(address)
+        request(sock)
+        status, headers, _ = read_response(rfile)
+        assert status == 200 and headers.get('connection') != 'close'
+        idle.append((sock, rfile))
+    time.sleep(0.2)
+    return idle
+
+
+def test_idle_connections_do_not_starve_new_ones(server):
+    # Every thread holds an idle kept-alive connection
+    idle = hold_idle_connections(server, THREADS)
+
+    # A new client is answered long before the 5 s keep-alive timeout
+    started = time.monotonic()
+    sock, rfile = connect(server)
+    with sock, rfile:
+        request(sock, '/new')
+        status, _, body = read_response(rfile)
+        elapsed = time.monotonic() - started
+    assert (status, body) == (200, b'{"path": "/new"}')
+    assert elapsed < 1.0
+
+    # and an idle connection was closed to make room for it
+    closed = 0
+    for sock, rfile in idle:
+        sock.settimeout(1.0)
+        try:
+            closed += rfile.read(1) == b''
+        except socket.timeout:
+            pass
+        finally:
+            rfile.close()
+            sock.close()
+    assert closed >= 1
+
+
+def test_saturated_pool_serves_many_new_clients(server):
+    # Every thread pinned by an idle client, then a burst of new ones
+    idle = hold_idle_connections(server, THREADS)
+    started = time.monotonic()
+    for i in range(5):
+        sock, rfile = connect(server)
+        with sock, rfile:
+            request(sock, f'/burst{i}')
+            assert read_response(rfile)[0] == 200
+    assert time.monotonic() - started < 2.0
+    for sock, rfile in idle:
+        rfile.close()
+        sock.close()
+
+
+def test_new_connection_waits_for_its_first_request(one_thread_server):
+    # A connection that hasn't sent its request line yet when it gets the
+    # thread is not idle: it must be answered even though another connection
+    # is queued behind it
+    slow, slow_rfile = connect(one_thread_server)
+    late, late_rfile = connect(one_thread_server)
+    queued, queued_rfile = connect(one_thread_server)
+    with slow, slow_rfile, late, late_rfile, queued, queued_rfile:
+        request(slow, '/slow')
+        request(queued, '/queued')
+        # `late` is picked up as soon as /slow is answered, and only then
+        # sends its request
+        assert read_response(slow_rfile)[0] == 200
+        time.sleep(0.3)
+        request(late, '/late')
+        assert read_response(late_rfile)[:1] == (200,)
+        assert read_response(queued_rfile)[2] == b'{"path": "/queued"}'
@@ -0,0 +1,131 @@
+# Readiness with several hosted models (serving/registry.py,
+# serving/server.py): the combined /api/ready, /api/ready?model=<name>, and
+# models that run on their fallback by design
+import http.client
+import json
+import threading
+
+import pytest
+
+from serving.registry import HostedModel, ModelRegistry
+from serving.server import PredictionHandler
+from serving.workers import ThreadPoolTCPServer
+
+
+class State:
+    version = 'v1'
+    load_ms = 1.0
+    loaded_at = 0.0
+
+    def __init__(self, loaded):
+        self.loaded = loaded
+
+
+class Reloader:
+    loading = False
+
+    def __init__(self, loaded):
+        self.current = State(loaded)
+
+
+class Canary:
+    def __init__(self, ok):
+        self.result = {'ok': ok, 'model_version': 'v1'}
+
+    def passing(self):
+        return self.result['ok']
+
+
+def hosted(name, loaded=True, fallback_expected=None):
+    route = f'/api/{name}-prediction'
+    return HostedModel(name, f'{name} is running', route, route + '/stream', None, None,
+                       score_one=None, score_risk=None, score_stream_chunk=None, wait_for_model=None,
+                       reloader=Reloader(loaded), canary=Canary(True), breaker=None, batcher=None,
+                       metrics=None, startup=None, log=None, fallback_expected=fallback_expected)
+
+
+def test_loaded_model_is_ready():
+    ready, body = hosted('parkinson').readiness()
+    assert ready and body['status'] == 'ready'
+    assert 'fallback_expected' not in body
+
+
+def test_fallback_blocks_unless_expected():
+    ready, body = hosted('alzheimer', loaded=False).readiness()
+    assert not ready and body['status'] == 'fallback'
+
+    # A model file exists but didn't load: still not ready
+    ready, body = hosted('alzheimer', loaded=False, fallback_expected=lambda: False).readiness()
+    assert not ready
+
+    # No model file deployed: the fallback is what this deployment serves
+    ready, body = hosted('alzheimer', loaded=False, fallback_expected=lambda: True).readiness()
+    assert ready and body['ready']
+    assert body['status'] == 'fallback' and body['fallback_expected']
+
+
+def test_fallback_expected_is_ignored_for_a_loaded_model():
+    ready, body = hosted('alzheimer', fallback_expected=lambda: True).readiness()
+    assert ready and body['status'] == 'ready' and 'fallback_expected' not in body
+
+
+def test_registry_get():
+    registry = ModelRegistry()
+    parkinson = registry.register(hosted('parkinson'))
+    assert registry.get('parkinson') is parkinson
+    assert registry.get('alzheimer') is None
+
+
+@pytest.fixture
+def serve_models():
+    servers = []
+
+    def start(*models):
+        registry = ModelRegistry()
+        for model in models:
+            registry.register(model)
+        handler = type('Handler', (PredictionHandler,), {'registry': registry, 'log_message': lambda *args: None})
+        server = ThreadPoolTCPServer(('127.0.0.1', 0), handler, threads=2)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_ready_route(serve_models):
+    port = serve_models(hosted('parkinson'), hosted('alzheimer', loaded=False))
+
+    status, body = get(port, '/api/ready')
+    assert status == 503 and body['not_ready'] == ['alzheimer']
+
+    status, body = get(port, '/api/ready?model=parkinson')
+    assert status == 200 and body['status'] == 'ready'
+    assert body['queue_depth'] == {'connections': 0, 'batcher': 0}
+
+    status, body = get(port, '/api/ready?model=alzheimer')
+    assert status == 503 and body['status'] == 'fallback'
+
+    status, body = get(port, '/api/ready?model=nope')
+    assert status == 404 and body['models'] == ['parkinson', 'alzheimer']
+
+
+def test_expected_fallback_does_not_block_the_combined_check(serve_models):
+    port = serve_models(hosted('parkinson'), hosted('alzheimer', loaded=False, fallback_expected=lambda: True))
+
+    status, body = get(port, '/api/ready')
+    assert status == 200 and body['ready'] and body['not_ready'] == []
+    assert body['models']['alzheimer']['status'] == 'fallback'
@@ -0,0 +1,280 @@
+# Feature extraction with the services' schemas (serving/schema.py):
+# nested, flat, partial, string and out-of-range records in each
+# FEATURE_RANGE_CHECK mode
+import math
+
+import numpy as np
+import pytest
+
+from serving import alzheimer, parkinson
+from serving.limits import RequestRejected
+from serving.schema import RECORD, FeatureSchema
+
+NESTED = {
+    'datScan': {'caudateR': 3.8, 'caudateL': 3.7, 'putamenR': 2.9, 'putamenL': 2.8},
+    'updrs': {'npdtot': 12},
+    'smellTest': {'upsitPercentage': 85.5},
+    'cognitive': {'cogchq': 4},
+}
+NESTED_FEATURES = [3.8, 3.7, 2.9, 2.8, 12.0, 85.5, 4.0]
+
+FLAT = {'fo': 120.5, 'fhi': 150, 'flo': 100.25, 'jitter': 0.005, 'shimmer': 0.03, 'nhr': 0.02, 'hnr': 21}
+FLAT_FEATURES = [120.5, 150.0, 100.25, 0.005, 0.03, 0.02, 21.0]
+
+ALZHEIMER = {
+    'hippocampus_volume': 3.9, 'cortical_thickness': 2.8, 'ventricle_volume': 22,
+    'white_matter_hyperintensities': 1.5, 'brain_glucose_metabolism': 5.5,
+    'amyloid_deposition': 1.1, 'tau_protein_level': 1.3,
+}
+ALZHEIMER_FEATURES = [3.9, 2.8, 22.0, 1.5, 5.5, 1.1, 1.3]
+
+
+def parkinson_schema(mode):
+    return FeatureSchema('parkinson', parkinson.SCHEMA.formats, mode=mode)
+
+
+def alzheimer_schema(mode):
+    return FeatureSchema('alzheimer', alzheimer.SCHEMA.formats, mode=mode)
+
+
+def with_value(record, path, value):
+    # A copy of `record` with section.name (or name) set to value
+    record = {key: dict(part) if isinstance(part, dict) else part for key, part in record.items()}
+    if '.' in path:
+        section, name = path.split('.')
+        record[section][name] = value
+    else:
+        record[path] = value
+    return record
+
+
+def without(record, path):
+    record = with_value(record, path, None)
+    if '.' in path:
+        section, name = path.split('.')
+        del record[section][name]
+    else:
+        del record[path]
+    return record
+
+
+@pytest.mark.parametrize('mode', ['warn', 'reject', 'off'])
+def test_valid_records(mode):
+    assert parkinson_schema(mode).extract(NESTED) == (NESTED_FEATURES, None, None)
+    assert alzheimer_schema(mode).extract(ALZHEIMER) == (ALZHEIMER_FEATURES, None, None)
+
+
+def test_flat_parkinson_record():
+    # The flat format has no documented ranges, so every mode scores it
+    for mode in ('warn', 'reject', 'off'):
+        assert parkinson_schema(mode).extract(FLAT) == (FLAT_FEATURES, None, None)
+    # Missing flat fields default to 0
+    assert parkinson_schema('warn').extract({'fo': 1})[0] == [1.0, 0, 0, 0, 0, 0, 0]
+
+
+@pytest.mark.parametrize('mode', ['warn', 'reject', 'off'])
+def test_record_matching_no_format_is_rejected(mode):
+    # Not scored as seven default zeros
+    schema = parkinson_schema(mode)
+    misspelled = {'datscan': NESTED['datScan'], 'UPDRS': NESTED['updrs']}
+    for record in ({}, misspelled, {'patient': 'x'}):
+        features, errors, warnings = schema.extract(record)
+        assert features is None and warnings is None
+        assert list(errors) == [RECORD] and 'datScan' in errors[RECORD] and 'fo' in errors[RECORD]
+    # With one format, the missing fields are listed instead
+    assert alzheimer_schema(mode).extract({})[1] == {field: 'required' for field in ALZHEIMER}
+
+
+def test_numeric_strings_are_accepted():
+    record = with_value(with_value(NESTED, 'datScan.caudateR', '3.8'), 'updrs.npdtot', ' 12 ')
+    assert parkinson_schema('reject').extract(record) == (NESTED_FEATURES, None, None)
+    record = with_value(ALZHEIMER, 'tau_protein_level', '1.3')
+    assert alzheimer_schema('reject').extract(record) == (ALZHEIMER_FEATURES, None, None)
+
+
+def test_booleans_and_ints_are_numbers():
+    features, errors, _ = parkinson_schema('off').extract(with_value(NESTED, 'cognitive.cogchq', True))
+    assert errors is None and features[6] == 1.0
+
+
+@pytest.mark.parametrize('mode', ['warn', 'reject', 'off'])
+def test_partial_nested_record_reports_every_missing_field(mode):
+    # Not retried as a flat record full of zeros
+    record = without(without(NESTED, 'updrs.npdtot'), 'datScan.putamenL')
+    del record['cognitive']
+    features, errors, warnings = parkinson_schema(mode).extract(record)
+    assert features is None and warnings is None
+    assert errors == {'datScan.putamenL': 'required', 'updrs.npdtot': 'required', 'cognitive.cogchq': 'required'}
+
+
+@pytest.mark.parametrize('mode', ['warn', 'reject', 'off'])
+def test_bad_values_are_reported_per_field(mode):
+    record = with_value(with_value(NESTED, 'datScan.caudateR', 'high'), 'updrs.npdtot', [12])
+    record['smellTest'] = 85
+    features, errors, _ = parkinson_schema(mode).extract(record)
+    assert features is None
+    assert errors == {
+        'datScan.caudateR': 'must be a number',
+        'updrs.npdtot': 'must be a number',
+        'smellTest.upsitPercentage': 'smellTest must be an object',
+    }
+
+    record = with_value(without(ALZHEIMER, 'cortical_thickness'), 'amyloid_deposition', None)
+    features, errors, _ = alzheimer_schema(mode).extract(record)
+    assert features is None
+    assert errors == {'cortical_thickness': 'required', 'amyloid_deposition': 'must be a number'}
+
+
+@pytest.mark.parametrize('mode', ['warn', 'reject', 'off'])
+def test_non_object_records(mode):
+    for record in ([], 'text', 7, None):
+        assert parkinson_schema(mode).extract(record) == (None, {RECORD: 'must be a JSON object'}, None)
+
+
+OUT_OF_RANGE = [
+    (parkinson_schema, NESTED, 'datScan.caudateR', 5.5, 0),
+    (parkinson_schema, NESTED, 'updrs.npdtot', -1, 4),
+    (parkinson_schema, NESTED, 'smellTest.upsitPercentage', '101', 5),
+    (alzheimer_schema, ALZHEIMER, 'hippocampus_volume', 1.0, 0),
+    (alzheimer_schema, ALZHEIMER, 'tau_protein_level', 2.01, 6),
+]
+
+
+@pytest.mark.parametrize('make_schema, record, path, value, column', OUT_OF_RANGE)
+def test_out_of_range_value(make_schema, record, path, value, column):
+    record = with_value(record, path, value)
+
+    features, errors, warnings = make_schema('warn').extract(record)
+    assert errors is None and features[column] == float(value)
+    assert list(warnings) == [path] and warnings[path].startswith('outside the documented range')
+
+    features, errors, warnings = make_schema('reject').extract(record)
+    assert features is None and warnings is None
+    assert list(errors) == [path]
+
+    features, errors, warnings = make_schema('off').extract(record)
+    assert errors is None and warnings is None and features[column] == float(value)
+
+
+@pytest.mark.parametrize('mode', ['warn', 'reject', 'off'])
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', '1e999', math.nan, math.inf])
+def test_non_finite_values_are_errors_in_every_mode(mode, value):
+    record = with_value(ALZHEIMER, 'ventricle_volume', value)
+    assert alzheimer_schema(mode).extract(record) == (None, {'ventricle_volume': 'must be finite'}, None)
+    # Flat Parkinson fields have no documented range, and are still checked
+    record = with_value(FLAT, 'jitter', value)
+    assert parkinson_schema(mode).extract(record) == (None, {'jitter': 'must be finite'}, None)
+
+
+def test_non_finite_and_out_of_range_together():
+    record = with_value(with_value(ALZHEIMER, 'ventricle_volume', math.nan), 'tau_protein_level', 9)
+    assert alzheimer_schema('warn').extract(record) == (None, {'ventricle_volume': 'must be finite'}, None)
+    errors = alzheimer_schema('reject').extract(record)[1]
+    assert list(errors) == ['ventricle_volume', 'tau_protein_level']
+
+
+def test_range_boundaries_are_in_range():
+    record = dict(ALZHEIMER, hippocampus_volume=2.5, cortical_thickness=3.5, tau_protein_level=0.8)
+    assert alzheimer_schema('reject').extract(record)[1] is None
+
+
+def test_mode_from_environment(monkeypatch):
+    record = with_value(NESTED, 'datScan.caudateR', 9)
+    for mode, rejected in (('reject', True), ('off', False), ('warn', False), ('bogus', False)):
+        monkeypatch.setenv('FEATURE_RANGE_CHECK', mode)
+        schema = FeatureSchema('parkinson', parkinson.SCHEMA.formats)
+        assert schema.mode == (mode if mode != 'bogus' else 'warn')
+        assert (schema.extract(record)[0] is None) == rejected
+    monkeypatch.delenv('FEATURE_RANGE_CHECK')
+    assert FeatureSchema('parkinson', parkinson.SCHEMA.formats).mode == 'warn'
+
+
+def batch_records():
+    return [
+        NESTED,                                               # 0 fine
+        FLAT,                                                 # 1 fine, flat
+        with_value(NESTED, 'datScan.putamenR', -0.5),         # 2 out of range
+        without(NESTED, 'cognitive.cogchq'),                  # 3 partial
+        'not a record',                                       # 4
+        with_value(NESTED, 'smellTest.upsitPercentage', 'x'), # 5 not a number
+        with_value(NESTED, 'updrs.npdtot', '200'),            # 6 out of range, string
+        with_value(NESTED, 'cognitive.cogchq', math.nan),     # 7 NaN
+        {'datscan': NESTED['datScan']},                       # 8 no format
+    ]
+
+
+def test_batch_warn():
+    matrix, row_index, errors, warnings = parkinson_schema('warn').extract_batch(batch_records())
+    assert row_index == [0, 1, 2, 6]
+    np.testing.assert_array_equal(matrix[0], NESTED_FEATURES)
+    np.testing.assert_array_equal(matrix[1], FLAT_FEATURES)
+    assert matrix[2, 2] == -0.5 and matrix[3, 4] == 200.0
+    assert errors == {
+        3: {'cognitive.cogchq': 'required'},
+        4: {RECORD: 'must be a JSON object'},
+        5: {'smellTest.upsitPercentage': 'must be a number'},
+        7: {'cognitive.cogchq': 'must be finite'},
+        8: {RECORD: parkinson.SCHEMA.no_format},
+    }
+    assert list(warnings) == [2, 6]
+    assert list(warnings[2]) == ['datScan.putamenR'] and list(warnings[6]) == ['updrs.npdtot']
+
+
+def test_batch_reject():
+    matrix, row_index, errors, warnings = parkinson_schema('reject').extract_batch(batch_records())
+    assert row_index == [0, 1]
+    assert matrix.shape == (2, 7)
+    assert sorted(errors) == [2, 3, 4, 5, 6, 7, 8]
+    assert list(errors[2]) == ['datScan.putamenR'] and list(errors[6]) == ['updrs.npdtot']
+    assert warnings == {}
+
+
+def test_batch_off():
+    matrix, row_index, errors, warnings = parkinson_schema('off').extract_batch(batch_records())
+    assert row_index == [0, 1, 2, 6]
+    assert sorted(errors) == [3, 4, 5, 7, 8]
+    assert warnings == {}
+
+
+def test_batch_matches_single_records():
+    records = batch_records()
+    for mode in ('warn', 'reject', 'off'):
+        schema = parkinson_schema(mode)
+        matrix, row_index, errors, warnings = schema.extract_batch(records)
+        for i, record in enumerate(records):
+            features, record_errors, record_warnings = schema.extract(record)
+            if i in row_index:
+                np.testing.assert_array_equal(matrix[row_index.index(i)], features)
+            else:
+                assert errors[i] == record_errors
+            assert warnings.get(i) == record_warnings
+
+
+def test_empty_batch():
+    matrix, row_index, errors, warnings = alzheimer_schema('reject').extract_batch([])
+    assert matrix.shape == (0, 7) and row_index == [] and errors == {} and warnings == {}
+
+
+def test_require_in_range():
+    matrix = np.array([ALZHEIMER_FEATURES, ALZHEIMER_FEATURES])
+    alzheimer_schema('reject').require_in_range(matrix)
+
+    # Out of range: only refused in reject mode
+    matrix[1, 2] = 50
+    alzheimer_schema('warn').require_in_range(matrix)
+    alzheimer_schema('off').require_in_range(matrix)
+    with pytest.raises(RequestRejected) as raised:
+        alzheimer_schema('reject').require_in_range(matrix)
+    assert raised.value.status == 400
+    assert raised.value.outcome == 'out_of_range'
+    assert 'first row 1' in str(raised.value) and 'ventricle_volume: outside' in str(raised.value)
+
+    # Non-finite: refused in every mode
+    matrix[0, 3] = math.inf
+    for mode in ('warn', 'reject', 'off'):
+        with pytest.raises(RequestRejected) as raised:
+            alzheimer_schema(mode).require_in_range(matrix)
+        assert raised.value.outcome == 'non_finite'
+        assert 'first row 0' in str(raised.value) and 'white_matter_hyperintensities: must be finite' in str(raised.value)
+
+    alzheimer_schema('reject').require_in_range(np.empty((0, 7)))
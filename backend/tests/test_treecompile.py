@@ -0,0 +1,119 @@
+# The compiled tree evaluator (serving/treecompile.py) against xgboost itself
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pytest
+
+xgboost = pytest.importorskip('xgboost')
+
+from serving.treecompile import (CompiledTreeModel, compile_model, export_model, file_sha256,
+                                 load_compiled_model)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARKINSON_MODEL = os.path.join(BACKEND_DIR, 'parkinson_service', 'model', 'Parkinson_Model.pkl')
+
+# Same bound the export checks before writing a compiled model
+TOLERANCE = 1e-4
+
+
+def training_data(rows=400, features=7, seed=0):
+    # Some NaNs in training, so the trees learn default directions for missing
+    # values that differ from the plain x < threshold branch
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 2, size=(rows, features)).astype(np.float32)
+    y = X[:, 0] * 2 - X[:, 1] + np.sin(X[:, 2]) + rng.normal(0, 0.1, rows)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    return X, y
+
+
+def inputs(features=7, rows=300, seed=1):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 3, size=(rows, features)).astype(np.float32)
+    X[::5, 0] = np.nan
+    X[1::5, 3] = np.nan
+    X[2] = np.nan
+    return X
+
+
+def test_regressor_matches_xgboost_with_missing_values():
+    X, y = training_data()
+    model = xgboost.XGBRegressor(n_estimators=40, max_depth=4).fit(X, y)
+    arrays, max_error = compile_model(model)
+    compiled = CompiledTreeModel(arrays)
+
+    X_test = inputs()
+    np.testing.assert_allclose(compiled.predict(X_test), model.predict(X_test), rtol=0, atol=TOLERANCE)
+    assert max_error <= TOLERANCE
+
+
+def test_logistic_classifier_matches_xgboost():
+    X, y = training_data(seed=2)
+    model = xgboost.XGBClassifier(n_estimators=30, max_depth=3).fit(X, (y > 0).astype(int))
+    compiled = CompiledTreeModel(compile_model(model)[0])
+
+    # predict() of a binary:logistic model is the positive class probability
+    X_test = inputs(seed=3)
+    np.testing.assert_allclose(compiled.predict(X_test), model.predict_proba(X_test)[:, 1],
+                               rtol=0, atol=TOLERANCE)
+
+
+def test_single_row_matches_batch():
+    X, y = training_data(seed=4)
+    model = xgboost.XGBRegressor(n_estimators=20, max_depth=3).fit(X, y)
+    compiled = CompiledTreeModel(compile_model(model)[0])
+    X_test = inputs(seed=5, rows=20)
+    batch = compiled.predict(X_test)
+    for row, expected in zip(X_test, batch):
+        assert compiled.predict(row[None, :])[0] == expected
+
+
+def test_rejects_wrong_shape():
+    X, y = training_data()
+    compiled = CompiledTreeModel(compile_model(xgboost.XGBRegressor(n_estimators=5).fit(X, y))[0])
+    with pytest.raises(ValueError):
+        compiled.predict(np.zeros((3, 6)))
+
+
+def test_export_round_trip_and_stale_check(tmp_path):
+    X, y = training_data()
+    model_path = str(tmp_path / 'model.pkl')
+    with open(model_path, 'wb') as f:
+        pickle.dump(xgboost.XGBRegressor(n_estimators=10, max_depth=3).fit(X, y), f)
+
+    out_path = export_model(model_path)
+    compiled = load_compiled_model(model_path)
+    assert compiled is not None
+    assert compiled.source_sha256 == file_sha256(model_path)
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    expected = model.predict(inputs())
+    np.testing.assert_allclose(compiled.predict(inputs()), expected, rtol=0, atol=TOLERANCE)
+
+    # Overwriting the file in place (truncated, then rewritten, as cp does)
+    # doesn't touch the loaded model; a memory map would SIGBUS here
+    with open(out_path, 'r+b') as f:
+        f.truncate(0)
+    np.testing.assert_allclose(compiled.predict(inputs()), expected, rtol=0, atol=TOLERANCE)
+    export_model(model_path)
+
+    # A retrained pickle makes the compiled file stale
+    with open(model_path, 'wb') as f:
+        pickle.dump(xgboost.XGBRegressor(n_estimators=11, max_depth=3).fit(X, y), f)
+    assert os.path.exists(out_path)
+    assert load_compiled_model(model_path) is None
+
+
+@pytest.mark.skipif(not os.path.exists(PARKINSON_MODEL), reason='Parkinson model not present')
+def test_committed_parkinson_model():
+    # The shipped Parkinson_Model.npz was compiled from the shipped pickle
+    compiled = load_compiled_model(PARKINSON_MODEL)
+    assert compiled is not None
+    with warnings.catch_warnings():
+        # Pickles from an older xgboost warn when loaded
+        warnings.simplefilter('ignore')
+        with open(PARKINSON_MODEL, 'rb') as f:
+            model = pickle.load(f)
+    X_test = inputs(features=compiled.n_features_in_)
+    np.testing.assert_allclose(compiled.predict(X_test), model.predict(X_test), rtol=0, atol=TOLERANCE)
@@ -4,10 +4,11 @@ import Constants from 'expo-constants';
 
 // API endpoint for the Alzheimer's model
 // In development, use 10.0.2.2 (Android emulator's localhost)
-// In production, use the Render deployed backend URL
+// In production, use the Render deployed backend URL (one server hosts the
+// Parkinson's and Alzheimer's models)
 const API_URL = __DEV__ 
-  ? 'http://10.0.2.2:5000/api/alzheimer-prediction'
-  : 'https://alzheimers-prediction-apii.onrender.com/api/alzheimer-prediction';
+  ? 'http://10.0.2.2:5001/api/alzheimer-prediction'
+  : 'https://parkinsons-prediction-apii.onrender.com/api/alzheimer-prediction';
 
 const AlzheimerModelService = {
 